@@ -38,21 +38,30 @@ else:
     print(f"Superuser '{username}' already exists.")
 EOF
 
-    python manage.py rqworker high default low &
-    python manage.py rqworker high default low &
-    python manage.py rqworker high default low &
-    python manage.py rqworker high default low &
-    python manage.py rqworker high default low &
-
-# Gunicorn configuration for large video uploads:
-# --timeout 600: Allow up to 10 minutes for large file uploads
+    # A pool of RQ_WARM_WORKERS pre-imported workers; short jobs run in-process (RQ_JOB_ISOLATION),
+    # and the pool also runs the RQ scheduler for delayed jobs (the periodic opening warm-up)
+    python manage.py rqworker_warm high default low &
+
+# Pre-encode the openings of popular titles, repeating every WARMUP_INTERVAL_SECONDS
+python manage.py warm_openings --schedule
+# Merge the viewing counters aggregated in Redis into the database every VIEWING_STATS_FLUSH_SECONDS
+python manage.py flush_viewing_stats --schedule
+
+# Continuous encodes run in their own daemon so long films never block the RQ workers
+python manage.py transcode_daemon &
+
+# Keep media/transcode/ under TRANSCODE_CACHE_MAX_BYTES
+python manage.py cleanup_transcodes --daemon &
+
+# Gunicorn configuration:
+# --timeout 120: Video files arrive in resumable chunks (api/uploads/), so no request runs for minutes
 # --workers 4: Multiple workers so uploads don't block other requests
-# --graceful-timeout 300: Allow 5 minutes for graceful worker shutdown
+# --graceful-timeout 120: Allow 2 minutes for graceful worker shutdown
 # --keep-alive 5: Keep connections alive for 5 seconds
 exec gunicorn core.wsgi:application \
     --bind 0.0.0.0:8000 \
     --reload \
-    --timeout 600 \
-    --graceful-timeout 300 \
+    --timeout 120 \
+    --graceful-timeout 120 \
     --workers 4 \
     --keep-alive 5
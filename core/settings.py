@@ -123,7 +123,10 @@ DATABASES = {
         "USER": os.environ.get("DB_USER", default="videoflix_user"),
         "PASSWORD": os.environ.get("DB_PASSWORD", default="supersecretpassword"),
         "HOST": os.environ.get("DB_HOST", default="db"),
-        "PORT": os.environ.get("DB_PORT", default=5432)
+        "PORT": os.environ.get("DB_PORT", default=5432),
+        # Keep connections between requests and in-process RQ jobs (see RQ_JOB_ISOLATION)
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", default=60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -162,6 +165,142 @@ RQ_QUEUES = {
     },
 }
 
+# Warm RQ worker pool (`manage.py rqworker_warm`): RQ_WARM_WORKERS workers forked from one process that has
+# imported everything jobs need. Jobs of 'inprocess' queues run inside the worker with its persistent
+# connections; 'fork' queues get a fresh work horse per job, which isolates long encodes and crashes.
+RQ_WARM_WORKERS = int(os.environ.get("RQ_WARM_WORKERS", default=5))
+RQ_JOB_ISOLATION = {
+    'high': os.environ.get("RQ_ISOLATION_HIGH", default="inprocess"),
+    'default': os.environ.get("RQ_ISOLATION_DEFAULT", default="inprocess"),
+    'low': os.environ.get("RQ_ISOLATION_LOW", default="fork"),
+}
+
+# Transcoding
+# Rendition ladder used by the on-demand HLS encoders (height and target video bitrate).
+TRANSCODE_LADDER = {
+    '480p': {'height': 480, 'bitrate': '1200k'},
+    '720p': {'height': 720, 'bitrate': '2500k'},
+    '1080p': {'height': 1080, 'bitrate': '5000k'},
+    '2160p': {'height': 2160, 'bitrate': '12000k'},
+}
+
+# HLS segments: source keyframes are grouped into segments of about this many seconds (see
+# video_app.api.segment_plan); playlists generated before a change keep their old plan until regenerated.
+HLS_SEGMENT_TARGET_SECONDS = float(os.environ.get("HLS_SEGMENT_TARGET_SECONDS", default=6))
+# Startup ramp: lengths of the opening segments, comma separated (empty for none), so playback can start
+# after the first second of source is encoded instead of a whole target.
+HLS_STARTUP_RAMP = [float(s) for s in os.environ.get("HLS_STARTUP_RAMP", default="1,2,4").split(",") if s.strip()]
+# x264 preset of single-segment encodes made while a viewer waits (a seek or a missing segment). Continuous
+# encodes and background warm-up keep "medium", so steady-state bitrate efficiency is unchanged.
+TRANSCODE_ON_DEMAND_PRESET = os.environ.get("TRANSCODE_ON_DEMAND_PRESET", default="veryfast")
+# How long a segment request waits for its file to be encoded before answering 503.
+SEGMENT_WAIT_TIMEOUT_SECONDS = float(os.environ.get("SEGMENT_WAIT_TIMEOUT_SECONDS", default=60))
+# Once an output is fully transcoded, pack init.mp4 and its segments into one rendition.mp4 served with
+# EXT-X-BYTERANGE (video_app.api.compact); `manage.py cleanup_transcodes --compact` catches up on older outputs.
+TRANSCODE_COMPACT_RENDITIONS = os.environ.get("TRANSCODE_COMPACT_RENDITIONS", default="true").lower() in ("1", "true", "yes", "on")
+# Served playlists are cached per video and resolution in each web process and in Redis
+# (video_app.api.playlist_cache). Changes are announced over pub/sub; a process re-checks a local copy
+# against the Redis version after PLAYLIST_LOCAL_TTL_SECONDS anyway, in case it missed a message.
+PLAYLIST_LOCAL_TTL_SECONDS = float(os.environ.get("PLAYLIST_LOCAL_TTL_SECONDS", default=30))
+PLAYLIST_CACHE_TIMEOUT = int(os.environ.get("PLAYLIST_CACHE_TIMEOUT", default=60 * 60))
+# Low-Latency HLS (video_app.api.llhls): while a continuous encode runs, its segments are written as CMAF
+# fragments of about LL_HLS_PART_TARGET_SECONDS and the playlist lists them as EXT-X-PART byte ranges.
+LL_HLS_ENABLED = os.environ.get("LL_HLS_ENABLED", default="false").lower() in ("1", "true", "yes", "on")
+LL_HLS_PART_TARGET_SECONDS = float(os.environ.get("LL_HLS_PART_TARGET_SECONDS", default=1.0))
+
+# Transcoder engine per job class (init, segment, continuous, preview, thumbnail), 'default' for the rest.
+# video_app.api.backends.FFmpegCLIBackend - ffmpeg command line, one process per job
+# video_app.api.backends.PyAVBackend      - in-process libav encoding, needs `pip install av`
+# video_app.api.backends.StubBackend      - deterministic fake output for tests
+_TRANSCODER_BACKEND = os.environ.get("TRANSCODER_BACKEND", default="video_app.api.backends.FFmpegCLIBackend")
+TRANSCODER_BACKENDS = {
+    'default': _TRANSCODER_BACKEND,
+    'init': os.environ.get("TRANSCODER_BACKEND_INIT", default=_TRANSCODER_BACKEND),
+    'segment': os.environ.get("TRANSCODER_BACKEND_SEGMENT", default=_TRANSCODER_BACKEND),
+    'continuous': os.environ.get("TRANSCODER_BACKEND_CONTINUOUS", default=_TRANSCODER_BACKEND),
+    'preview': os.environ.get("TRANSCODER_BACKEND_PREVIEW", default=_TRANSCODER_BACKEND),
+    'thumbnail': os.environ.get("TRANSCODER_BACKEND_THUMBNAIL", default=_TRANSCODER_BACKEND),
+}
+
+# How long ffprobe results and keyframe lists are cached; keys include file size, mtime and inode.
+PROBE_CACHE_TIMEOUT = int(os.environ.get("PROBE_CACHE_TIMEOUT", default=30 * 24 * 60 * 60))
+
+# Resumable admin uploads (api/uploads/): chunk size suggested to the browser, largest chunk accepted,
+# and how long unfinished uploads are kept before their .part files are discarded.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+UPLOAD_STALE_SECONDS = int(os.environ.get("UPLOAD_STALE_SECONDS", default=7 * 24 * 60 * 60))
+
+# Sources are stored by content hash (sha256 over fixed-size blocks, hashed while chunks stream in) so
+# re-uploads of the same file reuse its probe data, thumbnails and transcodes. Changing the block size
+# changes every hash: existing videos would no longer be recognised as duplicates.
+CONTENT_HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Early ingest: once this many bytes of a chunked upload are on disk, the partial file is probed and the
+# thumbnail and preview are encoded from the part already received. Byte positions are estimated from the
+# duration assuming a constant bitrate; the safety factor leaves room for bitrate peaks.
+EARLY_INGEST_MIN_BYTES = int(os.environ.get("EARLY_INGEST_MIN_BYTES", default=32 * 1024 * 1024))
+EARLY_INGEST_SAFETY = 0.8
+
+# Post-upload pipeline (video_app.api.pipeline): how often RQ retries a failed stage before the stages
+# depending on it are given up.
+INGEST_STAGE_RETRIES = int(os.environ.get("INGEST_STAGE_RETRIES", default=2))
+
+# Thumbnails: candidate frames (fractions of the duration) scored in one ffmpeg pass; the best one is
+# written as pre-sized variants (widths x formats) that ThumbnailView picks from with ?size=<width>.
+THUMBNAIL_CANDIDATE_POSITIONS = (0.1, 0.2, 0.3, 0.45, 0.6)
+THUMBNAIL_WIDTHS = (160, 320, 640, 1280)
+THUMBNAIL_FORMATS = ('webp', 'jpg')
+THUMBNAIL_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Trick-play (scrubbing) assets built after upload: JPEG sprite sheets indexed by WebVTT and an
+# I-frame-only HLS playlist, both taken from source keyframes spaced at least these many seconds apart.
+TRICKPLAY_SPRITE_INTERVAL = 5
+TRICKPLAY_SPRITE_WIDTH = 160
+TRICKPLAY_SPRITE_COLUMNS = 5
+TRICKPLAY_SPRITE_ROWS = 5
+TRICKPLAY_IFRAME_INTERVAL = 2
+TRICKPLAY_IFRAME_WIDTH = 320
+# Browser cache lifetime (seconds) for trick-play files; they are revalidated by ETag afterwards.
+TRICKPLAY_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Continuous encodes (one ffmpeg per viewer session, running as long as the film) are run by the transcode
+# daemon (`manage.py transcode_daemon`), at most TRANSCODE_DAEMON_MAX_ENCODERS at once per daemon, instead of
+# occupying RQ workers. With TRANSCODE_DAEMON off they are queued as RQ jobs on 'low' as before.
+TRANSCODE_DAEMON = os.environ.get("TRANSCODE_DAEMON", default="true").lower() in ("1", "true", "yes", "on")
+TRANSCODE_DAEMON_MAX_ENCODERS = int(os.environ.get("TRANSCODE_DAEMON_MAX_ENCODERS", default=8))
+
+# Transcode cache
+# Budget for media/transcode/ enforced by `manage.py cleanup_transcodes --daemon`.
+TRANSCODE_CACHE_MAX_BYTES = int(os.environ.get("TRANSCODE_CACHE_MAX_BYTES", default=50 * 1024 ** 3))
+# Recency bonus (seconds) per doubling of an output's request count when picking eviction victims.
+TRANSCODE_CACHE_POPULARITY_SECONDS = int(os.environ.get("TRANSCODE_CACHE_POPULARITY_SECONDS", default=1800))
+# A lockfile of an output is stale, and ignored, once the process that wrote it is gone or it has not been
+# touched for this long (a per-segment encode times out after 5 minutes; a continuous encode's monitor
+# touches its lock on every check). Eviction removes stale locks.
+TRANSCODE_STALE_LOCK_SECONDS = int(os.environ.get("TRANSCODE_STALE_LOCK_SECONDS", default=1800))
+
+# Popularity-driven warm-up (video_app.api.warmup): playlist and segment requests add to a per-day score of
+# each video/resolution in Redis; older days count half every POPULARITY_HALF_LIFE_DAYS. The warm-up job
+# encodes init.mp4 and the first WARMUP_SEGMENTS segments of the WARMUP_RESOLUTIONS_PER_TITLE most requested
+# resolutions of the WARMUP_TITLES most popular titles, and repeats every WARMUP_INTERVAL_SECONDS (0 = off).
+POPULARITY_WINDOW_DAYS = 7
+POPULARITY_HALF_LIFE_DAYS = 2
+WARMUP_TITLES = int(os.environ.get("WARMUP_TITLES", default=20))
+WARMUP_RESOLUTIONS_PER_TITLE = 2
+WARMUP_SEGMENTS = int(os.environ.get("WARMUP_SEGMENTS", default=3))
+WARMUP_INTERVAL_SECONDS = int(os.environ.get("WARMUP_INTERVAL_SECONDS", default=15 * 60))
+
+# Heartbeats (viewer playheads per output, used by the continuous encoders and cache eviction) live in one
+# Redis hash per video/resolution that expires HEARTBEAT_TTL_SECONDS after its last request. Each web worker
+# writes a viewer at most every HEARTBEAT_COALESCE_SECONDS (play starts and seeks immediately).
+HEARTBEAT_TTL_SECONDS = int(os.environ.get("HEARTBEAT_TTL_SECONDS", default=7 * 24 * 60 * 60))
+HEARTBEAT_COALESCE_SECONDS = 10
+
+# Viewing statistics: request counters are aggregated in Redis hashes and merged into ViewingStats rows by a
+# periodic RQ job every VIEWING_STATS_FLUSH_SECONDS (0 = only with `manage.py flush_viewing_stats`).
+VIEWING_STATS_FLUSH_SECONDS = int(os.environ.get("VIEWING_STATS_FLUSH_SECONDS", default=60))
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
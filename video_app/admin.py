@@ -1,19 +1,28 @@
+from django import forms
 from django.contrib import admin, messages
 from django.utils.translation import gettext_lazy as _
+from django.utils.html import format_html_join
 from django.conf import settings
 import django_rq
 import os
 import shutil
 
-from .models import Video, Preview
+from .models import Video, Preview, ChunkedUpload, IngestStage, ViewingStats
 from video_app.api.transcode import transcode_preview
-from video_app.api.workers import video_post_upload_worker
+from video_app.api.pipeline import start_ingest
+from video_app.api.progress import get_video_progress, format_progress
+from video_app.api.uploads import attach_upload, discard_upload
+from video_app.api.dedupe import release_shared_outputs, remove_output_dir, is_source_file_shared
 
 def cleanup_video_media(video):
-	"""Remove all media files associated with a video (original file, HLS transcodes, preview)."""
+	"""Remove all media files associated with a video (original file, HLS transcodes, preview).
+
+	Files shared with re-uploads of the same content are handed over to them instead.
+	"""
 	base_dir = getattr(settings, 'BASE_DIR', os.getcwd())
-	
-	if video.video_file:
+
+	release_shared_outputs(video)
+	if video.video_file and not is_source_file_shared(video):
 		try:
 			if video.video_file.storage.exists(video.video_file.name):
 				video.video_file.delete(save=False)
@@ -37,18 +46,70 @@ def cleanup_preview_media(preview):
 	
 	preview_hls_dir = os.path.join(base_dir, 'media', 'hls_preview', f'preview_{preview.id}')
 	index_dir = os.path.join(base_dir, "media", "index", f"video_{preview.video.id}")
-	if os.path.exists(preview_hls_dir):
-		shutil.rmtree(preview_hls_dir, ignore_errors=True)
-	if os.path.exists(index_dir):
-		shutil.rmtree(index_dir, ignore_errors=True)
+	# Re-uploads of the same content still link to these folders
+	if preview.video.duplicates.exists():
+		return
+	remove_output_dir(preview_hls_dir)
+	remove_output_dir(index_dir)
+
+class VideoAdminForm(forms.ModelForm):
+	"""Video form that accepts a completed resumable upload (filled in by video_upload.js) instead of a file."""
+
+	upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+	# Set by VideoAdmin.get_form: only this admin's own uploads can be attached
+	user = None
+
+	class Meta:
+		model = Video
+		fields = '__all__'
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.fields['video_file'].required = False
+
+	def clean_upload_id(self):
+		upload_id = self.cleaned_data.get('upload_id')
+		if upload_id is None:
+			return None
+		upload = ChunkedUpload.objects.filter(id=upload_id, user=self.user).first()
+		if upload is None or upload.status != ChunkedUpload.UploadStatus.COMPLETE:
+			raise forms.ValidationError(_('The uploaded file is missing or incomplete. Please upload it again.'))
+		self.upload = upload
+		return upload_id
+
+	def clean(self):
+		cleaned_data = super().clean()
+		if not cleaned_data.get('upload_id') and not cleaned_data.get('video_file') and not self.instance.video_file:
+			self.add_error('video_file', _('This field is required.'))
+		return cleaned_data
+
+
+class IngestStageInline(admin.TabularInline):
+	"""Read-only status, timing and attempts of each post-upload pipeline stage."""
+	model = IngestStage
+	extra = 0
+	can_delete = False
+	fields = ('name', 'status', 'attempts', 'started_at', 'finished_at', 'elapsed', 'message')
+	readonly_fields = fields
+
+	def has_add_permission(self, request, obj=None):
+		return False
+
+	def elapsed(self, obj):
+		return obj.elapsed if obj.elapsed is not None else '-'
+	elapsed.short_description = 'Took'
+
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
-	list_display = ('id', 'title', 'category', 'codec', 'resolution', 'duration', 'is_transcoded', 'has_preview', 'created_at')
-	readonly_fields = ('codec', 'resolution', 'duration', 'is_transcoded')
+	form = VideoAdminForm
+	list_display = ('id', 'title', 'category', 'codec', 'resolution', 'duration', 'is_transcoded', 'has_preview', 'ingest_status', 'created_at')
+	inlines = [IngestStageInline]
+	actions = ['rerun_failed_ingest', 'rerun_ingest']
+	readonly_fields = ('codec', 'resolution', 'duration', 'is_transcoded', 'transcode_progress')
 	fieldsets = (
 		('Video File & IMDb', {
-			'fields': ('video_file', 'imdb_id'),
+			'fields': ('video_file', 'upload_id', 'imdb_id'),
 			'description': 'Upload a video file and optionally provide an IMDb ID to auto-fill metadata. '
 			               'If no IMDb ID is given or the lookup fails, you must fill in the metadata manually below.'
 		}),
@@ -60,7 +121,7 @@ class VideoAdmin(admin.ModelAdmin):
 			'fields': ('thumbnail_url', 'poster_url'),
 		}),
 		('Technical Info (auto-detected from file)', {
-			'fields': ('codec', 'resolution', 'duration', 'is_transcoded'),
+			'fields': ('codec', 'resolution', 'duration', 'is_transcoded', 'transcode_progress'),
 			'classes': ('collapse',),
 		}),
 	)
@@ -80,13 +141,67 @@ class VideoAdmin(admin.ModelAdmin):
 	has_preview.boolean = True
 	has_preview.short_description = 'Preview'
 
+	def ingest_status(self, obj):
+		"""Pipeline summary, e.g. '5/7 done, 1 failed'."""
+		counts = {}
+		for stage in obj.ingest_stages.all():
+			counts[stage.status] = counts.get(stage.status, 0) + 1
+		if not counts:
+			return '-'
+		done = counts.get(IngestStage.StageStatus.SUCCEEDED, 0) + counts.get(IngestStage.StageStatus.SKIPPED, 0)
+		summary = f"{done}/{sum(counts.values())} done"
+		for status in (IngestStage.StageStatus.RUNNING, IngestStage.StageStatus.FAILED):
+			if counts.get(status):
+				summary += f", {counts[status]} {status}"
+		return summary
+	ingest_status.short_description = 'Ingest'
+
+	def get_queryset(self, request):
+		return super().get_queryset(request).prefetch_related('ingest_stages')
+
+	def get_form(self, request, obj=None, **kwargs):
+		form = super().get_form(request, obj, **kwargs)
+		form.user = request.user
+		return form
+
+	@admin.action(description='Re-run failed ingest stages')
+	def rerun_failed_ingest(self, request, queryset):
+		"""Restart failed stages (and what depends on them) of the selected videos."""
+		count = 0
+		for video in queryset:
+			failed = list(video.ingest_stages.filter(status=IngestStage.StageStatus.FAILED).values_list('name', flat=True))
+			if failed:
+				start_ingest(video.id, stages=failed)
+				count += 1
+		self.message_user(request, _('Failed stages restarted for %d videos.') % count, level=messages.INFO)
+
+	@admin.action(description='Re-run full ingest')
+	def rerun_ingest(self, request, queryset):
+		"""Run the whole post-upload pipeline again for the selected videos."""
+		for video in queryset:
+			start_ingest(video.id)
+		self.message_user(request, _('Ingest restarted for %d videos.') % queryset.count(), level=messages.INFO)
+
+	def transcode_progress(self, obj):
+		"""Live ffmpeg progress (speed, fps, bitrate, position) per output of this video."""
+		if not obj.pk:
+			return '-'
+		progress = get_video_progress(obj.pk)
+		if not progress:
+			return '-'
+		return format_html_join('', '<div><strong>{} ({})</strong>: {}</div>', (
+			(output, job, format_progress(data)) for output, jobs in progress.items() for job, data in jobs.items()
+		))
+	transcode_progress.short_description = 'Encoder progress'
+
 	def save_model(self, request, obj, form, change):
 		"""Save the video and enqueue background processing to prevent timeout."""
+		if getattr(form, 'upload', None) is not None:
+			attach_upload(obj, form.upload)
 		super().save_model(request, obj, form, change)
 
 		try:
-			q = django_rq.get_queue('default')
-			q.enqueue(video_post_upload_worker, obj.id)
+			start_ingest(obj.id)
 			if obj.imdb_id:
 				self.message_user(
 					request,
@@ -195,4 +310,47 @@ class PreviewAdmin(admin.ModelAdmin):
 		"""Delete multiple previews and all associated media files from disk."""
 		for preview in queryset:
 			cleanup_preview_media(preview)
-		super().delete_queryset(request, queryset)
\ No newline at end of file
+		super().delete_queryset(request, queryset)
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+	"""Admin for resumable uploads - mostly to inspect or discard abandoned ones."""
+	list_display = ('id', 'filename', 'user', 'offset', 'total_size', 'status', 'updated_at')
+	list_filter = ('status',)
+	readonly_fields = ('id', 'user', 'filename', 'total_size', 'offset', 'status', 'created_at', 'updated_at')
+
+	def has_add_permission(self, request):
+		return False
+
+	def delete_model(self, request, obj):
+		"""Delete the upload together with its .part file."""
+		discard_upload(obj)
+
+	def delete_queryset(self, request, queryset):
+		"""Delete multiple uploads together with their .part files."""
+		for upload in queryset:
+			discard_upload(upload)
+
+
+@admin.register(ViewingStats)
+class ViewingStatsAdmin(admin.ModelAdmin):
+	"""Read-only viewing counters, flushed from Redis by the viewing stats job."""
+	list_display = ('video', 'views', 'segments', 'resolution_mix', 'last_viewed_at')
+	ordering = ('-views',)
+	search_fields = ('video__title',)
+	readonly_fields = ('video', 'views', 'segments', 'resolution_views', 'resolution_segments', 'segment_histogram', 'last_viewed_at', 'updated_at')
+
+	def has_add_permission(self, request):
+		return False
+
+	def resolution_mix(self, obj):
+		"""Share of watched segments per resolution, e.g. '1080p 70%, 720p 30%'."""
+		total = sum(obj.resolution_segments.values())
+		if not total:
+			return '-'
+		return ', '.join(
+			f"{resolution} {count / total:.0%}"
+			for resolution, count in sorted(obj.resolution_segments.items(), key=lambda item: -item[1])
+		)
+	resolution_mix.short_description = 'Resolutions'
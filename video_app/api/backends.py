@@ -0,0 +1,634 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from fractions import Fraction
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from video_app.api.progress import run_ffmpeg, popen_ffmpeg, publish_progress
+
+# Job classes a backend can be configured for in settings.TRANSCODER_BACKENDS.
+JOB_CLASSES = ('init', 'segment', 'continuous', 'preview', 'thumbnail')
+
+
+class TranscodeError(Exception):
+	"""Raised by a backend when an encode fails. The message is shown to callers/admins."""
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(job_class):
+	"""Return the (shared) backend instance configured for a job class.
+
+	settings.TRANSCODER_BACKENDS maps job classes to dotted backend paths; missing classes
+	fall back to its 'default' entry.
+	"""
+	backends = getattr(settings, 'TRANSCODER_BACKENDS', {})
+	path = backends.get(job_class) or backends.get('default') or 'video_app.api.backends.FFmpegCLIBackend'
+	with _instances_lock:
+		if path not in _instances:
+			_instances[path] = import_string(path)()
+		return _instances[path]
+
+
+def _scale_height(scale_param):
+	"""Target height of an ffmpeg 'scale=-2:<h>' filter."""
+	try:
+		return int(scale_param.split(':')[-1])
+	except (AttributeError, ValueError):
+		return None
+
+
+def _bitrate_to_int(bitrate):
+	value = str(bitrate).lower().strip()
+	if value.endswith('k'):
+		return int(float(value[:-1]) * 1000)
+	if value.endswith('m'):
+		return int(float(value[:-1]) * 1000000)
+	return int(value)
+
+
+def _filter_path(path):
+	"""Escape a file path for use as a filter option value."""
+	return path.replace('\\', '/').replace(':', '\\:')
+
+
+def parse_frame_metadata(path):
+	"""Read a `metadata=mode=print:file=...` dump of one frame into {key: float or str}."""
+	stats = {}
+	try:
+		with open(path, 'r') as f:
+			for line in f:
+				key, sep, value = line.strip().partition('=')
+				if not sep:
+					continue
+				try:
+					stats[key] = float(value)
+				except ValueError:
+					stats[key] = value
+	except OSError:
+		pass
+	return stats
+
+
+class TranscoderBackend:
+	"""Interface every transcoder engine implements.
+
+	`params` is a dict with the rendition settings from get_rendition_params():
+	'scale' (ffmpeg scale filter, e.g. 'scale=-2:720'), 'codec', 'bitrate' ('2500k') and
+	'audio' ('aac' or 'copy'). Methods raise TranscodeError on failure.
+	"""
+
+	def encode_init(self, input_path, output_path, params, video_id=None, resolution=None, timeout=None):
+		"""Write the fMP4 initialization segment (ftyp/moov, no samples) for a rendition.
+
+		`timeout` (seconds) bounds the encode where the engine can stop it.
+		"""
+		raise NotImplementedError
+
+	def encode_segment(self, input_path, output_path, params, start_time, end_time, keyframe_interval, video_id=None, resolution=None, timeout=None):
+		"""Encode [start_time, end_time) of the source into one fragmented MP4 segment, bounded like encode_init."""
+		raise NotImplementedError
+
+	def start_continuous(self, input_path, output_dir, params, start_time, segment_duration, video_id=None, resolution=None, worker_id=None, keyframe_times=None, start_number=0, part_duration=None):
+		"""Start encoding from start_time to the end as HLS fMP4 segments in output_dir.
+
+		Segments are numbered from start_number. With keyframe_times (seconds after start_time) a
+		segment starts at each of them and nowhere else; otherwise every segment_duration seconds.
+		With part_duration (and keyframe_times) each segment file is written progressively as CMAF
+		fragments of about that length, for LL-HLS parts; init.mp4 is then left to encode_init.
+		Returns a process-like handle with pid, poll(), kill() and returncode.
+		"""
+		raise NotImplementedError
+
+	def encode_preview(self, input_path, output_dir, start_offset, duration, video_id=None, preview_id=None):
+		"""Encode the 480p preview as a VOD HLS playlist (index.m3u8 + preview_NNN.mp4) in output_dir."""
+		raise NotImplementedError
+
+	def extract_thumbnail(self, input_path, output_path, timestamp, video_id=None):
+		"""Write one still frame at `timestamp` seconds."""
+		raise NotImplementedError
+
+	def extract_thumbnail_candidates(self, input_path, output_dir, timestamps, video_id=None):
+		"""Write one full resolution JPEG per timestamp (candidate_NN.jpg) in a single pass.
+
+		Returns a list of dicts with 'path', 'timestamp' and the frame statistics used to pick
+		the best one: 'entropy' (normalized luma entropy, 0-1), 'yavg' (mean luma) and 'bitdepth'.
+		"""
+		raise NotImplementedError
+
+	def write_thumbnail_variants(self, image_path, output_dir, widths, formats, video_id=None):
+		"""Write thumbnail_<width>.<format> downscaled copies of a still image. Returns their paths."""
+		raise NotImplementedError
+
+
+class FFmpegCLIBackend(TranscoderBackend):
+	"""Runs the ffmpeg command line tool, one process per job."""
+
+	def _run(self, cmd, video_id, output, timeout, **extra):
+		result = run_ffmpeg(cmd, video_id, output, timeout=timeout, **extra)
+		if result.returncode != 0:
+			raise TranscodeError(f"FFmpeg error: {result.stderr}")
+		return result
+
+	def encode_init(self, input_path, output_path, params, video_id=None, resolution=None, timeout=None):
+		cmd = [
+			"ffmpeg", "-y",
+			"-i", input_path,
+			"-vf", params['scale'],
+			"-c:v", params['codec'],
+			"-preset", "fast",
+			"-b:v", params['bitrate'],
+			"-c:a", params['audio'],
+			"-ar", "48000",
+			"-t", "0",  # Short duration to create the init segment
+			"-f", "mp4",
+			"-fflags", "+genpts",
+			"-movflags", "+faststart+frag_keyframe+empty_moov+default_base_moof",
+			output_path  # init.mp4
+		]
+		self._run(cmd, video_id, resolution, timeout=timeout or 300, segment=os.path.basename(output_path))
+
+	def encode_segment(self, input_path, output_path, params, start_time, end_time, keyframe_interval, video_id=None, resolution=None, timeout=None):
+		cmd = [
+			"ffmpeg", "-y",
+			"-ss", str(start_time),
+			"-to", str(end_time),
+			"-i", input_path,
+			"-vf", params['scale'],
+			"-c:v", params['codec'],
+			"-preset", params.get('preset', 'medium'),
+			"-b:v", params['bitrate'],
+			"-c:a", params['audio'],
+			"-ar", "48000",
+			"-movflags", "+empty_moov+default_base_moof",
+			"-force_key_frames", f"expr:gte(t,n_forced*{keyframe_interval})",
+			"-reset_timestamps", "0",
+			"-fflags", "+genpts",
+			output_path  # segment_000.mp4
+		]
+		self._run(cmd, video_id, resolution, timeout=timeout or 300, segment=os.path.basename(output_path))
+
+	def start_continuous(self, input_path, output_dir, params, start_time, segment_duration, video_id=None, resolution=None, worker_id=None, keyframe_times=None, start_number=0, part_duration=None):
+		if keyframe_times:
+			# Keyframes only at the planned boundaries, and a short hls_time so the muxer cuts at each of them
+			keyframe_args = [
+				"-force_key_frames", ",".join(f"{t:.6f}" for t in keyframe_times),
+				"-g", "100000", "-sc_threshold", "0",
+			]
+			hls_time = "0.1"
+		else:
+			keyframe_args = []
+			hls_time = str(segment_duration)
+		if keyframe_times and part_duration:
+			# The hls muxer only writes a segment once it is complete; the segment muxer streams
+			# each fragment into the segment file as soon as it is encoded
+			output_args = [
+				"-f", "segment",
+				"-segment_times", ",".join(f"{t:.6f}" for t in keyframe_times[1:]),
+				"-segment_start_number", str(start_number),
+				"-segment_format", "mp4",
+				"-segment_format_options",
+				f"movflags=+empty_moov+default_base_moof+frag_keyframe:frag_duration={int(part_duration * 1000000)}",
+				os.path.join(output_dir, "segment_%03d.mp4"),
+			]
+		else:
+			output_args = [
+				"-f", "hls",
+				"-hls_time", hls_time,
+				"-start_number", str(start_number),
+				"-hls_playlist_type", "event",
+				"-hls_segment_type", "fmp4",
+				"-hls_flags", "independent_segments+omit_endlist+temp_file",
+				"-hls_fmp4_init_filename", "init.mp4",
+				"-hls_segment_filename", os.path.join(output_dir, "segment_%03d.mp4"),
+				output_dir,
+			]
+		cmd = [
+			"ffmpeg", "-y",
+			"-ss", str(start_time),
+			"-i", input_path,
+			"-vf", params['scale'],
+			"-c:v", params['codec'],
+			"-preset", "medium",
+			"-b:v", params['bitrate'],
+			*keyframe_args,
+			"-c:a", params['audio'],
+			"-ar", "48000",
+			"-reset_timestamps", "0",
+			*output_args,
+		]
+		# progress is published per video/resolution while it runs
+		return popen_ffmpeg(cmd, video_id, resolution, job_id=worker_id, start_seconds=float(start_time))
+
+	def encode_preview(self, input_path, output_dir, start_offset, duration, video_id=None, preview_id=None):
+		# Build ffmpeg command: options first, then the output playlist path
+		cmd = [
+			"ffmpeg", "-y",
+			"-ss", str(start_offset),
+			"-i", input_path,
+			"-t", str(duration),
+			"-vf", "scale=-2:480",
+			"-c:v", "libx264", "-preset", "medium", "-b:v", "900k",
+			"-an",
+			"-movflags", "+faststart+frag_keyframe+empty_moov+default_base_moof",
+			"-f", "hls",
+			"-hls_time", "5",
+			"-hls_playlist_type", "vod",
+			"-hls_segment_type", "fmp4",
+			"-hls_fmp4_init_filename", "init.mp4",
+			"-hls_segment_filename", os.path.join(output_dir, "preview_%03d.mp4"),
+			os.path.join(output_dir, "index.m3u8"),
+		]
+		result = run_ffmpeg(cmd, video_id, 'preview', timeout=300, preview_id=preview_id)
+		if result.returncode != 0:
+			raise TranscodeError((result.stderr or "ffmpeg failed").strip())
+
+	def extract_thumbnail(self, input_path, output_path, timestamp, video_id=None):
+		cmd = [
+			"ffmpeg", "-y",
+			"-ss", str(timestamp),
+			"-i", input_path,
+			"-frames:v", "1",
+			output_path
+		]
+		result = run_ffmpeg(cmd, video_id, 'thumbnail', timeout=60)
+		if result.returncode != 0:
+			raise TranscodeError(f"FFmpeg error: {result.stderr.strip()}")
+
+	def extract_thumbnail_candidates(self, input_path, output_dir, timestamps, video_id=None):
+		# One ffmpeg process with an input-seeked input per timestamp; each output prints its
+		# signalstats/entropy metadata to a side file next to the JPEG.
+		cmd = ["ffmpeg", "-y"]
+		for timestamp in timestamps:
+			cmd += ["-ss", str(timestamp), "-i", input_path]
+		candidates = []
+		for i, timestamp in enumerate(timestamps):
+			path = os.path.join(output_dir, f"candidate_{i:02d}.jpg")
+			stats_path = os.path.join(output_dir, f"candidate_{i:02d}.txt")
+			cmd += [
+				"-map", f"{i}:v:0", "-frames:v", "1",
+				"-vf", f"signalstats,entropy,metadata=mode=print:file={_filter_path(stats_path)}",
+				"-q:v", "2", path,
+			]
+			candidates.append({'path': path, 'stats_path': stats_path, 'timestamp': float(timestamp)})
+		self._run(cmd, video_id, 'thumbnail', timeout=60 * max(1, len(timestamps)))
+
+		found = []
+		for candidate in candidates:
+			if not os.path.exists(candidate['path']):
+				continue  # timestamp past the end of the stream
+			stats = parse_frame_metadata(candidate.pop('stats_path'))
+			candidate['entropy'] = stats.get('lavfi.entropy.normalized_entropy.normal.Y')
+			candidate['yavg'] = stats.get('lavfi.signalstats.YAVG')
+			candidate['bitdepth'] = int(stats.get('lavfi.signalstats.YBITDEPTH') or 8)
+			found.append(candidate)
+		if not found:
+			raise TranscodeError("FFmpeg error: no thumbnail candidate frames could be decoded")
+		return found
+
+	def write_thumbnail_variants(self, image_path, output_dir, widths, formats, video_id=None):
+		if not widths or not formats:
+			return []
+		split = len(widths) * len(formats)
+		graph = f"[0:v]split={split}" + "".join(f"[s{i}]" for i in range(split))
+		cmd = ["ffmpeg", "-y", "-i", image_path]
+		outputs = []
+		for i, (width, fmt) in enumerate((w, f) for w in widths for f in formats):
+			graph += f";[s{i}]scale={int(width)}:-2:flags=lanczos[v{i}]"
+			path = os.path.join(output_dir, f"thumbnail_{int(width)}.{fmt}")
+			codec = ["-c:v", "libwebp", "-quality", "80"] if fmt == 'webp' else ["-q:v", "3"]
+			cmd += ["-map", f"[v{i}]", "-frames:v", "1"] + codec + [path]
+			outputs.append(path)
+		cmd[4:4] = ["-filter_complex", graph]
+		self._run(cmd, video_id, 'thumbnail', timeout=60)
+		return outputs
+
+
+class PyAVBackend(TranscoderBackend):
+	"""Encodes in-process through PyAV (libav bindings).
+
+	Avoids spawning ffmpeg per job and keeps recently used sources open, so consecutive segment
+	requests for the same title seek in an already demuxed file instead of re-opening and
+	re-probing it. Audio is always re-encoded to 48 kHz AAC. Continuous jobs need a separate
+	process that can be suspended/resumed by the heartbeat monitor, so they are delegated to
+	the ffmpeg CLI backend. An in-process encode cannot be interrupted, so `timeout` is ignored.
+	"""
+
+	max_open_inputs = 8
+	progress_interval = 0.5
+
+	def __init__(self):
+		try:
+			import av
+		except ImportError:
+			raise ImproperlyConfigured("PyAVBackend requires the 'av' package (pip install av)")
+		self.av = av
+		self._inputs = OrderedDict()  # path -> (identity, container, lock)
+		self._inputs_lock = threading.Lock()
+		self._cli = FFmpegCLIBackend()
+
+	def _open_input(self, input_path):
+		"""Return (container, lock) for a source, reusing an open container when the file is unchanged."""
+		st = os.stat(input_path)
+		identity = (st.st_size, st.st_mtime_ns, st.st_ino)
+		with self._inputs_lock:
+			entry = self._inputs.pop(input_path, None)
+			if entry and entry[0] != identity:
+				entry[1].close()
+				entry = None
+			if entry is None:
+				entry = (identity, self.av.open(input_path), threading.Lock())
+			self._inputs[input_path] = entry
+			while len(self._inputs) > self.max_open_inputs:
+				_, (_, container, lock) = self._inputs.popitem(last=False)
+				with lock:
+					container.close()
+		return entry[1], entry[2]
+
+	def _add_output_streams(self, output, source, params, height, audio=True):
+		vin = source.streams.video[0]
+		width = vin.codec_context.width
+		src_height = vin.codec_context.height
+		if height and src_height and height != src_height:
+			width = int(round(width * height / src_height / 2)) * 2
+		else:
+			height = src_height
+		rate = vin.average_rate or Fraction(24)
+		vout = output.add_stream(params.get('codec', 'libx264'), rate=rate)
+		vout.codec_context.time_base = 1 / rate
+		vout.width = width
+		vout.height = height
+		vout.pix_fmt = 'yuv420p'
+		vout.bit_rate = _bitrate_to_int(params.get('bitrate', '1200k'))
+		vout.options = {'preset': params.get('preset', 'medium')}
+		aout = None
+		if audio and source.streams.audio:
+			aout = output.add_stream('aac', rate=48000)
+		return vout, aout
+
+	def _encode_range(self, source, output, vout, aout, start_time, end_time, keyframe_interval=None, video_id=None, progress_output=None, max_video_frames=None):
+		"""Decode [start_time, end_time) from an open source and encode it into `output`."""
+		av = self.av
+		from av.video.frame import PictureType
+
+		vin = source.streams.video[0]
+		ain = source.streams.audio[0] if aout is not None else None
+		resampler = av.AudioResampler(format='fltp', layout='stereo', rate=48000) if ain is not None else None
+		source.seek(int(start_time * av.time_base), backward=True, any_frame=False)
+
+		done = {vin: False}
+		if ain is not None:
+			done[ain] = False
+		next_forced = start_time
+		next_audio_pts = None
+		frames = 0
+		started = last_report = time.time()
+		for packet in source.demux(*done.keys()):
+			if packet.stream in done and done[packet.stream]:
+				if all(done.values()):
+					break
+				continue
+			for frame in packet.decode():
+				# Read before restamping: reformat() returns the frame itself when nothing needs converting
+				frame_time = frame.time
+				if frame_time is None or frame_time < start_time:
+					continue
+				if end_time is not None and frame_time >= end_time:
+					done[packet.stream] = True
+					break
+				if packet.stream is vin:
+					out_frame = frame.reformat(width=vout.width, height=vout.height, format='yuv420p')
+					out_frame.time_base = vout.codec_context.time_base
+					out_frame.pts = int(round(frame_time / out_frame.time_base))
+					if keyframe_interval and frame_time >= next_forced:
+						out_frame.pict_type = PictureType.I
+						next_forced += keyframe_interval
+					for out_packet in vout.encode(out_frame):
+						output.mux(out_packet)
+					frames += 1
+					if max_video_frames and frames >= max_video_frames:
+						done[vin] = True
+						if ain is not None:
+							done[ain] = True
+						break
+				else:
+					# Source timestamps, like the video: audio starts where the range starts, not at 0.
+					# The resampler's output is contiguous, so it is stamped by counting samples.
+					if next_audio_pts is None:
+						next_audio_pts = int(round(frame_time * aout.rate))
+					frame.pts = None
+					for resampled in resampler.resample(frame):
+						resampled.pts = next_audio_pts
+						resampled.time_base = Fraction(1, aout.rate)
+						next_audio_pts += resampled.samples
+						for out_packet in aout.encode(resampled):
+							output.mux(out_packet)
+				if video_id is not None and time.time() - last_report >= self.progress_interval:
+					last_report = time.time()
+					encoded = frame_time - start_time
+					publish_progress(video_id, progress_output, {
+						'frame': frames, 'fps': round(frames / (last_report - started), 2),
+						'bitrate_kbps': None, 'total_size': None,
+						'out_time_seconds': encoded, 'position_seconds': frame_time,
+						'speed': round(encoded / (last_report - started), 3), 'state': 'continue',
+						'engine': 'pyav', 'ts': last_report,
+					})
+			if all(done.values()):
+				break
+
+		for stream in (vout, aout):
+			if stream is not None:
+				for out_packet in stream.encode(None):
+					output.mux(out_packet)
+		if video_id is not None:
+			elapsed = max(time.time() - started, 1e-6)
+			publish_progress(video_id, progress_output, {
+				'frame': frames, 'fps': round(frames / elapsed, 2), 'bitrate_kbps': None, 'total_size': None,
+				'out_time_seconds': (end_time - start_time) if end_time is not None else None,
+				'position_seconds': end_time, 'speed': round((end_time - start_time) / elapsed, 3) if end_time is not None else None,
+				'state': 'end', 'engine': 'pyav', 'ts': time.time(),
+			})
+
+	def encode_init(self, input_path, output_path, params, video_id=None, resolution=None, timeout=None):
+		try:
+			source, lock = self._open_input(input_path)
+			with lock:
+				output = self.av.open(output_path, 'w', format='mp4', options={'movflags': '+faststart+frag_keyframe+empty_moov+default_base_moof'})
+				try:
+					self._add_output_streams(output, source, params, _scale_height(params.get('scale')))
+					output.start_encoding()
+				finally:
+					output.close()
+		except Exception as e:
+			raise TranscodeError(f"PyAV error: {e}")
+
+	def encode_segment(self, input_path, output_path, params, start_time, end_time, keyframe_interval, video_id=None, resolution=None, timeout=None):
+		try:
+			source, lock = self._open_input(input_path)
+			with lock:
+				# delay_moov: fragments keep the source timestamps (as tfdt) instead of each track starting at 0
+				output = self.av.open(output_path, 'w', format='mp4', options={'movflags': '+empty_moov+delay_moov+default_base_moof+frag_keyframe'})
+				try:
+					vout, aout = self._add_output_streams(output, source, params, _scale_height(params.get('scale')))
+					self._encode_range(source, output, vout, aout, float(start_time), float(end_time), keyframe_interval, video_id, resolution)
+				finally:
+					output.close()
+		except Exception as e:
+			raise TranscodeError(f"PyAV error: {e}")
+
+	def start_continuous(self, input_path, output_dir, params, start_time, segment_duration, video_id=None, resolution=None, worker_id=None, keyframe_times=None, start_number=0, part_duration=None):
+		return self._cli.start_continuous(input_path, output_dir, params, start_time, segment_duration, video_id, resolution, worker_id, keyframe_times, start_number, part_duration)
+
+	def extract_thumbnail_candidates(self, input_path, output_dir, timestamps, video_id=None):
+		# Frame statistics come from ffmpeg's signalstats/entropy filters.
+		return self._cli.extract_thumbnail_candidates(input_path, output_dir, timestamps, video_id)
+
+	def write_thumbnail_variants(self, image_path, output_dir, widths, formats, video_id=None):
+		return self._cli.write_thumbnail_variants(image_path, output_dir, widths, formats, video_id)
+
+	def encode_preview(self, input_path, output_dir, start_offset, duration, video_id=None, preview_id=None):
+		try:
+			source, lock = self._open_input(input_path)
+			with lock:
+				output = self.av.open(os.path.join(output_dir, "index.m3u8"), 'w', format='hls', options={
+					'hls_time': '5',
+					'hls_playlist_type': 'vod',
+					'hls_segment_type': 'fmp4',
+					'hls_fmp4_init_filename': 'init.mp4',
+					'hls_segment_filename': os.path.join(output_dir, "preview_%03d.mp4"),
+				})
+				try:
+					vout, _ = self._add_output_streams(output, source, {'codec': 'libx264', 'bitrate': '900k'}, 480, audio=False)
+					self._encode_range(source, output, vout, None, float(start_offset), float(start_offset) + float(duration), 5, video_id, 'preview')
+				finally:
+					output.close()
+		except Exception as e:
+			raise TranscodeError(f"PyAV error: {e}")
+
+	def extract_thumbnail(self, input_path, output_path, timestamp, video_id=None):
+		try:
+			source, lock = self._open_input(input_path)
+			with lock:
+				output = self.av.open(output_path, 'w', format='image2')
+				try:
+					vin = source.streams.video[0]
+					rate = vin.average_rate or Fraction(24)
+					vout = output.add_stream('mjpeg', rate=rate)
+					vout.codec_context.time_base = 1 / rate
+					vout.width = vin.codec_context.width
+					vout.height = vin.codec_context.height
+					vout.pix_fmt = 'yuvj420p'
+					self._encode_range(source, output, vout, None, float(timestamp), None, max_video_frames=1)
+				finally:
+					output.close()
+		except Exception as e:
+			raise TranscodeError(f"PyAV error: {e}")
+
+
+class StubProcess:
+	"""Process-like handle for StubBackend continuous jobs (a thread writing fake segments)."""
+
+	pid = None
+
+	def __init__(self, target):
+		self.returncode = None
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, args=(target,), daemon=True)
+		self._thread.start()
+
+	def _run(self, target):
+		target(self._stop)
+		self.returncode = 0 if not self._stop.is_set() else -9
+
+	def poll(self):
+		return None if self._thread.is_alive() else self.returncode
+
+	def wait(self, timeout=None):
+		self._thread.join(timeout)
+		return self.returncode
+
+	def kill(self):
+		self._stop.set()
+
+
+class StubBackend(TranscoderBackend):
+	"""Deterministic fake engine for tests: writes bytes derived from the job parameters.
+
+	The same job always produces the same file content, nothing is decoded and no process is
+	spawned. TRANSCODER_STUB_DELAY (seconds per output file) simulates encode time.
+	"""
+
+	segment_bytes = 4096
+
+	def __init__(self):
+		self.delay = float(getattr(settings, 'TRANSCODER_STUB_DELAY', 0))
+
+	def _payload(self, *parts):
+		digest = hashlib.sha256(repr(parts).encode()).digest()
+		return (digest * (self.segment_bytes // len(digest) + 1))[:self.segment_bytes]
+
+	def _write(self, path, *parts):
+		if self.delay:
+			time.sleep(self.delay)
+		with open(path, 'wb') as f:
+			f.write(self._payload(*parts))
+
+	def encode_init(self, input_path, output_path, params, video_id=None, resolution=None, timeout=None):
+		self._write(output_path, 'init', input_path, sorted(params.items()))
+
+	def encode_segment(self, input_path, output_path, params, start_time, end_time, keyframe_interval, video_id=None, resolution=None, timeout=None):
+		self._write(output_path, 'segment', input_path, sorted(params.items()), float(start_time), float(end_time))
+
+	def start_continuous(self, input_path, output_dir, params, start_time, segment_duration, video_id=None, resolution=None, worker_id=None, keyframe_times=None, start_number=0, part_duration=None):
+		def run(stop):
+			self._write(os.path.join(output_dir, 'init.mp4'), 'init', input_path, sorted(params.items()))
+			count = int(getattr(settings, 'TRANSCODER_STUB_SEGMENTS', 3))
+			for i in range(count):
+				if stop.is_set():
+					return
+				if keyframe_times and i + 1 < len(keyframe_times):
+					start, end = (float(start_time) + keyframe_times[i], float(start_time) + keyframe_times[i + 1])
+				else:
+					start = float(start_time) + i * float(segment_duration)
+					end = start + float(segment_duration)
+				self._write(os.path.join(output_dir, f"segment_{start_number + i:03d}.mp4"), 'segment', input_path, sorted(params.items()), start, end)
+		return StubProcess(run)
+
+	def encode_preview(self, input_path, output_dir, start_offset, duration, video_id=None, preview_id=None):
+		self._write(os.path.join(output_dir, 'init.mp4'), 'preview-init', input_path)
+		playlist = "#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-TARGETDURATION:5\n#EXT-X-PLAYLIST-TYPE:VOD\n#EXT-X-MAP:URI=\"init.mp4\"\n"
+		count = max(1, int(-(-float(duration) // 5)))
+		for i in range(count):
+			self._write(os.path.join(output_dir, f"preview_{i:03d}.mp4"), 'preview', input_path, float(start_offset) + i * 5)
+			playlist += f"#EXTINF:{min(5.0, float(duration) - i * 5):.6f},\npreview_{i:03d}.mp4\n"
+		playlist += "#EXT-X-ENDLIST\n"
+		with open(os.path.join(output_dir, 'index.m3u8'), 'w') as f:
+			f.write(playlist)
+
+	def extract_thumbnail(self, input_path, output_path, timestamp, video_id=None):
+		self._write(output_path, 'thumbnail', input_path, float(timestamp))
+
+	def extract_thumbnail_candidates(self, input_path, output_dir, timestamps, video_id=None):
+		candidates = []
+		for i, timestamp in enumerate(timestamps):
+			path = os.path.join(output_dir, f"candidate_{i:02d}.jpg")
+			self._write(path, 'thumbnail', input_path, float(timestamp))
+			digest = self._payload('stats', input_path, float(timestamp))
+			candidates.append({'path': path, 'timestamp': float(timestamp), 'entropy': digest[0] / 255, 'yavg': 16 + digest[1] % 220, 'bitdepth': 8})
+		return candidates
+
+	def write_thumbnail_variants(self, image_path, output_dir, widths, formats, video_id=None):
+		outputs = []
+		for width in widths:
+			for fmt in formats:
+				path = os.path.join(output_dir, f"thumbnail_{int(width)}.{fmt}")
+				self._write(path, 'variant', image_path, int(width), fmt)
+				outputs.append(path)
+		return outputs
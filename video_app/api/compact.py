@@ -0,0 +1,174 @@
+import bisect
+import json
+import math
+import os
+import shutil
+
+import django_rq
+from django.conf import settings
+
+from video_app.api.playlist_cache import invalidate_playlists
+from video_app.api.segment_plan import load_plan
+from video_app.api.transcode import (
+	generate_transcode_path, parse_transcode_path, is_transcode_output_busy, lock_a_file, get_rid_of_lockfile,
+	transcode_aliases,
+)
+
+# A fully transcoded output is compacted into one file: init.mp4 followed by every segment file,
+# byte for byte, in rendition.mp4, with their byte ranges in rendition.json. Its playlist addresses
+# the segments with EXT-X-BYTERANGE, so serving the output means one open file read sequentially,
+# and evicting it removes two files instead of thousands. Players still holding the per-file
+# playlist get the same bytes for segment_NNN.mp4 from the ranges.
+RENDITION_FILE = 'rendition.mp4'
+INDEX_FILE = 'rendition.json'
+
+# Process-local copies of loaded indexes: path -> (mtime, index)
+_indexes = {}
+
+
+def rendition_index(output_dir):
+	"""{'init': (offset, size), 'segments': [(offset, size, duration)]} of a compacted output, or None."""
+	path = os.path.join(output_dir, INDEX_FILE)
+	try:
+		mtime = os.path.getmtime(path)
+	except OSError:
+		return None
+	cached = _indexes.get(path)
+	if cached and cached[0] == mtime:
+		return cached[1]
+	with open(path) as f:
+		data = json.load(f)
+	index = {'init': tuple(data['init']), 'segments': [tuple(s) for s in data['segments']]}
+	_indexes[path] = (mtime, index)
+	return index
+
+
+def file_range(index, segment_name):
+	"""(offset, size) of init.mp4 or segment_NNN.mp4 inside rendition.mp4, or None."""
+	if segment_name == 'init.mp4':
+		return index['init']
+	if segment_name.startswith('segment_') and segment_name.endswith('.mp4'):
+		try:
+			segment_number = int(segment_name[len('segment_'):-len('.mp4')])
+		except ValueError:
+			return None
+		if 0 <= segment_number < len(index['segments']):
+			return index['segments'][segment_number][:2]
+	return None
+
+
+def segment_starting_at(index, offset):
+	"""Number of the segment whose bytes start at `offset`, or None (init, or inside a segment)."""
+	starts = [start for start, _, _ in index['segments']]
+	i = bisect.bisect_left(starts, offset)
+	return i if i < len(starts) and starts[i] == offset else None
+
+
+def build_byterange_playlist(index):
+	"""Media playlist of a compacted output: every segment is a byte range of rendition.mp4."""
+	init_offset, init_size = index['init']
+	m3u8_content = "#EXTM3U\n#EXT-X-VERSION:6\n"
+	m3u8_content += "#EXT-X-MEDIA-SEQUENCE:0\n"
+	m3u8_content += f"#EXT-X-MAP:URI=\"{RENDITION_FILE}\",BYTERANGE=\"{init_size}@{init_offset}\"\n"
+	m3u8_content += "#EXT-X-ALLOW-CACHE:YES\n"
+	m3u8_content += "#EXT-X-PLAYLIST-TYPE:VOD\n"
+	m3u8_content += f"#EXT-X-TARGETDURATION:{math.ceil(max(d for _, _, d in index['segments']))}\n"
+	m3u8_content += "#EXT-X-START:TIME-OFFSET=0.01,PRECISE=NO\n"
+	for offset, size, duration in index['segments']:
+		m3u8_content += "#EXT-X-DISCONTINUITY\n"
+		m3u8_content += f"#EXTINF:{duration:.3f},\n#EXT-X-BYTERANGE:{size}@{offset}\n{RENDITION_FILE}\n"
+	m3u8_content += "#EXT-X-ENDLIST\n"
+	return m3u8_content
+
+
+def compacted_playlist(video_id, resolution):
+	"""The byte-range playlist of an output if it is compacted, else None."""
+	index = rendition_index(generate_transcode_path(video_id, resolution))
+	return build_byterange_playlist(index) if index else None
+
+
+def compact_rendition(video_id, resolution, output_dir=None):
+	"""RQ worker: compact a fully transcoded output into rendition.mp4 and remove its segment files.
+
+	Skipped while an encoder owns the output or a planned segment is missing.
+	"""
+	output_dir = output_dir or generate_transcode_path(video_id, resolution)
+	plan = load_plan(video_id)
+	if plan is None:
+		return "Not compacted: the playlist has no segment plan."
+	if rendition_index(output_dir) is not None:
+		return "Already compacted."
+	names = ['init.mp4'] + [f"segment_{i:03d}.mp4" for i in range(len(plan))]
+	if not all(os.path.exists(os.path.join(output_dir, name)) for name in names):
+		return "Not compacted: the output is not fully transcoded."
+	if is_transcode_output_busy(output_dir):
+		return "Not compacted: an encoder is writing to the output."
+
+	lockfile = os.path.join(output_dir, RENDITION_FILE + "lockfile.lock")
+	if not lock_a_file(lockfile):
+		return "Failed to acquire lock for compaction. Compaction is already in progress."
+	rendition_path = os.path.join(output_dir, RENDITION_FILE)
+	try:
+		ranges = []
+		with open(rendition_path + '.tmp', 'wb') as out:
+			for name in names:
+				offset = out.tell()
+				with open(os.path.join(output_dir, name), 'rb') as f:
+					shutil.copyfileobj(f, out)
+				ranges.append((offset, out.tell() - offset))
+		os.replace(rendition_path + '.tmp', rendition_path)
+		index_path = os.path.join(output_dir, INDEX_FILE)
+		with open(index_path + '.tmp', 'w') as f:
+			json.dump({
+				'init': ranges[0],
+				'segments': [(offset, size, duration) for (offset, size), (_, duration) in zip(ranges[1:], plan)],
+			}, f)
+		os.replace(index_path + '.tmp', index_path)
+		# Re-uploads linked to this folder serve the same output
+		invalidate_playlists(video_id, *transcode_aliases().get(video_id, []))
+		# Readers look for the index first, so nothing asks for these files any more
+		for name in names:
+			try:
+				os.remove(os.path.join(output_dir, name))
+			except FileNotFoundError:
+				pass
+		return "Success"
+	except Exception as e:
+		for path in (rendition_path + '.tmp', os.path.join(output_dir, INDEX_FILE + '.tmp')):
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+		return f"Error compacting rendition: {str(e)}"
+	finally:
+		get_rid_of_lockfile(lockfile)
+
+
+def schedule_compaction(video_id, resolution):
+	"""Queue compact_rendition for an output (TRANSCODE_COMPACT_RENDITIONS); errors are ignored."""
+	if not settings.TRANSCODE_COMPACT_RENDITIONS:
+		return
+	try:
+		django_rq.get_queue('low').enqueue(compact_rendition, video_id, resolution)
+	except Exception as e:
+		print(f"Could not queue compaction of video {video_id} ({resolution}): {e}")
+
+
+def compact_complete_renditions(base_dir='media/transcode'):
+	"""Compact every idle, fully transcoded output under `base_dir`. Returns the compacted directories."""
+	compacted = []
+	if not os.path.isdir(base_dir):
+		return compacted
+	for video_entry in os.scandir(base_dir):
+		# symlinked folders of re-uploads are covered by the folder they point to
+		if not video_entry.is_dir(follow_symlinks=False) or not video_entry.name.startswith('video_'):
+			continue
+		for output_entry in os.scandir(video_entry.path):
+			video_id, resolution = parse_transcode_path(output_entry.path)
+			if not output_entry.is_dir() or video_id is None:
+				continue
+			if os.path.exists(os.path.join(output_entry.path, INDEX_FILE)):
+				continue
+			if compact_rendition(video_id, resolution, output_entry.path) == "Success":
+				compacted.append(output_entry.path)
+	return compacted
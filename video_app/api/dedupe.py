@@ -0,0 +1,262 @@
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from video_app.models import Video, Preview
+from video_app.api.transcode import _file_cache_key
+
+# Sources are stored as <CONTENT_DIR>/<first two hex digits>/<hash><ext> below MEDIA_ROOT.
+CONTENT_DIR = 'media/videos/sha256'
+# Per-video output trees that a duplicate shares with its source video through symlinks.
+SHARED_OUTPUT_DIRS = ('media/transcode', 'media/index')
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def combine_block_digests(digests, total_size):
+	"""Content hash of a file from the sha256 digests of its CONTENT_HASH_BLOCK_SIZE blocks."""
+	h = hashlib.sha256(total_size.to_bytes(8, 'big'))
+	for digest in digests:
+		h.update(digest)
+	return h.hexdigest()
+
+
+def hash_file(path, block_size=None):
+	"""Block-tree content hash of a file on disk (same value BlockHasher produces while uploading)."""
+	block_size = block_size or settings.CONTENT_HASH_BLOCK_SIZE
+	digests = []
+	total = 0
+	with open(path, 'rb') as f:
+		while True:
+			block = hashlib.sha256()
+			remaining = block_size
+			while remaining:
+				data = f.read(min(READ_BUFFER_SIZE, remaining))
+				if not data:
+					break
+				block.update(data)
+				remaining -= len(data)
+			read = block_size - remaining
+			if read:
+				digests.append(block.digest())
+				total += read
+			if remaining:
+				break
+	return combine_block_digests(digests, total)
+
+
+class BlockHasher:
+	"""Hashes upload chunks as they are written, one sha256 per fixed-size block.
+
+	Block digests are stored in a sidecar file (32 bytes per block), so the hash survives across
+	requests and worker processes. A chunk starting inside a block first re-reads that block's
+	earlier bytes (at most one block) from the .part file.
+	"""
+
+	def __init__(self, blocks_path, part_file, start, block_size=None):
+		self.block_size = block_size or settings.CONTENT_HASH_BLOCK_SIZE
+		self.blocks_path = blocks_path
+		self.index, self.filled = divmod(start, self.block_size)
+		self.hasher = hashlib.sha256()
+		if self.filled:
+			part_file.seek(start - self.filled)
+			self.hasher.update(part_file.read(self.filled))
+			part_file.seek(start)
+
+	def update(self, data):
+		view = memoryview(data)
+		while view:
+			take = min(len(view), self.block_size - self.filled)
+			self.hasher.update(view[:take])
+			self.filled += take
+			view = view[take:]
+			if self.filled == self.block_size:
+				self._flush()
+
+	def finish(self, end, total_size):
+		"""Write the trailing partial block once the last byte of the file has arrived."""
+		if end == total_size and self.filled:
+			self._flush()
+
+	def _flush(self):
+		mode = 'r+b' if os.path.exists(self.blocks_path) else 'wb'
+		with open(self.blocks_path, mode) as f:
+			f.seek(self.index * 32)
+			f.write(self.hasher.digest())
+		self.index += 1
+		self.filled = 0
+		self.hasher = hashlib.sha256()
+
+	@staticmethod
+	def content_hash(blocks_path, total_size):
+		with open(blocks_path, 'rb') as f:
+			data = f.read()
+		return combine_block_digests([data[i:i + 32] for i in range(0, len(data), 32)], total_size)
+
+
+def content_addressed_name(content_hash, filename):
+	ext = os.path.splitext(filename)[1].lower()
+	return f"{CONTENT_DIR}/{content_hash[:2]}/{content_hash}{ext}"
+
+
+def _hash_cache_key(path):
+	return _file_cache_key(f'content_hash{settings.CONTENT_HASH_BLOCK_SIZE}', path)
+
+
+def cached_hash_file(path):
+	"""hash_file() cached per file identity, so re-scanning a library does not re-read unchanged files."""
+	key = _hash_cache_key(path)
+	content_hash = cache.get(key)
+	if content_hash is None:
+		content_hash = hash_file(path)
+		cache.set(key, content_hash, timeout=settings.PROBE_CACHE_TIMEOUT)
+	return content_hash
+
+
+def known_content_hash(path):
+	"""The cached content hash of a file if it was hashed before, else None (never reads the file)."""
+	try:
+		return cache.get(_hash_cache_key(path))
+	except OSError:
+		return None
+
+
+def store_content_addressed(path, content_hash, filename, copy=False):
+	"""Move (or copy) a file into content-addressed storage and return its storage name.
+
+	If the same content is already stored, the new copy is deleted (left alone when copying)
+	and the existing file reused.
+	"""
+	name = content_addressed_name(content_hash, filename)
+	destination = default_storage.path(name)
+	if os.path.abspath(path) == os.path.abspath(destination):
+		return name
+	if os.path.exists(destination):
+		if not copy:
+			os.remove(path)
+		return name
+	os.makedirs(os.path.dirname(destination), exist_ok=True)
+	if copy:
+		# Per-process temp name: the same content may be imported by two pool workers at once
+		tmp = f"{destination}.{os.getpid()}.tmp"
+		shutil.copyfile(path, tmp)
+		os.replace(tmp, destination)
+	else:
+		os.replace(path, destination)
+	return name
+
+
+def find_duplicate(video):
+	"""The video that owns the outputs for the same content, or None."""
+	if not video.content_hash:
+		return None
+	return Video.objects.filter(
+		content_hash=video.content_hash, source_video__isnull=True,
+	).exclude(pk=video.pk).order_by('id').first()
+
+
+def _link(path, target_name):
+	"""Make `path` a relative symlink to the sibling directory `target_name` (created if missing)."""
+	target = os.path.join(os.path.dirname(path), target_name)
+	os.makedirs(target, exist_ok=True)
+	if os.path.islink(path):
+		os.unlink(path)
+	elif os.path.isdir(path):
+		shutil.rmtree(path)
+	os.symlink(target_name, path)
+
+
+def link_duplicate(video, source):
+	"""Reuse everything derived from `source` for a video with identical content.
+
+	Copies the probe fields, symlinks the transcode, index (playlist, thumbnails, trick-play) and
+	preview folders, and marks the preview as transcoded. The caller saves `video`.
+	"""
+	for field in ('codec', 'resolution', 'audio_codec', 'duration', 'is_transcoded'):
+		setattr(video, field, getattr(source, field))
+	if not video.thumbnail_url:
+		video.thumbnail_url = source.thumbnail_url
+		video.poster_url = video.poster_url or source.poster_url
+	video.source_video = source
+
+	for base_dir in SHARED_OUTPUT_DIRS:
+		_link(os.path.join(base_dir, f"video_{video.id}"), f"video_{source.id}")
+
+	try:
+		source_preview = source.preview
+	except Preview.DoesNotExist:
+		return
+	preview, _created = Preview.objects.update_or_create(video=video, defaults={
+		'preview_duration': source_preview.preview_duration,
+		'start_offset': source_preview.start_offset,
+		'status': source_preview.status,
+		'is_transcoded': source_preview.is_transcoded,
+		'error_message': source_preview.error_message,
+	})
+	_link(os.path.join('media', 'hls_preview', f"preview_{preview.id}"), f"preview_{source_preview.id}")
+
+
+def _preview_dir(video):
+	try:
+		return os.path.join('media', 'hls_preview', f"preview_{video.preview.id}")
+	except Preview.DoesNotExist:
+		return None
+
+
+def remove_output_dir(path):
+	"""Remove a per-video output folder; symlinked (shared) folders only lose the link."""
+	if os.path.islink(path):
+		os.unlink(path)
+	elif os.path.isdir(path):
+		shutil.rmtree(path, ignore_errors=True)
+
+
+def release_shared_outputs(video):
+	"""Prepare a video for deletion without breaking duplicates that share its files.
+
+	A duplicate just drops its symlinks. A source video hands its folders to its oldest duplicate
+	(renamed into place) and re-points the other duplicates at it. Also used when a video's file
+	is replaced by different content, so its new outputs are not written into shared folders.
+	"""
+	duplicates = list(Video.objects.filter(source_video=video).order_by('id'))
+	if not duplicates:
+		for base_dir in SHARED_OUTPUT_DIRS:
+			remove_output_dir(os.path.join(base_dir, f"video_{video.id}"))
+		preview_dir = _preview_dir(video)
+		if preview_dir and os.path.islink(preview_dir):
+			os.unlink(preview_dir)
+		return None
+
+	heir, others = duplicates[0], duplicates[1:]
+	for base_dir in SHARED_OUTPUT_DIRS:
+		own = os.path.join(base_dir, f"video_{video.id}")
+		heir_path = os.path.join(base_dir, f"video_{heir.id}")
+		if os.path.islink(heir_path):
+			os.unlink(heir_path)
+		if os.path.isdir(own) and not os.path.islink(own):
+			os.replace(own, heir_path)
+		for other in others:
+			_link(os.path.join(base_dir, f"video_{other.id}"), f"video_{heir.id}")
+
+	own_preview, heir_preview = _preview_dir(video), _preview_dir(heir)
+	if own_preview and heir_preview:
+		if os.path.islink(heir_preview):
+			os.unlink(heir_preview)
+		if os.path.isdir(own_preview) and not os.path.islink(own_preview):
+			os.replace(own_preview, heir_preview)
+		for other in others:
+			other_preview = _preview_dir(other)
+			if other_preview:
+				_link(other_preview, os.path.basename(heir_preview))
+
+	Video.objects.filter(pk__in=[o.pk for o in others]).update(source_video=heir)
+	Video.objects.filter(pk=heir.pk).update(source_video=None)
+	return heir
+
+
+def is_source_file_shared(video):
+	"""True if another video points at the same stored source file."""
+	return bool(video.video_file) and Video.objects.filter(video_file=video.video_file.name).exclude(pk=video.pk).exists()
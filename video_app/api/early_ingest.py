@@ -0,0 +1,245 @@
+import json
+import math
+import os
+import shutil
+
+import django_rq
+from django.conf import settings
+from django.core.cache import cache
+
+from video_app.models import ChunkedUpload, Preview
+from video_app.api.backends import get_backend
+from video_app.api.transcode import (
+	probe_a_video, _extract_keyframes, prime_file_cache, render_thumbnail, thumbnail_timestamps, preview_window,
+	lock_a_file, get_rid_of_lockfile,
+)
+
+# Staged results of uploads that are attached to a video, keyed by content hash (below MEDIA_ROOT).
+INGEST_DIR = os.path.join('media', 'ingest')
+MANIFEST_NAME = 'ingest.json'
+
+
+def _queued_key(upload_id):
+	return f"early_ingest_queued_{upload_id}"
+
+
+def _next_key(upload_id):
+	return f"early_ingest_next_{upload_id}"
+
+
+def staging_path(upload):
+	"""Folder next to the .part file collecting the results of early ingest while the upload runs."""
+	return os.path.join(settings.MEDIA_ROOT, 'media', 'uploads', f'{upload.id}.ingest')
+
+
+def ingest_path(content_hash):
+	return os.path.join(settings.MEDIA_ROOT, INGEST_DIR, content_hash)
+
+
+def _load_manifest(directory):
+	try:
+		with open(os.path.join(directory, MANIFEST_NAME)) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+
+def _save_manifest(directory, manifest):
+	path = os.path.join(directory, MANIFEST_NAME)
+	with open(path + '.tmp', 'w') as f:
+		json.dump(manifest, f)
+	os.replace(path + '.tmp', path)
+
+
+def schedule_early_ingest(upload):
+	"""Enqueue early_ingest_upload once the upload holds enough bytes for its next stage.
+
+	Called after every chunk; enqueues at most one job at a time and skips chunks that cannot
+	unlock a new stage (the job records the byte count it waits for).
+	"""
+	if upload.offset < min(settings.EARLY_INGEST_MIN_BYTES, upload.total_size):
+		return False
+	if upload.offset < upload.total_size and upload.offset < (cache.get(_next_key(upload.id)) or 0):
+		return False
+	if not cache.add(_queued_key(upload.id), 1, timeout=60 * 60):
+		return False
+	django_rq.get_queue('default').enqueue(early_ingest_upload, str(upload.id))
+	return True
+
+
+def _bytes_for(seconds, info, upload):
+	"""Bytes needed before `seconds` of media are on disk, assuming a roughly constant bitrate."""
+	duration = info.get('duration_seconds') or 0
+	if not duration:
+		return upload.total_size
+	return min(upload.total_size, math.ceil(upload.total_size * min(1.0, seconds / duration) / settings.EARLY_INGEST_SAFETY))
+
+
+def _run_stages(upload, staging, manifest):
+	"""Run every stage the bytes on disk allow. Returns the byte count the next stage waits for."""
+	part_path = upload.part_path
+	complete = upload.offset >= upload.total_size
+
+	probe = manifest.get('probe')
+	if probe is None or (complete and not probe['complete']):
+		try:
+			info = probe_a_video(part_path, use_cache=False)
+			if not info.get('duration_seconds') or not info.get('width'):
+				raise ValueError("header incomplete")
+			probe = manifest['probe'] = {'info': info, 'complete': complete}
+		except Exception:
+			# moov atom not written yet (e.g. at the end of the file): retry with twice the data
+			return upload.total_size if complete else min(upload.total_size, upload.offset * 2)
+	info = probe['info']
+	duration = info['duration_seconds']
+	available = duration if complete else duration * upload.offset / upload.total_size * settings.EARLY_INGEST_SAFETY
+	waiting_for = [upload.total_size]
+
+	if 'thumbnail' not in manifest:
+		timestamps = thumbnail_timestamps(duration)
+		# Wait for the first half of the candidate frames, then pick from what is there
+		needed = timestamps[:max(1, math.ceil(len(timestamps) / 2))]
+		if needed[-1] < available - 1:
+			usable = [t for t in timestamps if t < available - 1]
+			render_thumbnail(part_path, os.path.join(staging, 'index'), usable, info.get('width'))
+			manifest['thumbnail'] = {'timestamps': usable}
+		else:
+			waiting_for.append(_bytes_for(needed[-1] + 1, info, upload))
+
+	if 'preview' not in manifest:
+		start_offset, preview_duration = preview_window(duration)
+		if start_offset + preview_duration <= available:
+			preview_dir = os.path.join(staging, 'preview')
+			shutil.rmtree(preview_dir, ignore_errors=True)
+			os.makedirs(preview_dir)
+			get_backend('preview').encode_preview(part_path, preview_dir, start_offset, preview_duration)
+			manifest['preview'] = {'start_offset': start_offset, 'preview_duration': preview_duration}
+		else:
+			waiting_for.append(_bytes_for(start_offset + preview_duration, info, upload))
+
+	if complete and 'keyframes' not in manifest:
+		manifest['keyframes'] = _extract_keyframes(part_path)
+	return min(waiting_for)
+
+
+def early_ingest_upload(upload_id):
+	"""RQ worker: probe, thumbnail and preview an upload from the bytes already received.
+
+	Results are staged next to the .part file and handed to the video on attach (see
+	hand_over_early_ingest / adopt_early_ingest), so the post-upload job only has to move them.
+	Loops while new chunks keep unlocking stages; once the upload is complete the probe is
+	repeated and keyframes are extracted on the whole file.
+	"""
+	cache.delete(_queued_key(upload_id))
+	upload = ChunkedUpload.objects.filter(pk=upload_id).first()
+	if upload is None or upload.status == ChunkedUpload.UploadStatus.ATTACHED:
+		return "Upload is gone or already attached."
+	lockfile = staging_path(upload) + '.lock'
+	if not lock_a_file(lockfile):
+		return "Early ingest is already running for this upload."
+
+	staging = staging_path(upload)
+	try:
+		os.makedirs(staging, exist_ok=True)
+		manifest = _load_manifest(staging)
+		processed = -1
+		while upload.offset != processed and upload.status != ChunkedUpload.UploadStatus.ATTACHED:
+			processed = upload.offset
+			next_bytes = _run_stages(upload, staging, manifest)
+			_save_manifest(staging, manifest)
+			cache.set(_next_key(upload.id), next_bytes, timeout=settings.UPLOAD_STALE_SECONDS)
+			upload.refresh_from_db()
+			if upload.offset < next_bytes and upload.offset < upload.total_size:
+				break
+		return f"Staged {', '.join(k for k in manifest if k != 'probe') or 'probe'} at {processed}/{upload.total_size} bytes"
+	except Exception as e:
+		return f"Error during early ingest: {str(e)}"
+	finally:
+		try:
+			get_rid_of_lockfile(lockfile)
+		except Exception:
+			pass
+
+
+def hand_over_early_ingest(upload):
+	"""Move staged results to media/ingest/<content hash>/ when an upload is attached to a video."""
+	staging = staging_path(upload)
+	cache.delete_many([_queued_key(upload.id), _next_key(upload.id)])
+	if not os.path.isdir(staging):
+		return None
+	if not upload.content_hash:
+		shutil.rmtree(staging, ignore_errors=True)
+		return None
+	destination = ingest_path(upload.content_hash)
+	shutil.rmtree(destination, ignore_errors=True)
+	os.makedirs(os.path.dirname(destination), exist_ok=True)
+	os.replace(staging, destination)
+	return destination
+
+
+def discard_early_ingest(upload=None, content_hash=None):
+	if upload is not None:
+		shutil.rmtree(staging_path(upload), ignore_errors=True)
+		cache.delete_many([_queued_key(upload.id), _next_key(upload.id)])
+	if content_hash:
+		shutil.rmtree(ingest_path(content_hash), ignore_errors=True)
+
+
+def adopt_early_ingest(video):
+	"""Take over staged results for a stored video: prime its keyframe cache and move the thumbnail.
+
+	Returns the path of the adopted thumbnail.jpg, or None. The staged preview is left for
+	staged_preview() / adopt_staged_preview().
+	"""
+	if not video.content_hash:
+		return None
+	directory = ingest_path(video.content_hash)
+	manifest = _load_manifest(directory)
+	if not manifest:
+		return None
+
+	if manifest.get('keyframes'):
+		prime_file_cache('keyframes', video.video_file.path, manifest['keyframes'])
+
+	index_src = os.path.join(directory, 'index')
+	if 'thumbnail' not in manifest or video.thumbnail_url or not os.path.isdir(index_src):
+		return None
+	index_dir = os.path.join("media", "index", f"video_{video.id}")
+	os.makedirs(index_dir, exist_ok=True)
+	for name in os.listdir(index_src):
+		shutil.move(os.path.join(index_src, name), os.path.join(index_dir, name))
+	return os.path.join(index_dir, "thumbnail.jpg")
+
+
+def staged_preview(video, info):
+	"""The staged preview of a video whose final probe result is `info`, if the early probe saw the same duration."""
+	if not video.content_hash:
+		return None
+	directory = ingest_path(video.content_hash)
+	manifest = _load_manifest(directory)
+	preview = manifest.get('preview')
+	if not preview:
+		return None
+	early_duration = manifest.get('probe', {}).get('info', {}).get('duration_seconds') or 0
+	final_duration = info.get('duration_seconds') or 0
+	if abs(early_duration - final_duration) >= 1 or \
+			(preview['start_offset'], preview['preview_duration']) != preview_window(final_duration):
+		return None
+	return dict(preview, path=os.path.join(directory, 'preview'))
+
+
+def adopt_staged_preview(preview, staged):
+	"""Move a staged preview into the preview's folder and mark it transcoded. Returns True if adopted."""
+	if not staged or (preview.start_offset, preview.preview_duration) != (staged['start_offset'], staged['preview_duration']):
+		return False
+	if not os.path.isdir(staged['path']):
+		return False
+	preview_path = os.path.join("media", "hls_preview", f"preview_{preview.id}")
+	shutil.rmtree(preview_path, ignore_errors=True)
+	os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+	shutil.move(staged["path"], preview_path)
+	preview.status = Preview.PreviewStatus.COMPLETED
+	preview.is_transcoded = True
+	preview.error_message = None
+	preview.save(update_fields=['status', 'is_transcoded', 'error_message'])
+	return True
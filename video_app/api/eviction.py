@@ -0,0 +1,170 @@
+import math
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from video_app.api.transcode import (
+	parse_transcode_path, is_transcode_output_busy, remove_stale_locks, get_heartbeat, get_transcode_access, clear_transcode_access,
+	transcode_aliases,
+)
+from video_app.api.playlist_cache import invalidate_playlists
+
+EVICTION_STATS_KEY = "transcode_cache_stats"
+
+
+class TranscodeCacheEvictor:
+	"""Keep the transcode tree under a byte budget by evicting whole output folders.
+
+	Sizes are tracked per `video_<id>/<resolution>` folder and only re-read when the folder
+	changed (new/removed files bump the directory mtime) or an encoder is still writing into it,
+	so a steady-state pass costs one stat per folder instead of a walk over every segment.
+
+	Eviction order is least-recently-used, with a popularity bonus: every doubling of the
+	request count buys `popularity_seconds` of extra recency. Folders with a running encoder
+	or a viewer heartbeat younger than `active_seconds` are never evicted. Re-uploads of the same
+	content symlink their `video_<id>` folder to the original; their views count for the
+	original's folders and the links themselves are never sized or evicted.
+	"""
+
+	def __init__(self, base_dir='media/transcode', max_bytes=None, active_seconds=600, popularity_seconds=None):
+		self.base_dir = base_dir
+		self.max_bytes = max_bytes if max_bytes is not None else settings.TRANSCODE_CACHE_MAX_BYTES
+		self.active_seconds = active_seconds
+		self.popularity_seconds = popularity_seconds if popularity_seconds is not None else settings.TRANSCODE_CACHE_POPULARITY_SECONDS
+		self.total_bytes = 0
+		self.reclaimed_bytes = 0
+		self._outputs = {}  # output_dir -> {'size': int, 'mtime': float, 'last_write': float}
+		self._aliases = {}  # video id -> ids of duplicates linked to its folder
+
+	def _scan_output(self, output_dir):
+		size = 0
+		last_write = 0
+		for f in os.scandir(output_dir):
+			try:
+				st = f.stat()
+			except FileNotFoundError:
+				continue
+			if f.is_file():
+				size += st.st_size
+			last_write = max(last_write, st.st_mtime)
+		return size, last_write
+
+	def refresh(self):
+		"""Update per-folder sizes, rescanning only folders that changed since the last pass."""
+		seen = set()
+		self._aliases = transcode_aliases(self.base_dir)
+		if os.path.isdir(self.base_dir):
+			for video_entry in os.scandir(self.base_dir):
+				if not video_entry.is_dir(follow_symlinks=False) or not video_entry.name.startswith('video_'):
+					continue
+				for output_entry in os.scandir(video_entry.path):
+					if not output_entry.is_dir():
+						continue
+					output_dir = output_entry.path
+					seen.add(output_dir)
+					# Locks of crashed encoders would pin the output (and count as its last write) for good
+					remove_stale_locks(output_dir)
+					try:
+						mtime = output_entry.stat().st_mtime
+					except FileNotFoundError:
+						continue
+
+					known = self._outputs.get(output_dir)
+					if known and known['mtime'] == mtime and not is_transcode_output_busy(output_dir):
+						continue
+					try:
+						size, last_write = self._scan_output(output_dir)
+					except FileNotFoundError:
+						continue
+					self.total_bytes += size - (known['size'] if known else 0)
+					self._outputs[output_dir] = {'size': size, 'mtime': mtime, 'last_write': last_write}
+
+		for output_dir in set(self._outputs) - seen:
+			self.total_bytes -= self._outputs.pop(output_dir)['size']
+		return self.total_bytes
+
+	def _ids(self, video_id):
+		if video_id is None:
+			return []
+		return [video_id] + self._aliases.get(video_id, [])
+
+	def _is_active(self, output_dir, video_id, resolution):
+		if is_transcode_output_busy(output_dir):
+			return True
+		for viewer_id in self._ids(video_id):
+			heartbeat = get_heartbeat(viewer_id, resolution)
+			if heartbeat and time.time() - heartbeat.get('ts', 0) < self.active_seconds:
+				return True
+		return False
+
+	def _score(self, output_dir, video_id, resolution):
+		"""Lower scores are evicted first."""
+		last_used = self._outputs[output_dir]['last_write']
+		hits = 0
+		for viewer_id in self._ids(video_id):
+			last_access, viewer_hits = get_transcode_access(viewer_id, resolution)
+			hits += viewer_hits
+			if last_access:
+				last_used = max(last_used, last_access)
+		return last_used + self.popularity_seconds * math.log2(1 + hits)
+
+	def evict(self):
+		"""Evict folders until the tree fits the budget. Returns the list of (output_dir, bytes) removed."""
+		removed = []
+		if self.total_bytes <= self.max_bytes:
+			return removed
+
+		candidates = []
+		for output_dir in list(self._outputs):
+			video_id, resolution = parse_transcode_path(output_dir)
+			if self._is_active(output_dir, video_id, resolution):
+				continue
+			candidates.append((self._score(output_dir, video_id, resolution), output_dir, video_id, resolution))
+		candidates.sort()
+
+		for _, output_dir, video_id, resolution in candidates:
+			if self.total_bytes <= self.max_bytes:
+				break
+			# re-check right before deleting, a viewer may have arrived since we ranked the folder
+			if self._is_active(output_dir, video_id, resolution):
+				continue
+			size = self._outputs.pop(output_dir)['size']
+			shutil.rmtree(output_dir, ignore_errors=True)
+			try:
+				os.rmdir(os.path.dirname(output_dir))  # drop the video folder once it is empty
+			except OSError:
+				pass
+			for viewer_id in self._ids(video_id):
+				clear_transcode_access(viewer_id, resolution)
+			# A compacted output's byte-range playlist is gone with it
+			invalidate_playlists(*self._ids(video_id))
+			self.total_bytes -= size
+			self.reclaimed_bytes += size
+			removed.append((output_dir, size))
+		return removed
+
+	def run_once(self):
+		self.refresh()
+		removed = self.evict()
+		try:
+			cache.set(EVICTION_STATS_KEY, {
+				'total_bytes': self.total_bytes,
+				'max_bytes': self.max_bytes,
+				'reclaimed_bytes': self.reclaimed_bytes,
+				'outputs': len(self._outputs),
+				'ts': time.time(),
+			}, timeout=None)
+		except Exception:
+			pass
+		return removed
+
+	def run_forever(self, interval=30, on_pass=None):
+		"""Run eviction passes every `interval` seconds. `on_pass(removed)` is called after each pass."""
+		while True:
+			removed = self.run_once()
+			if on_pass:
+				on_pass(removed)
+			time.sleep(interval)
@@ -0,0 +1,127 @@
+import struct
+
+# Boxes whose payload is a list of child boxes.
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'moof', b'traf', b'mvex', b'edts'}
+
+
+def iter_boxes(f, start=0, end=None):
+	"""Yield (type, offset, size, header_size) for the boxes between `start` and `end` of an open file."""
+	if end is None:
+		f.seek(0, 2)
+		end = f.tell()
+	offset = start
+	while offset + 8 <= end:
+		f.seek(offset)
+		header = f.read(8)
+		if len(header) < 8:
+			return
+		size, box_type = struct.unpack('>I4s', header)
+		header_size = 8
+		if size == 1:
+			size = struct.unpack('>Q', f.read(8))[0]
+			header_size = 16
+		elif size == 0:
+			size = end - offset
+		if size < header_size:
+			return
+		yield box_type, offset, size, header_size
+		offset += size
+
+
+def find_box(f, path, start=0, end=None):
+	"""Return (offset, size, header_size) of the first box at `path` (e.g. [b'moov', b'trak', b'mdia', b'mdhd']) or None."""
+	for box_type, offset, size, header_size in iter_boxes(f, start, end):
+		if box_type != path[0]:
+			continue
+		if len(path) == 1:
+			return offset, size, header_size
+		if box_type in CONTAINER_BOXES:
+			found = find_box(f, path[1:], offset + header_size, offset + size)
+			if found:
+				return found
+	return None
+
+
+def _read_full_box(f, box):
+	offset, size, header_size = box
+	f.seek(offset + header_size)
+	payload = f.read(size - header_size)
+	return payload[0], payload[4:]
+
+
+def read_timescale(f):
+	"""Timescale of the first track (from moov/trak/mdia/mdhd)."""
+	box = find_box(f, [b'moov', b'trak', b'mdia', b'mdhd'])
+	if box is None:
+		return None
+	version, body = _read_full_box(f, box)
+	if version == 1:
+		return struct.unpack('>I', body[16:20])[0]
+	return struct.unpack('>I', body[8:12])[0]
+
+
+def read_decode_time(f, moof_offset, moof_size):
+	"""baseMediaDecodeTime of the first track fragment of a moof box."""
+	box = find_box(f, [b'traf', b'tfdt'], moof_offset + 8, moof_offset + moof_size)
+	if box is None:
+		return None
+	version, body = _read_full_box(f, box)
+	if version == 1:
+		return struct.unpack('>Q', body[:8])[0]
+	return struct.unpack('>I', body[:4])[0]
+
+
+def fragment_index(path):
+	"""Index a fragmented MP4 for byte-range addressing.
+
+	Returns (init_size, timescale, fragments) where init_size is the length of the ftyp+moov
+	header and fragments is a list of (offset, size, decode_time_seconds) covering each
+	moof+mdat pair.
+	"""
+	fragments = []
+	with open(path, 'rb') as f:
+		timescale = read_timescale(f) or 1
+		init_size = None
+		moof = None
+		for box_type, offset, size, header_size in iter_boxes(f):
+			if box_type == b'moof':
+				if init_size is None:
+					init_size = offset
+				decode_time = read_decode_time(f, offset, size)
+				moof = (offset, decode_time / timescale if decode_time is not None else None)
+			elif box_type == b'mdat' and moof is not None:
+				fragments.append((moof[0], offset + size - moof[0], moof[1]))
+				moof = None
+		if init_size is None:
+			f.seek(0, 2)
+			init_size = f.tell()
+	return init_size, timescale, fragments
+
+
+def complete_fragments(path):
+	"""Index the moof+mdat pairs already fully written to a fragmented MP4 that may still be growing.
+
+	Returns (timescale, data_start, fragments): data_start is where the first fragment begins (None
+	until the header is written), fragments as in fragment_index. Stops at the first box that extends
+	past the current end of the file, so it is safe while an encoder is appending to it.
+	"""
+	fragments = []
+	timescale = None
+	data_start = None
+	with open(path, 'rb') as f:
+		f.seek(0, 2)
+		end = f.tell()
+		moof = None
+		for box_type, offset, size, header_size in iter_boxes(f, 0, end):
+			if offset + size > end:
+				break
+			if box_type == b'moov':
+				timescale = read_timescale(f)
+				data_start = offset + size
+			elif box_type == b'moof':
+				decode_time = read_decode_time(f, offset, size)
+				moof = (offset, decode_time / (timescale or 1) if decode_time is not None else None)
+			elif box_type == b'mdat' and moof is not None:
+				fragments.append((moof[0], offset + size - moof[0], moof[1]))
+				moof = None
+	return timescale, data_start, fragments
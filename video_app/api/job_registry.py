@@ -0,0 +1,99 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from rq import Callback
+
+# Registry of queued and running transcode jobs: one Redis hash per output (video/resolution) mapping
+# job id -> "<status>:<unix ts>". Lookups are a single HGET/HGETALL instead of deserialising the
+# whole queue. Entries are removed by RQ callbacks when the job ends; running jobs refresh theirs
+# (touch_job) so entries of workers that died without callbacks go stale and are ignored.
+QUEUED = 'queued'
+STARTED = 'started'
+QUEUED_STALE_SECONDS = 60 * 60
+STARTED_STALE_SECONDS = 2 * 60
+REGISTRY_TTL = 24 * 60 * 60
+
+
+def _registry_key(video_id, resolution):
+	return cache.make_key(f"transcode_jobs_{video_id}_{resolution}")
+
+
+def _is_live(value, now):
+	status, _, ts = value.decode().partition(':')
+	limit = STARTED_STALE_SECONDS if status == STARTED else QUEUED_STALE_SECONDS
+	return now - float(ts) < limit
+
+
+def _set(video_id, resolution, job_id, status):
+	key = _registry_key(video_id, resolution)
+	pipe = get_redis_connection('default').pipeline(transaction=False)
+	pipe.hset(key, job_id, f"{status}:{time.time():.3f}")
+	pipe.expire(key, REGISTRY_TTL)
+	pipe.execute()
+
+
+def register_job(video_id, resolution, job_id):
+	try:
+		_set(video_id, resolution, job_id, QUEUED)
+	except Exception:
+		pass
+
+
+def touch_job(video_id, resolution, job_id):
+	"""Mark a job as running; long-running jobs call this periodically to stay registered."""
+	try:
+		_set(video_id, resolution, job_id, STARTED)
+	except Exception:
+		pass
+
+
+def unregister_job(video_id, resolution, job_id):
+	try:
+		get_redis_connection('default').hdel(_registry_key(video_id, resolution), job_id)
+	except Exception:
+		pass
+
+
+def is_job_active(video_id, resolution, job_id):
+	"""True if the job is queued or running for this output."""
+	try:
+		value = get_redis_connection('default').hget(_registry_key(video_id, resolution), job_id)
+		return value is not None and _is_live(value, time.time())
+	except Exception:
+		return False
+
+
+def active_jobs(video_id, resolution):
+	"""{job id: status} of the live jobs of an output; stale entries are removed."""
+	key = _registry_key(video_id, resolution)
+	redis = get_redis_connection('default')
+	now = time.time()
+	jobs, stale = {}, []
+	for job_id, value in redis.hgetall(key).items():
+		if _is_live(value, now):
+			jobs[job_id.decode()] = value.decode().partition(':')[0]
+		else:
+			stale.append(job_id)
+	if stale:
+		redis.hdel(key, *stale)
+	return jobs
+
+
+def _job_ended(job, *args):
+	"""RQ callback (success, failure and stop): drop the job from its output's registry."""
+	video_id, resolution = job.meta.get('output', (None, None))
+	if video_id is not None:
+		unregister_job(video_id, resolution, job.id)
+
+
+def enqueue_transcode_job(queue, func, video_id, resolution, *args, job_id=None, **kwargs):
+	"""Enqueue `func(video_id, resolution, *args)` and keep it in the output's registry until it ends."""
+	job_id = job_id or uuid.uuid4().hex
+	register_job(video_id, resolution, job_id)
+	return queue.enqueue(
+		func, video_id, resolution, *args, job_id=job_id, meta={'output': (video_id, resolution)},
+		on_success=Callback(_job_ended), on_failure=Callback(_job_ended), on_stopped=Callback(_job_ended),
+		**kwargs,
+	)
@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import time
+
+from django.conf import settings
+
+from video_app.api.fmp4 import complete_fragments
+from video_app.api.segment_plan import load_plan
+from video_app.api.transcode import generate_transcode_path
+
+# Low-Latency HLS for outputs a continuous encoder is writing (LL_HLS_ENABLED). In that mode the
+# encoder writes each segment file progressively as CMAF fragments of about LL_HLS_PART_TARGET_SECONDS
+# (see backends.start_continuous). While it runs, the playlist is an EVENT playlist ending at the
+# segment in progress: its fragments are listed as EXT-X-PART byte ranges of the segment file, followed
+# by a preload hint for the next one, so a player can start on the first fragment instead of waiting for
+# a whole segment. Once the encoder is gone the regular playlist is served again.
+POLL_INTERVAL = 0.1
+
+
+def _segment_path(output_dir, segment_number):
+	return os.path.join(output_dir, f"segment_{segment_number:03d}.mp4")
+
+
+def encoder_start(output_dir):
+	"""First segment of the continuous encoder writing `output_dir`, or None if none runs."""
+	try:
+		with open(os.path.join(output_dir, 'continuous.lock')) as lf:
+			return json.load(lf).get('segment')
+	except (OSError, ValueError):
+		return None
+
+
+def edge_segment(output_dir, start, segment_count):
+	"""Segment the encoder is writing: the first one after `start` whose successor does not exist yet."""
+	edge = start
+	while edge + 1 < segment_count and os.path.exists(_segment_path(output_dir, edge + 1)):
+		edge += 1
+	return edge
+
+
+def segment_parts(path, duration, complete):
+	"""([(offset, size, duration)], next_offset) of the parts of a segment file written so far.
+
+	A part lasts until the next fragment starts, so the newest fragment of a segment in progress is
+	only listed once its successor exists; the last part of a complete segment ends with the planned
+	`duration`. next_offset is where the next unlisted part starts (None before the header is written).
+	"""
+	if not os.path.exists(path):
+		return [], None
+	_timescale, data_start, fragments = complete_fragments(path)
+	parts = []
+	for i, (offset, size, decode_time) in enumerate(fragments):
+		if i + 1 < len(fragments):
+			part_duration = fragments[i + 1][2] - decode_time
+		elif complete:
+			part_duration = duration - (decode_time - fragments[0][2])
+		else:
+			break
+		parts.append((offset, size, part_duration))
+	next_offset = parts[-1][0] + parts[-1][1] if parts else data_start
+	return parts, next_offset
+
+
+def build_llhls_playlist(plan, edge, parts, next_offset, part_target):
+	"""LL-HLS media playlist: full segments before `edge`, parts of the segments in `parts` ({number: [(offset, size, duration)]}).
+
+	Segment `edge` is the one in progress: it only has parts, followed by a preload hint at
+	`next_offset` (omitted while unknown).
+	"""
+	m3u8_content = "#EXTM3U\n#EXT-X-VERSION:6\n"
+	m3u8_content += f"#EXT-X-TARGETDURATION:{math.ceil(max(d for _, d in plan))}\n"
+	m3u8_content += f"#EXT-X-PART-INF:PART-TARGET={part_target:.3f}\n"
+	m3u8_content += f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={part_target * 3:.3f}\n"
+	m3u8_content += "#EXT-X-MEDIA-SEQUENCE:0\n"
+	m3u8_content += "#EXT-X-MAP:URI=\"init.mp4\"\n"
+	m3u8_content += "#EXT-X-PLAYLIST-TYPE:EVENT\n"
+	for segment_number in range(edge + 1):
+		uri = f"segment_{segment_number:03d}.mp4"
+		m3u8_content += "#EXT-X-DISCONTINUITY\n"
+		for i, (offset, size, duration) in enumerate(parts.get(segment_number, [])):
+			independent = ",INDEPENDENT=YES" if i == 0 else ""
+			m3u8_content += f"#EXT-X-PART:DURATION={duration:.3f},URI=\"{uri}\",BYTERANGE=\"{size}@{offset}\"{independent}\n"
+		if segment_number < edge:
+			m3u8_content += f"#EXTINF:{plan[segment_number][1]:.3f},\n{uri}\n"
+	if next_offset is not None:
+		m3u8_content += f"#EXT-X-PRELOAD-HINT:TYPE=PART,URI=\"segment_{edge:03d}.mp4\",BYTERANGE-START={next_offset}\n"
+	return m3u8_content
+
+
+def llhls_playlist(video_id, resolution):
+	"""(playlist, edge, parts listed for the edge) while a continuous encoder writes the output, else None."""
+	plan = load_plan(video_id)
+	output_dir = generate_transcode_path(video_id, resolution)
+	start = encoder_start(output_dir)
+	if plan is None or start is None or start >= len(plan):
+		return None
+	edge = edge_segment(output_dir, start, len(plan))
+	parts = {}
+	# Parts of the last finished segment stay listed so players joining at the edge can use them
+	if edge > start:
+		parts[edge - 1], _ = segment_parts(_segment_path(output_dir, edge - 1), plan[edge - 1][1], complete=True)
+	parts[edge], next_offset = segment_parts(_segment_path(output_dir, edge), plan[edge][1], complete=False)
+	playlist = build_llhls_playlist(plan, edge, parts, next_offset, settings.LL_HLS_PART_TARGET_SECONDS)
+	return playlist, edge, len(parts[edge])
+
+
+def blocking_llhls_playlist(video_id, resolution, msn=None, part=None):
+	"""The LL-HLS playlist, held back until it contains part `part` of segment `msn` (_HLS_msn/_HLS_part).
+
+	Without `msn` it waits for the first fragment's byte offset to be known, so the preload hint
+	is there. Gives up after three part targets and returns what there is; None without an encoder.
+	"""
+	deadline = time.monotonic() + settings.LL_HLS_PART_TARGET_SECONDS * 3
+	while True:
+		result = llhls_playlist(video_id, resolution)
+		if result is None:
+			# Just submitted: give the encoder a moment to start unless the opening is already on disk
+			first = _segment_path(generate_transcode_path(video_id, resolution), 0)
+			if msn is None and not os.path.exists(first) and time.monotonic() < deadline:
+				time.sleep(POLL_INTERVAL)
+				continue
+			return None
+		playlist, edge, listed = result
+		if msn is None:
+			ready = "#EXT-X-PRELOAD-HINT" in playlist
+		else:
+			ready = edge > msn or (edge == msn and part is not None and listed > part)
+		if ready or time.monotonic() >= deadline:
+			return playlist
+		time.sleep(POLL_INTERVAL)
+
+
+def segment_in_progress(video_id, resolution, segment_number):
+	"""True while the continuous encoder is still appending to this segment file."""
+	output_dir = generate_transcode_path(video_id, resolution)
+	start = encoder_start(output_dir)
+	plan = load_plan(video_id)
+	if start is None or plan is None or not start <= segment_number < len(plan):
+		return False
+	return edge_segment(output_dir, start, len(plan)) == segment_number
+
+
+def wait_for_part(path, start, timeout):
+	"""Block until the fragment starting at byte `start` of a growing segment file is complete.
+
+	Returns its last byte offset, or None on timeout or if no fragment starts there.
+	"""
+	deadline = time.monotonic() + timeout
+	while True:
+		if os.path.exists(path):
+			_timescale, _data_start, fragments = complete_fragments(path)
+			for offset, size, _decode_time in fragments:
+				if offset == start:
+					return offset + size - 1
+			if fragments and fragments[-1][0] > start:
+				return None
+		if time.monotonic() >= deadline:
+			return None
+		time.sleep(POLL_INTERVAL)
+
+
+def wait_for_complete_segment(video_id, resolution, segment_number, timeout):
+	"""Block until the encoder moved past this segment (or is gone). Returns False on timeout."""
+	deadline = time.monotonic() + timeout
+	while segment_in_progress(video_id, resolution, segment_number):
+		if time.monotonic() >= deadline:
+			return False
+		time.sleep(POLL_INTERVAL)
+	return True
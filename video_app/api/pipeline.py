@@ -0,0 +1,306 @@
+import os
+import time
+import uuid
+
+import django_rq
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rq import Retry, get_current_job
+
+from video_app.models import Video, Preview, IngestStage, Thumbnail
+from video_app.api.dedupe import cached_hash_file, store_content_addressed
+from video_app.api.early_ingest import adopt_early_ingest, staged_preview, adopt_staged_preview, discard_early_ingest
+from video_app.api.transcode import (
+	probe_a_video, get_keyframes, get_thumbnail_from_video, generate_m3u8_file, preview_window, transcode_preview,
+)
+from video_app.api.trickplay import generate_trickplay
+from video_app.api.workers import apply_probe_info, deduplicate_video
+
+# Post-upload stages: name -> (stages it waits for, RQ queue). Stages without a path between them
+# run in parallel, so a slow or failing IMDb lookup never holds up the media work.
+STAGES = {
+	'probe': ((), 'default'),
+	'imdb': ((), 'default'),
+	'thumbnail': (('probe',), 'default'),
+	'preview': (('probe',), 'low'),
+	'keyframes': (('probe',), 'default'),
+	'playlist': (('keyframes',), 'default'),
+	'trickplay': (('probe',), 'low'),
+}
+
+
+class StageSkipped(Exception):
+	"""Raised by a stage that has nothing to do; the stage is recorded as skipped, not failed."""
+
+
+class StageFailed(Exception):
+	"""Raised by a stage whose worker reported an error instead of raising."""
+
+
+def descendants(names):
+	"""Every stage that depends, directly or indirectly, on one of `names`."""
+	found = set()
+	changed = True
+	while changed:
+		changed = False
+		for name, (deps, _queue) in STAGES.items():
+			if name not in found and any(dep in names or dep in found for dep in deps):
+				found.add(name)
+				changed = True
+	return found
+
+
+def prepare_stages(video_id, stages=None):
+	"""Reset the IngestStage rows of a run to pending. Returns {stage: job id} in dependency order."""
+	selected = set(stages or STAGES) | descendants(set(stages or STAGES))
+	run = uuid.uuid4().hex[:8]
+	job_ids = {name: f"ingest_{video_id}_{name}_{run}" for name in STAGES if name in selected}
+	for name, job_id in job_ids.items():
+		IngestStage.objects.update_or_create(video_id=video_id, name=name, defaults={
+			'status': IngestStage.StageStatus.PENDING, 'attempts': 0, 'job_id': job_id,
+			'started_at': None, 'finished_at': None, 'message': '',
+		})
+	return job_ids
+
+
+def unfinished_stages(video_id):
+	"""Stages of a video that did not succeed or get skipped (never run, failed or interrupted)."""
+	done = set(IngestStage.objects.filter(video_id=video_id, status__in=[
+		IngestStage.StageStatus.SUCCEEDED, IngestStage.StageStatus.SKIPPED,
+	]).values_list('name', flat=True))
+	return [name for name in STAGES if name not in done]
+
+
+def run_ingest_inline(video_id, stages=None):
+	"""Run the pipeline of a video in this process, stage after stage in dependency order.
+
+	Used by ingest_library, which parallelises across videos instead of across stages. A failed
+	stage is not retried; its dependents are skipped as in the RQ pipeline.
+	"""
+	names = list(prepare_stages(video_id, stages))
+	for name in names:
+		try:
+			run_ingest_stage(video_id, name)
+		except Exception:
+			pass
+	return {stage.name: stage for stage in IngestStage.objects.filter(video_id=video_id, name__in=names)}
+
+
+def title_from_filename(path):
+	return os.path.splitext(os.path.basename(path))[0].replace('_', ' ').replace('.', ' ').strip()
+
+
+def ingest_library_file(path, stages=None, move=False):
+	"""Process pool entry point of ingest_library: import one file and run its pipeline inline.
+
+	Files are identified by content hash, so a re-run resumes where the last one stopped: known
+	files only run their unfinished stages. Returns a summary dict for the throughput report.
+	"""
+	started = time.perf_counter()
+	summary = {'path': path, 'bytes': os.path.getsize(path), 'created': False, 'stages': {}}
+	content_hash = cached_hash_file(path)
+	video = Video.objects.filter(content_hash=content_hash).order_by('id').first()
+	if video is None:
+		name = store_content_addressed(path, content_hash, os.path.basename(path), copy=not move)
+		video = Video.objects.create(title=title_from_filename(path), video_file=name, content_hash=content_hash)
+		summary['created'] = True
+		todo = list(stages or STAGES)
+	else:
+		todo = [name for name in unfinished_stages(video.id) if not stages or name in stages]
+	summary['video_id'] = video.id
+
+	if todo:
+		for name, stage in run_ingest_inline(video.id, todo).items():
+			elapsed = stage.elapsed.total_seconds() if stage.elapsed else 0
+			summary['stages'][name] = (stage.status, elapsed, stage.message)
+	video.refresh_from_db()
+	summary['duration_seconds'] = video.duration.total_seconds() if video.duration else 0
+	summary['elapsed_seconds'] = time.perf_counter() - started
+	return summary
+
+
+def start_ingest(video_id, stages=None):
+	"""Queue the post-upload pipeline of a video as RQ jobs linked with depends_on.
+
+	`stages` limits the run to those stages and everything downstream of them (e.g. to retry
+	failed ones); stages outside the run are treated as done. Jobs are enqueued once the current
+	transaction commits, so workers never see a video that is not saved yet.
+	"""
+	job_ids = prepare_stages(video_id, stages)
+
+	def enqueue():
+		jobs = {}
+		# STAGES is listed in dependency order, so parents are always enqueued first
+		for name, job_id in job_ids.items():
+			deps, queue = STAGES[name]
+			jobs[name] = django_rq.get_queue(queue).enqueue(
+				run_ingest_stage, video_id, name,
+				job_id=job_id,
+				depends_on=[jobs[dep] for dep in deps if dep in jobs] or None,
+				retry=Retry(max=settings.INGEST_STAGE_RETRIES) if settings.INGEST_STAGE_RETRIES else None,
+			)
+
+	# robust: a Redis outage must not turn an already committed admin save into an error page
+	transaction.on_commit(enqueue, robust=True)
+	return job_ids
+
+
+def _finish(stage_id, status, message=''):
+	IngestStage.objects.filter(pk=stage_id).update(status=status, finished_at=timezone.now(), message=message[:2000])
+
+
+def skip_stages(video_id, names, reason):
+	IngestStage.objects.filter(
+		video_id=video_id, name__in=names, status=IngestStage.StageStatus.PENDING,
+	).update(status=IngestStage.StageStatus.SKIPPED, message=reason)
+
+
+def run_ingest_stage(video_id, name):
+	"""RQ worker: run one pipeline stage and record its status, timing and attempts.
+
+	Failures are re-raised so RQ retries the job (INGEST_STAGE_RETRIES) and holds back the
+	dependent jobs; after the last attempt everything downstream is marked skipped.
+	"""
+	stage = IngestStage.objects.filter(video_id=video_id, name=name).first()
+	if stage is None or stage.status == IngestStage.StageStatus.SKIPPED:
+		return "Skipped"
+	IngestStage.objects.filter(pk=stage.pk).update(
+		status=IngestStage.StageStatus.RUNNING, attempts=F('attempts') + 1,
+		started_at=timezone.now(), finished_at=None, message='',
+	)
+	try:
+		video = Video.objects.get(pk=video_id)
+		message = STAGE_FUNCTIONS[name](video) or ''
+	except StageSkipped as e:
+		_finish(stage.pk, IngestStage.StageStatus.SKIPPED, str(e))
+		skip_stages(video_id, descendants({name}), f"{name} was skipped")
+		return f"Skipped: {e}"
+	except Exception as e:
+		job = get_current_job()
+		if job is not None and job.retries_left:
+			_finish(stage.pk, IngestStage.StageStatus.PENDING, f"Retrying after: {e}")
+		else:
+			_finish(stage.pk, IngestStage.StageStatus.FAILED, str(e))
+			skip_stages(video_id, descendants({name}), f"{name} failed")
+		raise
+	_finish(stage.pk, IngestStage.StageStatus.SUCCEEDED, message)
+	return message
+
+
+def _set_thumbnail(video, path):
+	"""Record a generated thumbnail and point the video at it, unless IMDb already set one."""
+	Thumbnail.objects.create(video=video, image=path)
+	site_url = os.getenv('SITE_URL', default='http://localhost:8000')
+	app_url = site_url + 'api/thumbnail/video_' + str(video.id)
+	Video.objects.filter(Q(thumbnail_url='') | Q(thumbnail_url__isnull=True), pk=video.pk).update(
+		poster_url=app_url + '/' + 'thumbnail.jpg', thumbnail_url=app_url + '/' + 'thumbnail.jpg',
+	)
+
+
+def ingest_probe(video):
+	"""Content hash (linking duplicates), ffprobe metadata and adoption of early-ingest results."""
+	duplicate_of = deduplicate_video(video)
+	if duplicate_of:
+		discard_early_ingest(content_hash=video.content_hash)
+		skip_stages(video.id, descendants({'probe'}), f"same content as video {duplicate_of.id}, outputs linked")
+		return f"Duplicate of video {duplicate_of.id}"
+
+	info = probe_a_video(video.video_file.path)
+	if apply_probe_info(video, info):
+		video.save(update_fields=['codec', 'audio_codec', 'resolution', 'duration'])
+
+	thumbnail = adopt_early_ingest(video)
+	if thumbnail:
+		_set_thumbnail(video, thumbnail)
+	return f"{info.get('width')}x{info.get('height')} {info.get('video_codec')}, {info.get('duration_seconds')}s"
+
+
+def ingest_imdb(video):
+	from video_app.api.scripts import fetch_and_fill_imdb_metadata
+
+	if not video.imdb_id:
+		raise StageSkipped("No IMDb id")
+	video, data = fetch_and_fill_imdb_metadata(video)
+	video.save(update_fields=['title', 'description', 'poster_url', 'release_year', 'type', 'category'])
+	if video.poster_url:
+		# Same rule as before: the IMDb poster doubles as thumbnail unless one is already set
+		Video.objects.filter(Q(thumbnail_url='') | Q(thumbnail_url__isnull=True), pk=video.pk).update(thumbnail_url=video.poster_url)
+	return f"{data.get('title') or data.get('Title')} ({data.get('year') or data.get('Year')})"
+
+
+def ingest_thumbnail(video):
+	if video.thumbnail_url:
+		raise StageSkipped("Thumbnail already set")
+	path = get_thumbnail_from_video(video.id)
+	if not path:
+		raise StageFailed("No thumbnail could be extracted")
+	_set_thumbnail(video, path)
+	return path
+
+
+def ingest_preview(video):
+	"""Create or reset the Preview and encode it, or adopt the one staged by early ingest."""
+	try:
+		info = probe_a_video(video.video_file.path)
+		start_offset, preview_duration = preview_window(info.get('duration_seconds') or 0)
+		preview, created = Preview.objects.get_or_create(
+			video=video,
+			defaults={
+				'preview_duration': preview_duration,
+				'start_offset': start_offset,
+				'status': Preview.PreviewStatus.PENDING,
+			}
+		)
+		if not created:
+			# Video file was replaced, reset preview
+			preview.preview_duration = preview_duration
+			preview.start_offset = start_offset
+			preview.status = Preview.PreviewStatus.PENDING
+			preview.is_transcoded = False
+			preview.error_message = None
+			preview.save()
+
+		if adopt_staged_preview(preview, staged_preview(video, info)):
+			return f"Preview {preview.id} adopted from early ingest"
+		result = transcode_preview(preview.id)
+		if result != "Success":
+			raise StageFailed(result)
+		return f"Preview {preview.id} encoded"
+	finally:
+		# Last consumer of the staged early-ingest results
+		discard_early_ingest(content_hash=video.content_hash)
+
+
+def ingest_keyframes(video):
+	keyframes = get_keyframes(video.video_file.path)
+	if not keyframes:
+		raise StageFailed("No keyframes found")
+	return f"{len(keyframes)} keyframes"
+
+
+def ingest_playlist(video):
+	m3u8_path = os.path.join(f"media/index/video_{video.id}/", 'index.m3u8')
+	result = generate_m3u8_file(m3u8_path, video.id)
+	if not result.startswith("#EXTM3U"):
+		raise StageFailed(result)
+	return m3u8_path
+
+
+def ingest_trickplay(video):
+	result = generate_trickplay(video.id)
+	if result != "Success":
+		raise StageFailed(result)
+	return result
+
+
+STAGE_FUNCTIONS = {
+	'probe': ingest_probe,
+	'imdb': ingest_imdb,
+	'thumbnail': ingest_thumbnail,
+	'preview': ingest_preview,
+	'keyframes': ingest_keyframes,
+	'playlist': ingest_playlist,
+	'trickplay': ingest_trickplay,
+}
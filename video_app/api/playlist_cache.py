@@ -0,0 +1,131 @@
+import gzip
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+# Served media playlists, per video and resolution, in two tiers: a dict in each web process in
+# front of a shared copy in Redis. Each entry carries the body, its gzipped form and the video's
+# playlist version, a counter in Redis bumped whenever anything a playlist is built from changes
+# (index.m3u8 regenerated, an output compacted or removed). The bump is published on a channel; every
+# process listens to it in a background thread and drops its copies of that video, so a local hit
+# needs no Redis round trip. Local entries are still re-checked against the version every
+# PLAYLIST_LOCAL_TTL_SECONDS in case a message was missed.
+INVALIDATION_CHANNEL = "playlist_invalidations"
+LISTEN_RETRY_SECONDS = 5
+GZIP_LEVEL = 6
+
+# (video_id, resolution) -> {'version', 'body', 'gzip', 'checked_at'}
+_local = {}
+_local_lock = threading.Lock()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _version_key(video_id):
+	# Raw Redis keys: prefix them like cache keys so test and production data stay apart
+	return cache.make_key(f"playlist_version_{video_id}")
+
+
+def _channel():
+	return cache.make_key(INVALIDATION_CHANNEL)
+
+
+def _entry_key(video_id, resolution):
+	return f"playlist_{video_id}_{resolution}"
+
+
+def _drop_local(video_id=None):
+	with _local_lock:
+		for key in [k for k in _local if video_id is None or k[0] == video_id]:
+			del _local[key]
+
+
+def _listen():
+	"""Drop local copies of the videos announced on the invalidation channel; runs forever in a daemon thread."""
+	connected = True
+	while True:
+		try:
+			pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+			pubsub.subscribe(_channel())
+			# Messages sent while not subscribed are lost: start over from the shared tier
+			_drop_local()
+			connected = True
+			for message in pubsub.listen():
+				try:
+					_drop_local(int(message['data']))
+				except (TypeError, ValueError):
+					pass
+		except Exception as e:
+			if connected:
+				print(f"Playlist invalidation listener disconnected: {e}")
+			connected = False
+		time.sleep(LISTEN_RETRY_SECONDS)
+
+
+def _ensure_listener():
+	global _listener
+	if _listener is not None:
+		return
+	with _listener_lock:
+		if _listener is None:
+			_listener = threading.Thread(target=_listen, name='playlist-invalidation', daemon=True)
+			_listener.start()
+
+
+def playlist_version(video_id):
+	return int(get_redis_connection('default').get(_version_key(video_id)) or 0)
+
+
+def invalidate_playlists(*video_ids):
+	"""Bump the playlist version of videos and tell every process to drop its copies; errors are ignored."""
+	for video_id in video_ids:
+		_drop_local(video_id)
+	try:
+		pipe = get_redis_connection('default').pipeline(transaction=False)
+		for video_id in video_ids:
+			pipe.incr(_version_key(video_id))
+			pipe.publish(_channel(), str(video_id))
+		pipe.execute()
+	except Exception:
+		pass
+
+
+def get_playlist(video_id, resolution, build):
+	"""(body, gzipped body) of an output's playlist from the local tier, Redis or `build()`.
+
+	`build` returns the playlist text; anything else (an error message) is passed through
+	uncached with a gzipped body of None.
+	"""
+	_ensure_listener()
+	key = (video_id, resolution)
+	now = time.monotonic()
+	entry = _local.get(key)
+	if entry and now - entry['checked_at'] < settings.PLAYLIST_LOCAL_TTL_SECONDS:
+		return entry['body'], entry['gzip']
+
+	try:
+		version = playlist_version(video_id)
+	except Exception:
+		version = None
+	if not (entry and entry['version'] == version):
+		try:
+			entry = cache.get(_entry_key(video_id, resolution))
+		except Exception:
+			entry = None
+		if not (entry and entry['version'] == version):
+			# Read the version before building: a change made meanwhile bumps it and outdates this entry
+			body = build()
+			if not body or not body.startswith("#EXTM3U"):
+				return body, None
+			entry = {'version': version, 'body': body, 'gzip': gzip.compress(body.encode(), GZIP_LEVEL)}
+			if version is not None:
+				try:
+					cache.set(_entry_key(video_id, resolution), entry, timeout=settings.PLAYLIST_CACHE_TIMEOUT)
+				except Exception:
+					pass
+	with _local_lock:
+		_local[key] = dict(entry, checked_at=now)
+	return entry['body'], entry['gzip']
@@ -0,0 +1,213 @@
+import collections
+import json
+import subprocess
+import threading
+import time
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+# Outputs that get a progress record besides the HLS resolutions.
+PROGRESS_OUTPUTS = ('360p', '480p', '720p', '1080p', '2160p', 'preview', 'thumbnail', 'trickplay')
+PROGRESS_TIMEOUT = 60 * 60
+
+# Progress records live in one Redis hash per output (video/output), one field per encoder job, so a
+# continuous encode and a one-off segment encode of the same output do not overwrite each other. The
+# field is the record's job_id (continuous encodes), else the file it writes (segment_NNN.mp4, init.mp4)
+# or its preview_id, else 'default'. A job's field is removed with its final ('end') record, or when
+# its ffmpeg run ends without one, so only running jobs are listed. The hash expires PROGRESS_TIMEOUT
+# after the last record.
+DEFAULT_JOB = 'default'
+
+
+def _progress_key(video_id, output):
+	return cache.make_key(f"progress_{video_id}_{output}")
+
+
+def _job_of(data):
+	return str(data.get('job_id') or data.get('segment') or data.get('preview_id') or DEFAULT_JOB)
+
+
+def with_progress(cmd):
+	"""Return the ffmpeg command with machine readable progress written to stdout."""
+	if '-progress' in cmd:
+		return list(cmd)
+	return [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+
+
+def _to_float(value, suffix=''):
+	try:
+		value = value.strip()
+		if suffix and value.endswith(suffix):
+			value = value[:-len(suffix)]
+		return float(value)
+	except (AttributeError, ValueError):
+		return None
+
+
+def parse_progress_block(raw):
+	"""Normalize one `-progress` key=value block into numbers.
+
+	Returns dict with 'frame', 'fps', 'bitrate_kbps', 'total_size', 'out_time_seconds',
+	'speed' (x realtime) and 'state' ('continue' or 'end'). Missing values are None.
+	"""
+	out_time_us = raw.get('out_time_us') or raw.get('out_time_ms')  # out_time_ms is microseconds too
+	out_time = _to_float(out_time_us)
+	frame = _to_float(raw.get('frame'))
+	total_size = _to_float(raw.get('total_size'))
+	return {
+		'frame': int(frame) if frame is not None else None,
+		'fps': _to_float(raw.get('fps')),
+		'bitrate_kbps': _to_float(raw.get('bitrate'), 'kbits/s'),
+		'total_size': int(total_size) if total_size is not None else None,
+		'out_time_seconds': out_time / 1_000_000 if out_time is not None and out_time >= 0 else None,
+		'speed': _to_float(raw.get('speed'), 'x'),
+		'state': raw.get('progress'),
+	}
+
+
+def publish_progress(video_id, output, data):
+	"""Store a progress record under its job (see _job_of), or remove the job on its 'end' record; errors are ignored."""
+	key = _progress_key(video_id, output)
+	try:
+		pipe = get_redis_connection('default').pipeline(transaction=False)
+		if data.get('state') == 'end':
+			pipe.hdel(key, _job_of(data))
+		else:
+			pipe.hset(key, _job_of(data), json.dumps(data))
+			pipe.expire(key, PROGRESS_TIMEOUT)
+		pipe.execute()
+	except Exception:
+		pass
+
+
+def _job_records(video_id, output):
+	return {
+		job.decode(): json.loads(value)
+		for job, value in get_redis_connection('default').hgetall(_progress_key(video_id, output)).items()
+	}
+
+
+def get_progress(video_id, output, job=None):
+	"""Latest progress record of one job of an output, or None.
+
+	With job=None the most recently updated record of any job of the output.
+	"""
+	try:
+		if job is not None:
+			value = get_redis_connection('default').hget(_progress_key(video_id, output), str(job))
+			return json.loads(value) if value is not None else None
+		records = _job_records(video_id, output)
+	except Exception:
+		return None
+	return max(records.values(), key=lambda data: data.get('ts') or 0, default=None)
+
+
+def get_video_progress(video_id):
+	"""All known progress records of a video: {output: {job: record}}."""
+	progress = {}
+	try:
+		for output in PROGRESS_OUTPUTS:
+			records = _job_records(video_id, output)
+			if records:
+				progress[output] = records
+	except Exception:
+		pass
+	return progress
+
+
+def clear_progress(video_id, output, job=None):
+	"""Remove the record of one job of an output, or with job=None all of them."""
+	try:
+		if job is not None:
+			get_redis_connection('default').hdel(_progress_key(video_id, output), str(job))
+		else:
+			get_redis_connection('default').delete(_progress_key(video_id, output))
+	except Exception:
+		pass
+
+
+def _read_progress(stream, video_id, output, extra):
+	"""Parse `-progress` blocks as ffmpeg writes them and publish each completed block."""
+	block = {}
+	started = time.time()
+	for line in stream:
+		key, sep, value = line.strip().partition('=')
+		if not sep:
+			continue
+		block[key] = value
+		if key != 'progress':
+			continue
+		data = parse_progress_block(block)
+		data.update(extra)
+		if data.get('start_seconds') is not None and data['out_time_seconds'] is not None:
+			data['position_seconds'] = data['start_seconds'] + data['out_time_seconds']
+		data['elapsed_seconds'] = round(time.time() - started, 3)
+		data['ts'] = time.time()
+		publish_progress(video_id, output, data)
+		block = {}
+
+
+def _drain(stream, lines):
+	for line in stream:
+		lines.append(line)
+
+
+def popen_ffmpeg(cmd, video_id, output, **extra):
+	"""Start ffmpeg with progress telemetry published for (video_id, output).
+
+	stdout carries the progress blocks, stderr is drained in the background so a chatty
+	encoder can never block on a full pipe; use `ffmpeg_stderr(proc)` to get its tail.
+	Keyword arguments (e.g. job_id, start_seconds) are stored with every progress record.
+	"""
+	proc = subprocess.Popen(with_progress(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+	proc.stderr_lines = collections.deque(maxlen=200)
+	proc.output_threads = [
+		threading.Thread(target=_read_progress, args=(proc.stdout, video_id, output, extra), daemon=True),
+		threading.Thread(target=_drain, args=(proc.stderr, proc.stderr_lines), daemon=True),
+	]
+	for t in proc.output_threads:
+		t.start()
+	return proc
+
+
+def ffmpeg_stderr(proc, timeout=1):
+	"""Return the last lines ffmpeg wrote to stderr once its pipes are closed."""
+	for t in getattr(proc, 'output_threads', []):
+		t.join(timeout)
+	return ''.join(getattr(proc, 'stderr_lines', []))
+
+
+def run_ffmpeg(cmd, video_id, output, timeout=None, **extra):
+	"""subprocess.run() replacement for ffmpeg that publishes live progress.
+
+	Returns a CompletedProcess whose stderr holds the tail of ffmpeg's log.
+	Raises subprocess.TimeoutExpired like subprocess.run() does.
+	"""
+	proc = popen_ffmpeg(cmd, video_id, output, **extra)
+	try:
+		proc.wait(timeout=timeout)
+	except subprocess.TimeoutExpired:
+		proc.kill()
+		proc.wait()
+		raise
+	finally:
+		stderr = ffmpeg_stderr(proc)
+		# A run that crashed or was killed never wrote its 'end' record
+		clear_progress(video_id, output, job=_job_of(extra))
+	return subprocess.CompletedProcess(proc.args, proc.returncode, '', stderr)
+
+
+def format_progress(data):
+	"""Short human readable summary of a progress record for the admin."""
+	parts = [data.get('state') or 'running']
+	if data.get('speed') is not None:
+		parts.append(f"{data['speed']:.2f}x realtime")
+	if data.get('fps') is not None:
+		parts.append(f"{data['fps']:.0f} fps")
+	if data.get('bitrate_kbps') is not None:
+		parts.append(f"{data['bitrate_kbps']:.0f} kbit/s")
+	position = data.get('position_seconds', data.get('out_time_seconds'))
+	if position is not None:
+		parts.append(time.strftime('%H:%M:%S', time.gmtime(position)) + ' encoded')
+	return ', '.join(parts)
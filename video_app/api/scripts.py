@@ -9,7 +9,7 @@ def get_m3u8_file(m3u8_path, video_id, recreate_file=False):
     
     try: 
         cached_m3u8 = cache.get(cache_key)
-        if cached_m3u8 and not recreate_file:
+        if cached_m3u8 and cached_m3u8.startswith("#EXTM3U") and not recreate_file:
             return cached_m3u8
         if os.path.exists(m3u8_path) and not recreate_file:
             with open(m3u8_path, 'r') as f:
@@ -18,7 +18,11 @@ def get_m3u8_file(m3u8_path, video_id, recreate_file=False):
                 return m3u8_content
         else:
             created_m3u8 = generate_m3u8_file(m3u8_path, video_id)
-            cache.set(cache_key, created_m3u8, timeout=60*60)  # Cache for 1 hour
+            # Only playlists are cached: an error or a "Failed ..." (e.g. encoders still busy) is retried by the next request
+            if created_m3u8.startswith("#EXTM3U"):
+                cache.set(cache_key, created_m3u8, timeout=60*60)  # Cache for 1 hour
+            else:
+                cache.delete(cache_key)
             return created_m3u8
     except Exception as e:
         print(f"Error reading or creating M3U8 file: {e}")
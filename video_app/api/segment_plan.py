@@ -0,0 +1,83 @@
+import bisect
+import json
+import os
+
+from django.conf import settings
+
+# The segment plan of a video: [(start, duration)] in seconds, one entry per HLS segment, stored as
+# segments.json next to index.m3u8. The playlist's #EXTINF values, the segment encoder's cut points
+# and the keyframes forced by the continuous encoder all come from it, so they always agree.
+PLAN_FILE = 'segments.json'
+
+# Process-local copies of loaded plans: path -> (mtime, segments)
+_plans = {}
+
+
+def plan_segments(keyframes, duration, target=None, ramp=None):
+	"""Group source keyframes into segments of about `target` seconds. Returns [(start, duration)].
+
+	Each cut is made at the source keyframe closest to `target` seconds after the previous one,
+	looking half a target either way; a segment then starts on a source keyframe and seeking to
+	it decodes nothing before it. Without a keyframe in that window (long GOPs) the cut is made at
+	exactly `target`, the encoders force a keyframe there anyway. The last segment is never
+	shorter than half a target.
+
+	The opening segments follow the startup `ramp` (HLS_STARTUP_RAMP, e.g. 1, 2 and 4 seconds)
+	instead, so the first segment a player needs is encoded after a second of source.
+	"""
+	target = float(target or settings.HLS_SEGMENT_TARGET_SECONDS)
+	ramp = [float(r) for r in (settings.HLS_STARTUP_RAMP if ramp is None else ramp)]
+	duration = float(duration)
+	candidates = sorted(k for k in keyframes if 0 < k < duration)
+	cuts = [0.0]
+	while True:
+		length = ramp[len(cuts) - 1] if len(cuts) <= len(ramp) else target
+		if duration - cuts[-1] <= length * 1.5:
+			break
+		ideal = cuts[-1] + length
+		low = bisect.bisect_left(candidates, cuts[-1] + length * 0.5)
+		high = bisect.bisect_right(candidates, min(cuts[-1] + length * 1.5, duration - length * 0.5))
+		window = candidates[low:high]
+		cuts.append(round(min(window, key=lambda k: abs(k - ideal)) if window else ideal, 6))
+	return [(start, round(end - start, 6)) for start, end in zip(cuts, cuts[1:] + [duration])]
+
+
+def plan_path(video_id):
+	return os.path.join(f"media/index/video_{video_id}/", PLAN_FILE)
+
+
+def write_plan(video_id, segments, target, ramp=()):
+	path = plan_path(video_id)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path + '.tmp', 'w') as f:
+		json.dump({'target': target, 'ramp': list(ramp), 'segments': segments}, f)
+	os.replace(path + '.tmp', path)
+
+
+def load_plan(video_id):
+	"""The segment plan of a video, or None for playlists generated before plans existed."""
+	path = plan_path(video_id)
+	try:
+		mtime = os.path.getmtime(path)
+	except OSError:
+		return None
+	cached = _plans.get(path)
+	if cached and cached[0] == mtime:
+		return cached[1]
+	with open(path) as f:
+		segments = [tuple(s) for s in json.load(f)['segments']]
+	_plans[path] = (mtime, segments)
+	return segments
+
+
+def segment_bounds(video_id, segment_number):
+	"""(start, duration) of a segment from the plan, or None without a plan."""
+	plan = load_plan(video_id)
+	if plan is None or not 0 <= segment_number < len(plan):
+		return None
+	return plan[segment_number]
+
+
+def segment_at(segments, seconds):
+	"""Number of the planned segment containing `seconds`."""
+	return max(0, bisect.bisect_right([start for start, _ in segments], seconds) - 1)
@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from video_app.models import ChunkedUpload
+
 
 class TranscodeRequestSerializer(serializers.Serializer):
     codec = serializers.ChoiceField(choices=['h264', 'h265'], required=False, allow_null=True)
@@ -101,4 +104,23 @@ class PreviewSerializer(serializers.Serializer):
     status = serializers.CharField(read_only=True)
     is_transcoded = serializers.BooleanField(read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
-    updated_at = serializers.DateTimeField(read_only=True)
\ No newline at end of file
+    updated_at = serializers.DateTimeField(read_only=True)
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    """Serializer for resumable uploads; clients only send filename and total_size."""
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'filename', 'total_size', 'offset', 'status', 'content_hash', 'chunk_size', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'offset', 'status', 'content_hash', 'created_at', 'updated_at']
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('File is empty.')
+        return value
+
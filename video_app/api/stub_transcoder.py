@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+
+from video_app.api.transcode import generate_transcode_path, get_heartbeat, lock_a_file, get_rid_of_lockfile
+
+
+class StubTranscoder:
+	"""Drop-in replacement for the ffmpeg entry points that writes fake segments after a delay.
+
+	Used by the HLS load harness to exercise the request path (playlist, worker start/stop,
+	waiting, heartbeats) without spending CPU on real encodes. It mirrors the signatures of
+	generate_m3u8_file, transcode_video_segment and transcode_continuously.
+	"""
+
+	def __init__(self, segments=120, segment_duration=5.0, segment_delay=0.5, startup_delay=1.0, segment_bytes=64 * 1024):
+		self.segments = segments
+		self.segment_duration = segment_duration
+		self.segment_delay = segment_delay
+		self.startup_delay = startup_delay
+		self.segment_bytes = segment_bytes
+		self.stop_event = threading.Event()
+		self._lock = threading.Lock()
+		self.running = 0
+		self.max_running = 0
+		self.started = []  # (kind, video_id, resolution, segment_name, worker_id)
+
+	def _track(self, kind, video_id, resolution, segment_name, worker_id):
+		with self._lock:
+			self.started.append((kind, video_id, resolution, segment_name, worker_id))
+			self.running += 1
+			self.max_running = max(self.max_running, self.running)
+
+	def _untrack(self):
+		with self._lock:
+			self.running -= 1
+
+	def _write(self, path):
+		tmp = f"{path}.{threading.get_ident()}.part"
+		with open(tmp, 'wb') as f:
+			f.write(b'\0' * self.segment_bytes)
+		os.replace(tmp, path)
+
+	def generate_m3u8_file(self, m3u8_path, video_id):
+		os.makedirs(os.path.dirname(m3u8_path), exist_ok=True)
+		m3u8_content = "#EXTM3U\n#EXT-X-VERSION:6\n#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-MAP:URI=\"init.mp4\"\n"
+		m3u8_content += "#EXT-X-PLAYLIST-TYPE:EVENT\n"
+		m3u8_content += f"#EXT-X-TARGETDURATION:{int(self.segment_duration) + 1}\n"
+		for i in range(self.segments):
+			m3u8_content += f"#EXTINF:{self.segment_duration:.3f},\nsegment_{i:03d}.mp4\n"
+		m3u8_content += "#EXT-X-ENDLIST\n"
+		with open(m3u8_path, 'w') as f:
+			f.write(m3u8_content)
+		return m3u8_content
+
+	def transcode_video_segment(self, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, preset=None, timeout=None):
+		output_dir = generate_transcode_path(video_id, resolution)
+		os.makedirs(output_dir, exist_ok=True)
+		output_path = os.path.join(output_dir, segment_name)
+		lockfile = output_path + "lockfile.lock"
+		if not lock_a_file(lockfile):
+			return "Failed to acquire lock for segment transcoding. Transcoding is already in progress."
+		self._track('segment', video_id, resolution, segment_name, None)
+		try:
+			time.sleep(self.startup_delay if segment_name == 'init.mp4' else self.segment_delay)
+			self._write(output_path)
+			return "Success"
+		finally:
+			self._untrack()
+			get_rid_of_lockfile(lockfile)
+
+	def transcode_continuously(self, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=None):
+		output_dir = generate_transcode_path(video_id, resolution)
+		os.makedirs(output_dir, exist_ok=True)
+		continuous_lock = os.path.join(output_dir, 'continuous.lock')
+		segment = int(segment_name.split('_')[1].split('.')[0])
+		with open(continuous_lock, 'w') as lf:
+			json.dump({'pid': None, 'worker_id': worker_id, 'segment': segment}, lf)
+
+		self._track('continuous', video_id, resolution, segment_name, worker_id)
+		try:
+			time.sleep(self.startup_delay)
+			if not os.path.exists(os.path.join(output_dir, 'init.mp4')):
+				self._write(os.path.join(output_dir, 'init.mp4'))
+			while segment < self.segments and not self.stop_event.is_set():
+				if not os.path.exists(continuous_lock):
+					return "Killed"
+				heartbeat = get_heartbeat(video_id, resolution) or {}
+				if segment - heartbeat.get('segment', 0) >= 40:
+					time.sleep(self.segment_delay)
+					continue
+				path = os.path.join(output_dir, f"segment_{segment:03d}.mp4")
+				if not os.path.exists(path):
+					time.sleep(self.segment_delay)
+					self._write(path)
+				segment += 1
+			return "Success"
+		finally:
+			self._untrack()
+			try:
+				get_rid_of_lockfile(continuous_lock)
+			except Exception:
+				pass
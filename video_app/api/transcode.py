@@ -1,34 +1,107 @@
 import os
 import json
+import django
 from django.apps import apps
 import subprocess
 import time
 import psutil
+import shutil
+import hashlib
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+from django.conf import settings
 from django.core.cache import cache
+from django_redis import get_redis_connection
+from rq import get_current_job
 
 from video_app.models import Video
+from video_app.api.progress import ffmpeg_stderr, get_progress, clear_progress
+from video_app.api.backends import get_backend, TranscodeError
+from video_app.api.job_registry import touch_job
+from video_app.api.segment_plan import plan_segments, write_plan, load_plan, segment_bounds, segment_at
+from video_app.api.playlist_cache import invalidate_playlists
 
 # Heartbeat helpers ---------------------------------------------------------
+# One Redis hash per output (video/resolution): a "p:<viewer>" field per viewer holding
+# "<segment>:<unix ts>" of their last request, plus ACCESS_FIELD / HITS_FIELD for cache eviction.
+# The hash expires HEARTBEAT_TTL_SECONDS after the last write, so idle outputs leave nothing behind.
+ACCESS_FIELD = '_access'
+HITS_FIELD = '_hits'
+# Playheads older than this are dropped from the hash when it is read
+STALE_VIEWER_SECONDS = 60 * 60
+
+def _redis():
+	return get_redis_connection('default')
+
 def _heartbeat_key(video_id, resolution):
-	return f"heartbeat_{video_id}_{resolution}"
+	return cache.make_key(f"heartbeat_{video_id}_{resolution}")
+
+def queue_heartbeat(pipe, video_id, resolution, viewer, segment_number, ts=None, hits=1):
+	"""Queue on a Redis pipeline: a viewer's playhead, the output's access time and hit count, and the TTL."""
+	key = _heartbeat_key(video_id, resolution)
+	ts = ts or time.time()
+	pipe.hset(key, mapping={f"p:{viewer}": f"{int(segment_number)}:{ts:.3f}", ACCESS_FIELD: f"{ts:.3f}"})
+	if hits:
+		pipe.hincrby(key, HITS_FIELD, hits)
+	pipe.expire(key, settings.HEARTBEAT_TTL_SECONDS)
+
+def set_heartbeat(video_id, resolution, segment_number, viewer=''):
+	"""Record a viewer's last requested segment right away (the views coalesce theirs, see viewing_stats.record_view)."""
+	try:
+		pipe = _redis().pipeline(transaction=False)
+		queue_heartbeat(pipe, video_id, resolution, viewer, segment_number)
+		pipe.execute()
+	except Exception:
+		pass
 
-def set_heartbeat(video_id, resolution, segment_number):
-	"""Set the last requested segment number and timestamp for a video/resolution."""
+def get_transcode_access(video_id, resolution):
+	"""Return (last_access_ts, hits) for a transcoded output. Unknown values are None / 0."""
 	try:
-		cache.set(_heartbeat_key(video_id, resolution), {'segment': int(segment_number), 'ts': time.time()}, timeout=None)
+		access, hits = _redis().hmget(_heartbeat_key(video_id, resolution), [ACCESS_FIELD, HITS_FIELD])
+		return (float(access) if access else None), int(hits or 0)
+	except Exception:
+		return None, 0
+
+def clear_transcode_access(video_id, resolution):
+	try:
+		_redis().hdel(_heartbeat_key(video_id, resolution), ACCESS_FIELD, HITS_FIELD)
 	except Exception:
 		pass
 
 def get_heartbeat(video_id, resolution):
+	"""{'segment', 'ts', 'viewers'} of an output: the furthest playhead and the latest request of its recent viewers.
+
+	Playheads older than STALE_VIEWER_SECONDS are pruned. None if nobody watched recently.
+	"""
 	try:
-		return cache.get(_heartbeat_key(video_id, resolution))
+		key = _heartbeat_key(video_id, resolution)
+		fields = _redis().hgetall(key)
+		now = time.time()
+		playheads, stale = [], []
+		for field, value in fields.items():
+			if not field.startswith(b'p:'):
+				continue
+			segment, _, ts = value.decode().partition(':')
+			if now - float(ts) > STALE_VIEWER_SECONDS:
+				stale.append(field)
+			else:
+				playheads.append((int(segment), float(ts)))
+		if stale:
+			_redis().hdel(key, *stale)
+		if not playheads:
+			return None
+		return {'segment': max(p[0] for p in playheads), 'ts': max(p[1] for p in playheads), 'viewers': len(playheads)}
 	except Exception:
 		return None
 
 def clear_heartbeat(video_id, resolution):
+	"""Forget the playheads of an output; its access time and hit count stay for eviction."""
 	try:
-		cache.delete(_heartbeat_key(video_id, resolution))
+		key = _heartbeat_key(video_id, resolution)
+		viewers = [field for field in _redis().hkeys(key) if field.startswith(b'p:')]
+		if viewers:
+			_redis().hdel(key, *viewers)
 	except Exception:
 		pass
 
@@ -41,7 +114,7 @@ def lock_a_file(lockfile_path):
         if parent:
             os.makedirs(parent, exist_ok=True)
 
-        if os.path.exists(lockfile_path):
+        if os.path.exists(lockfile_path) and not is_lock_stale(lockfile_path):
             return False 
         else:
             with open(lockfile_path, 'w') as f:
@@ -60,7 +133,167 @@ def generate_transcode_path(video_id, resolution):
     """Generate a unique output directory path for the transcoded video based on video ID and resolution."""
     return f"media/transcode/video_{video_id}/{resolution}/"
 
+def parse_transcode_path(path):
+	"""Return (video_id, resolution) for a 'video_<id>/<resolution>' output directory, or (None, None)."""
+	parts = os.path.normpath(path).split(os.sep)
+	if len(parts) < 2 or not parts[-2].startswith('video_'):
+		return None, None
+	try:
+		return int(parts[-2][len('video_'):]), parts[-1]
+	except ValueError:
+		return None, None
+
+def _is_lock_name(name):
+	return name == 'continuous.lock' or name.endswith('lockfile.lock')
+
+def is_lock_stale(lockfile_path):
+	"""True if the process that wrote a lockfile is gone, or the lockfile is older than TRANSCODE_STALE_LOCK_SECONDS.
+
+	lock_a_file writes the locking process's pid; continuous.lock holds JSON with the encoder's pid.
+	"""
+	try:
+		age = time.time() - os.path.getmtime(lockfile_path)
+		with open(lockfile_path, 'r') as f:
+			content = f.read().strip()
+	except FileNotFoundError:
+		return False
+	if age > settings.TRANSCODE_STALE_LOCK_SECONDS:
+		return True
+	try:
+		pid = json.loads(content).get('pid') if content.startswith('{') else int(content)
+	except (ValueError, AttributeError):
+		pid = None
+	return bool(pid) and not psutil.pid_exists(int(pid))
+
+def is_transcode_output_busy(output_dir):
+	"""True if an encoder currently owns the output directory (a live continuous or per-segment lockfile)."""
+	try:
+		for name in os.listdir(output_dir):
+			if _is_lock_name(name) and not is_lock_stale(os.path.join(output_dir, name)):
+				return True
+	except FileNotFoundError:
+		pass
+	return False
+
+def remove_stale_locks(output_dir):
+	"""Delete the lockfiles crashed encoders left in an output directory. Returns their names."""
+	removed = []
+	try:
+		names = os.listdir(output_dir)
+	except FileNotFoundError:
+		return removed
+	for name in names:
+		if _is_lock_name(name) and is_lock_stale(os.path.join(output_dir, name)):
+			try:
+				os.remove(os.path.join(output_dir, name))
+				removed.append(name)
+			except FileNotFoundError:
+				pass
+	return removed
+
+def transcode_aliases(base_dir='media/transcode'):
+	"""Map video id -> ids of re-uploads whose `video_<id>` folder is a symlink to it (see dedupe.link_duplicate)."""
+	aliases = {}
+	if not os.path.isdir(base_dir):
+		return aliases
+	for entry in os.scandir(base_dir):
+		if not entry.is_symlink() or not entry.name.startswith('video_'):
+			continue
+		try:
+			target = os.path.basename(os.readlink(entry.path))
+			aliases.setdefault(int(target[len('video_'):]), []).append(int(entry.name[len('video_'):]))
+		except (OSError, ValueError):
+			continue
+	return aliases
+
+def discard_transcodes(video_id, base_dir='media/transcode'):
+	"""Remove the cached outputs of a video (every resolution) that no encoder is writing to.
+
+	Returns the output folders left in place because an encoder still owns them.
+	"""
+	video_dir = os.path.join(base_dir, f"video_{video_id}")
+	if not os.path.isdir(video_dir):
+		return []
+	busy = []
+	removed = False
+	for entry in os.scandir(video_dir):
+		if not entry.is_dir():
+			continue
+		if is_transcode_output_busy(entry.path):
+			busy.append(entry.path)
+			continue
+		shutil.rmtree(entry.path, ignore_errors=True)
+		removed = True
+	if removed:
+		# Byte-range playlists of compacted outputs point at files that are gone now
+		invalidate_playlists(video_id, *transcode_aliases(base_dir).get(video_id, []))
+	return busy
+
+def cleanup_inactive_transcodes(base_dir='media/transcode', inactive_seconds=3600):
+	"""Delete transcode output folders that have not been written or requested for `inactive_seconds`.
+
+	Folders with a running encoder are always kept. Returns the list of removed directories.
+	"""
+	removed = []
+	if not os.path.isdir(base_dir):
+		return removed
+
+	now = time.time()
+	aliases = transcode_aliases(base_dir)
+	for video_entry in os.scandir(base_dir):
+		# symlinked folders of re-uploads are covered by the folder they point to
+		if not video_entry.is_dir(follow_symlinks=False) or not video_entry.name.startswith('video_'):
+			continue
+		for output_entry in os.scandir(video_entry.path):
+			if not output_entry.is_dir():
+				continue
+			output_dir = output_entry.path
+			remove_stale_locks(output_dir)
+			if is_transcode_output_busy(output_dir):
+				continue
+
+			last_used = output_entry.stat().st_mtime
+			for f in os.scandir(output_dir):
+				try:
+					last_used = max(last_used, f.stat().st_mtime)
+				except FileNotFoundError:
+					pass
+			video_id, resolution = parse_transcode_path(output_dir)
+			if video_id is not None:
+				for access_id in [video_id] + aliases.get(video_id, []):
+					last_access, _ = get_transcode_access(access_id, resolution)
+					if last_access:
+						last_used = max(last_used, last_access)
+
+			if now - last_used < inactive_seconds:
+				continue
+			shutil.rmtree(output_dir, ignore_errors=True)
+			removed.append(output_dir)
+			if video_id is not None:
+				# A compacted output's byte-range playlist is gone with it
+				invalidate_playlists(video_id, *aliases.get(video_id, []))
+
+		try:
+			os.rmdir(video_entry.path)  # only succeeds once the video folder is empty
+		except OSError:
+			pass
+	return removed
+
 def get_keyframes(video_path):
+	"""Keyframe timestamps of a video, cached per file identity (see _extract_keyframes)."""
+	try:
+		cache_key = _file_cache_key('keyframes', video_path)
+	except OSError as e:
+		print(f"Error extracting keyframes: {e}")
+		return []
+	keyframes = cache.get(cache_key)
+	if keyframes is None:
+		keyframes = _extract_keyframes(video_path)
+		if keyframes:
+			cache.set(cache_key, keyframes, timeout=settings.PROBE_CACHE_TIMEOUT)
+	return keyframes
+
+def _extract_keyframes(video_path):
 	"""Use ffprobe to extract keyframe timestamps from a video."""
 	try:
 		cmd = [
@@ -110,7 +343,8 @@ def generate_m3u8_file(m3u8_path, video_id):
             os.makedirs(output_dir)
 
         # Extract keyframes from the original video
-        video_path = "media/" + Video.objects.get(pk=video_id).video_file.name
+        video = Video.objects.get(pk=video_id)
+        video_path = "media/" + video.video_file.name
         
         lockfile = os.path.join(output_dir, "lockfile.lock")
         if not lock_a_file(lockfile):
@@ -123,23 +357,51 @@ def generate_m3u8_file(m3u8_path, video_id):
             get_rid_of_lockfile(lockfile)
             return "Error failed to extract keyframes. M3U8 generation cannot proceed."
 
+        if video.duration:
+            duration = video.duration.total_seconds()
+        else:
+            duration = probe_a_video(video_path).get('duration_seconds') or keyframes[-1]
+
+        # Group the keyframes into segments of about HLS_SEGMENT_TARGET_SECONDS after the short
+        # HLS_STARTUP_RAMP openers; the encoders cut and force keyframes at exactly these boundaries (see segment_plan)
+        target = settings.HLS_SEGMENT_TARGET_SECONDS
+        ramp = settings.HLS_STARTUP_RAMP
+        segments = plan_segments(keyframes, duration, target, ramp)
+        if load_plan(video_id) != segments:
+            # Segments already on disk were cut for another plan (or before plans existed). Stop the
+            # continuous encoders first, they would keep adding segments cut the old way; the plan is
+            # only replaced once every output is gone (a per-segment encode finishes within minutes)
+            from video_app.api.workers import kill_continuous_worker
+            transcode_dir = f"media/transcode/video_{video_id}"
+            if os.path.isdir(transcode_dir):
+                for resolution in os.listdir(transcode_dir):
+                    kill_continuous_worker(video_id, resolution)
+            busy = discard_transcodes(video_id)
+            if busy:
+                get_rid_of_lockfile(lockfile)
+                return f"Failed to replace the segment plan: encoders are still writing to {', '.join(busy)}. Try again shortly."
+            write_plan(video_id, segments, target, ramp)
+
         # Generate the M3U8 content
         m3u8_content = "#EXTM3U\n#EXT-X-VERSION:6\n"
         m3u8_content += "#EXT-X-MEDIA-SEQUENCE:0\n"
         m3u8_content += "#EXT-X-MAP:URI=\"init.mp4\"\n"
         m3u8_content += "#EXT-X-ALLOW-CACHE:YES\n"
         m3u8_content += "#EXT-X-PLAYLIST-TYPE:EVENT\n"
-        m3u8_content += f"#EXT-X-TARGETDURATION:{int(keyframes[3]-keyframes[0])+1}\n"
+        m3u8_content += f"#EXT-X-TARGETDURATION:{math.ceil(max(d for _, d in segments))}\n"
         m3u8_content += "#EXT-X-START:TIME-OFFSET=0.01,PRECISE=NO\n"
-        for i in range(int((len(keyframes) - 1) / 3) + 1):
-            duration = (keyframes[i + 1] - keyframes[i]) * 3
+        for i, (_, segment_duration) in enumerate(segments):
             m3u8_content += "#EXT-X-DISCONTINUITY\n"
-            m3u8_content += f"#EXTINF:{duration:.3f},\nsegment_{i:03d}.mp4\n"
+            m3u8_content += f"#EXTINF:{segment_duration:.3f},\nsegment_{i:03d}.mp4\n"
         m3u8_content += "#EXT-X-ENDLIST\n"
 
         # Write the M3U8 content to the file
         with open(m3u8_path, 'w') as f:
             f.write(m3u8_content)
+        # Whoever regenerated it (a viewer, the ingest pipeline), every web process drops the
+        # playlists it built from the old index, re-uploads linked to this video included
+        cache.set(f"m3u8_{video_id}", m3u8_content, timeout=60*60)
+        invalidate_playlists(video_id, *transcode_aliases().get(video_id, []))
 
         get_rid_of_lockfile(lockfile)
 
@@ -154,8 +416,12 @@ def generate_m3u8_file(m3u8_path, video_id):
                 pass
         return "Error generating M3U8 file. Details: " + str(e)
 	
-def transcode_video_segment(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration):
-	"""Transcode a single video segment using FFmpeg."""
+def transcode_video_segment(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, preset=None, timeout=None):
+	"""Transcode a single video segment (or init.mp4) with the configured transcoder backend.
+
+	`preset` overrides the encoder preset of media segments, e.g. a faster one while a viewer waits;
+	`timeout` bounds the encode in seconds (the backend default if None).
+	"""
 	video = Video.objects.get(pk=video_id)
 	input_path = video.video_file.path
 	output_dir = generate_transcode_path(video_id, resolution)
@@ -167,54 +433,30 @@ def transcode_video_segment(video_id, resolution, scale_param, segment_name, cod
 		return "Failed to acquire lock for segment transcoding. Transcoding is already in progress."
 	
 
+	params = {'scale': scale_param, 'codec': codec_param, 'bitrate': bitrate, 'audio': audio_param}
+	if preset:
+		params['preset'] = preset
 	try:
 		if not segment_name == 'init.mp4':
 			segment_number = int(segment_name.split('_')[1].split('.')[0])
-			start_time = str(float(segment_duration) * segment_number)
-			cmd = [
-				"ffmpeg", "-y",
-				"-ss", start_time,
-				"-to", str(float(start_time) + float(segment_duration) / 3 * 2),
-				"-i", input_path,
-				"-vf", scale_param,
-				"-c:v", codec_param,
-				"-preset", "medium",
-				"-b:v", bitrate,
-				"-c:a", audio_param,
-				"-ar", "48000",
-				"-movflags", "+empty_moov+default_base_moof",
-				"-force_key_frames", f"expr:gte(t,n_forced*{segment_duration / 3})",
-				"-reset_timestamps", "0",
-				"-fflags", "+genpts",
-				output_path  # segment_000.mp4
-			]
+			bounds = segment_bounds(video_id, segment_number)
+			if bounds:
+				# Cut exactly where the playlist says the segment is
+				start_time, duration = bounds
+				end_time, keyframe_interval = start_time + duration, duration
+			else:
+				# Playlist generated before segment plans existed
+				start_time = float(segment_duration) * segment_number
+				end_time, keyframe_interval = start_time + float(segment_duration) / 3 * 2, segment_duration / 3
+			get_backend('segment').encode_segment(
+				input_path, output_path, params,
+				start_time=start_time,
+				end_time=end_time,
+				keyframe_interval=keyframe_interval,
+				video_id=video_id, resolution=resolution, timeout=timeout,
+			)
 		else:
-			cmd = [
-				"ffmpeg", "-y",
-				"-i", input_path,
-				"-vf", scale_param,
-				"-c:v", codec_param,
-				"-preset", "fast",
-				"-b:v", bitrate,
-				"-c:a", audio_param,
-				"-ar", "48000",
-				"-t", "0",  # Short duration to create the init segment
-				"-f", "mp4",
-				"-fflags", "+genpts",
-				"-movflags", "+faststart+frag_keyframe+empty_moov+default_base_moof",
-				output_path  # init.mp4
-			]
-			
-		result = subprocess.run(
-			cmd,
-			stdout=subprocess.DEVNULL,
-			stderr=subprocess.PIPE,
-			text=True,
-			timeout=300,
-		)
-	
-		if result.returncode != 0:
-			raise Exception(f"FFmpeg error: {result.stderr}")
+			get_backend('init').encode_init(input_path, output_path, params, video_id=video_id, resolution=resolution, timeout=timeout)
 
 		get_rid_of_lockfile(lockfile)
 		return "Success"
@@ -222,161 +464,215 @@ def transcode_video_segment(video_id, resolution, scale_param, segment_name, cod
 		get_rid_of_lockfile(lockfile)
 		return f"Error transcoding segment: {str(e)}"
 	
-def transcode_continuously(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=None):
-	"""Continuously transcode segments as they are requested until the entire video is transcoded.
-	
-	Uses a single long-running FFmpeg process that transcodes from the starting segment onwards.
-	Heartbeat monitoring:
+class ContinuousEncode:
+	"""One long-running encoder process (see backends.start_continuous) and its heartbeat-driven control.
+
+	Heartbeat monitoring, one check() every couple of seconds:
 	- Pauses process when 40 segments ahead of last requested segment
 	- Resumes process when ahead count drops below 20 segments
 	- Kills process after 10 minutes of no segment requests
+	Driven by transcode_continuously (a blocking RQ job) or by the transcode daemon.
 	"""
-	video = Video.objects.get(pk=video_id)
-	input_path = video.video_file.path
-	output_dir = generate_transcode_path(video_id, resolution)
-	os.makedirs(output_dir, exist_ok=True)
-	segment_number = int(segment_name.split('_')[1].split('.')[0])
-	start_time = str((float(segment_duration)) * segment_number)
-	print(f"Starting continuous transcode for video {video_id} at resolution {resolution} from segment {segment_name} with start time {start_time}")
 
-	if os.path.exists(os.path.join(output_dir, segment_name)):
-		print(f"Segment {segment_name} already transcoded, skipping transcoding.")
-		return "Success"
-
-	cmd = [
-		"ffmpeg", "-y",
-		"-ss", start_time,
-		"-i", input_path,
-		"-vf", scale_param,
-		"-c:v", codec_param,
-		"-preset", "medium",
-		"-b:v", bitrate,
-		"-c:a", audio_param,
-		"-ar", "48000",
-		"-reset_timestamps", "0",
-		"-f", "hls",
-		"-hls_time", str(segment_duration),
-		"-hls_playlist_type", "event",
-		"-hls_segment_type", "fmp4",
-		"-hls_flags", "independent_segments+omit_endlist",
-		"-hls_fmp4_init_filename", "init.mp4",
-		"-hls_segment_filename", os.path.join(output_dir, "segment_%03d.mp4"),
-		output_dir
-	]
-
-	continuous_lock = os.path.join(output_dir, 'continuous.lock')
-	proc = None
-	process_suspended = False
-
-	try:
-		# Start FFmpeg process
-		proc = subprocess.Popen(
-			cmd,
-			stdout=subprocess.DEVNULL,
-			stderr=subprocess.PIPE,
-			text=True,
+	def __init__(self, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=None):
+		self.video_id = video_id
+		self.resolution = resolution
+		self.segment_name = segment_name
+		self.segment_duration = segment_duration
+		self.worker_id = worker_id
+		self.params = {'scale': scale_param, 'codec': codec_param, 'bitrate': bitrate, 'audio': audio_param}
+		self.output_dir = generate_transcode_path(video_id, resolution)
+		self.continuous_lock = os.path.join(self.output_dir, 'continuous.lock')
+		self.segment_number = int(segment_name.split('_')[1].split('.')[0])
+		self.plan = load_plan(video_id)
+		self.proc = None
+		self.ps_proc = None
+		self.process_suspended = False
+		self.finished = False
+
+	def start(self):
+		"""Start the encoder. Returns a final result if there is nothing to do, else None."""
+		video = Video.objects.get(pk=self.video_id)
+		input_path = video.video_file.path
+		os.makedirs(self.output_dir, exist_ok=True)
+		if self.plan and self.segment_number < len(self.plan):
+			start_time = str(self.plan[self.segment_number][0])
+			# Force keyframes (and so segment cuts) at the planned boundaries, relative to the start
+			keyframe_times = [start - float(start_time) for start, _ in self.plan[self.segment_number:]]
+		else:
+			start_time = str((float(self.segment_duration)) * self.segment_number)
+			keyframe_times = None
+		print(f"Starting continuous transcode for video {self.video_id} at resolution {self.resolution} from segment {self.segment_name} with start time {start_time}")
+
+		if os.path.exists(os.path.join(self.output_dir, self.segment_name)):
+			print(f"Segment {self.segment_name} already transcoded, skipping transcoding.")
+			return "Success"
+		from video_app.api.compact import rendition_index
+		if rendition_index(self.output_dir) is not None:
+			print(f"Video {self.video_id} ({self.resolution}) is compacted, skipping transcoding.")
+			return "Success"
+
+		# Start the encoder process, progress is published per video/resolution while it runs
+		self.proc = get_backend('continuous').start_continuous(
+			input_path, self.output_dir, self.params, start_time, self.segment_duration,
+			video_id=self.video_id, resolution=self.resolution, worker_id=self.worker_id,
+			keyframe_times=keyframe_times, start_number=self.segment_number,
+			part_duration=settings.LL_HLS_PART_TARGET_SECONDS if settings.LL_HLS_ENABLED else None,
 		)
 
-		# Write lockfile with pid and optional worker id
+		# Write lockfile with pid, optional worker id and the first segment (see llhls)
 		try:
-			with open(continuous_lock, 'w') as lf:
-				json.dump({'pid': proc.pid, 'worker_id': worker_id}, lf)
+			with open(self.continuous_lock, 'w') as lf:
+				json.dump({'pid': self.proc.pid, 'worker_id': self.worker_id, 'segment': self.segment_number}, lf)
 		except Exception:
 			pass
 
 		# Get psutil Process object for suspend/resume capabilities
 		try:
-			ps_proc = psutil.Process(proc.pid)
+			self.ps_proc = psutil.Process(self.proc.pid)
 		except:
-			ps_proc = None
+			self.ps_proc = None
+		return None
 
-		# Monitor heartbeat and control process
-		while proc.poll() is None:  # While process is still running
-			time.sleep(2)  # Check every 2 seconds
-			
-			heartbeat_data = get_heartbeat(video_id, resolution)
-			
-			if heartbeat_data:
-				last_requested_segment = heartbeat_data.get('segment', 0)
-				last_request_time = heartbeat_data.get('ts', time.time())
-				time_since_request = time.time() - last_request_time
-				
-				# Calculate how many segments have been transcoded
-				transcoded_count = 0
-				for i in range(segment_number, segment_number + 1000):  # Check up to 1000 segments
-					seg_file = os.path.join(output_dir, f"segment_{i:03d}.mp4")
-					if os.path.exists(seg_file):
-						transcoded_count = i - segment_number + 1
-					else:
-						break
-				
-				current_transcoded_segment = segment_number + transcoded_count - 1
-				segments_ahead = current_transcoded_segment - last_requested_segment
-				
-				# Kill if no requests for 10 minutes (600 seconds)
-				if time_since_request > 600:
-					print(f"No segment requests for 10 minutes. Killing transcode for video {video_id} resolution {resolution}.")
-					try:
-						if ps_proc:
-							ps_proc.kill()
-						else:
-							proc.kill()
-					except:
-						pass
-					clear_heartbeat(video_id, resolution)
-					return "Killed due to inactivity"
-				
-				# Pause if 40 segments ahead
-				if segments_ahead >= 40 and not process_suspended:
-					print(f"Pausing transcode: {segments_ahead} segments ahead of playback (video {video_id}, {resolution})")
-					try:
-						if ps_proc:
-							ps_proc.suspend()
-							process_suspended = True
-					except Exception as e:
-						print(f"Failed to suspend process: {e}")
-				
-				# Resume if below 20 segments ahead
-				elif segments_ahead < 20 and process_suspended:
-					print(f"Resuming transcode: {segments_ahead} segments ahead (video {video_id}, {resolution})")
-					try:
-						if ps_proc:
-							ps_proc.resume()
-							process_suspended = False
-					except Exception as e:
-						print(f"Failed to resume process: {e}")
-
-		# Process finished, check return code
-		if proc.returncode != 0:
-			stderr_output = ""
+	def _kill(self):
+		try:
+			if self.ps_proc:
+				self.ps_proc.kill()
+			else:
+				self.proc.kill()
+		except:
+			pass
+
+	def _current_segment(self):
+		"""How far the encoder got: ffmpeg's own progress report when available, otherwise the segment files on disk."""
+		progress = get_progress(self.video_id, self.resolution, job=self.worker_id) if self.worker_id else None
+		if progress and progress.get('position_seconds') is not None:
+			if self.plan:
+				return segment_at(self.plan, progress['position_seconds']) - 1
+			return int(progress['position_seconds'] // float(self.segment_duration)) - 1
+		transcoded_count = 0
+		for i in range(self.segment_number, self.segment_number + 1000):  # Check up to 1000 segments
+			seg_file = os.path.join(self.output_dir, f"segment_{i:03d}.mp4")
+			if os.path.exists(seg_file):
+				transcoded_count = i - self.segment_number + 1
+			else:
+				break
+		return self.segment_number + transcoded_count - 1
+
+	def check(self):
+		"""One monitor step: pause, resume or kill the encoder. Returns the final result once it ended, else None."""
+		try:
+			# Keep the lock fresh while this monitor runs, paused encoders included (see is_lock_stale)
+			os.utime(self.continuous_lock)
+		except OSError:
+			pass
+		if self.proc.poll() is not None:
+			# Process finished, check return code
+			if self.proc.returncode != 0:
+				stderr_output = ffmpeg_stderr(self.proc)
+				print(f"FFmpeg process exited with code {self.proc.returncode}: {stderr_output}")
+				return f"FFmpeg error: exit code {self.proc.returncode}"
+			self.finished = True
+			return "Success"
+
+		heartbeat_data = get_heartbeat(self.video_id, self.resolution)
+		if not heartbeat_data:
+			return None
+
+		last_requested_segment = heartbeat_data.get('segment', 0)
+		last_request_time = heartbeat_data.get('ts', time.time())
+		time_since_request = time.time() - last_request_time
+		segments_ahead = self._current_segment() - last_requested_segment
+
+		# Kill if no requests for 10 minutes (600 seconds)
+		if time_since_request > 600:
+			print(f"No segment requests for 10 minutes. Killing transcode for video {self.video_id} resolution {self.resolution}.")
+			self._kill()
+			clear_heartbeat(self.video_id, self.resolution)
+			return "Killed due to inactivity"
+
+		# Pause if 40 segments ahead
+		if segments_ahead >= 40 and not self.process_suspended:
+			print(f"Pausing transcode: {segments_ahead} segments ahead of playback (video {self.video_id}, {self.resolution})")
 			try:
-				_, stderr_output = proc.communicate(timeout=1)
-			except:
-				pass
-			print(f"FFmpeg process exited with code {proc.returncode}: {stderr_output}")
-			return f"FFmpeg error: exit code {proc.returncode}"
-		
-		return "Success"
-		
-	except Exception as e:
-		print(f"Fatal error in continuous transcode: {str(e)}")
-		# Try to kill the process if it's still running
-		if proc and proc.poll() is None:
+				if self.ps_proc:
+					self.ps_proc.suspend()
+					self.process_suspended = True
+			except Exception as e:
+				print(f"Failed to suspend process: {e}")
+
+		# Resume if below 20 segments ahead
+		elif segments_ahead < 20 and self.process_suspended:
+			print(f"Resuming transcode: {segments_ahead} segments ahead (video {self.video_id}, {self.resolution})")
 			try:
-				proc.kill()
-			except:
-				pass
-		return f"Error in continuous transcode: {str(e)}"
-	finally:
+				if self.ps_proc:
+					self.ps_proc.resume()
+					self.process_suspended = False
+			except Exception as e:
+				print(f"Failed to resume process: {e}")
+		return None
+
+	def close(self):
+		"""Kill the encoder if it still runs and remove the lockfile and heartbeat (only if it was started)."""
+		if self.proc is None:
+			return
+		if self.proc.poll() is None:
+			self._kill()
 		try:
-			get_rid_of_lockfile(continuous_lock)
+			get_rid_of_lockfile(self.continuous_lock)
 		except Exception:
 			pass
 		try:
-			clear_heartbeat(video_id, resolution)
+			clear_heartbeat(self.video_id, self.resolution)
 		except Exception:
 			pass
+		if self.worker_id:
+			# A killed encoder never writes its 'end' progress record
+			clear_progress(self.video_id, self.resolution, job=self.worker_id)
+		if self.finished:
+			# Encoded to the end: compact the output once its lock is gone (if every segment is there)
+			from video_app.api.compact import schedule_compaction
+			schedule_compaction(self.video_id, self.resolution)
+
+
+def transcode_continuously(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=None):
+	"""Continuously transcode segments as they are requested until the entire video is transcoded.
+
+	Blocking variant of the transcode daemon for RQ: runs one ContinuousEncode and its monitor
+	loop in this worker.
+	"""
+	encode = ContinuousEncode(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id)
+	# Keep this job's entry in the job registry fresh while it runs
+	current_job = get_current_job()
+	registry_id = current_job.id if current_job else worker_id
+	last_touch = 0
+	try:
+		result = encode.start()
+		while result is None:
+			time.sleep(2)  # Check every 2 seconds
+			if registry_id and time.time() - last_touch > 30:
+				touch_job(video_id, resolution, registry_id)
+				last_touch = time.time()
+			result = encode.check()
+		return result
+	except Exception as e:
+		print(f"Fatal error in continuous transcode: {str(e)}")
+		return f"Error in continuous transcode: {str(e)}"
+	finally:
+		encode.close()
 	
+def preview_window(duration_seconds):
+    """(start_offset, preview_duration) of the preview: two minutes from 10% in, or the whole of a short video."""
+    # Calculate smart start offset (start at 10% of video, or 0 if short)
+    if duration_seconds > 180:  # If video is longer than 3 minutes
+        start_offset = int(duration_seconds * 0.1)  # Start at 10%
+    else:
+        start_offset = 0
+
+    # Preview duration: 2 minutes or video length if shorter
+    preview_duration = min(120, int(duration_seconds)) if duration_seconds > 0 else 120
+    return start_offset, preview_duration
+
 def transcode_preview(preview_id):
     """RQ worker for preview transcoding (fixed 480p @ 900k)."""
     Preview = apps.get_model('video_app', 'Preview')
@@ -388,7 +684,6 @@ def transcode_preview(preview_id):
     preview_start_offset = preview.start_offset if getattr(preview, 'start_offset', None) is not None else 20
     preview_preview_duration = preview.preview_duration if getattr(preview, 'preview_duration', None) is not None else 120
     preview_path = os.path.join("media", "hls_preview", f"preview_{preview_id}")
-    playlist = os.path.join(preview_path, "index.m3u8")
     lockfile = os.path.join(preview_path, "lockfile.lock")
     os.makedirs(preview_path, exist_ok=True)
     print(f"Initiating transcode for preview {preview_id} with start offset {preview_start_offset} and duration {preview_preview_duration}")
@@ -399,34 +694,18 @@ def transcode_preview(preview_id):
         return "Failed to acquire lock"
 
     try:
-        # Ensure we pass a plain filesystem path (string) to ffmpeg — FieldFile objects cause the 'expected str' error
+        # Ensure we pass a plain filesystem path (string) to the encoder — FieldFile objects cause the 'expected str' error
         input_path = getattr(preview.video.video_file, 'path', None) or str(preview.video.video_file)
         input_path = str(input_path)
 
-        # Build ffmpeg command: options first, then the output playlist path
-        cmd = [
-            "ffmpeg", "-y",
-            "-ss", str(preview_start_offset),
-            "-i", input_path,
-            "-t", str(preview_preview_duration),
-            "-vf", "scale=-2:480",
-            "-c:v", "libx264", "-preset", "medium", "-b:v", "900k",
-            "-an",
-            "-movflags", "+faststart+frag_keyframe+empty_moov+default_base_moof",
-            "-f", "hls",
-            "-hls_time", "5",
-            "-hls_playlist_type", "vod",
-            "-hls_segment_type", "fmp4",
-            "-hls_fmp4_init_filename", "init.mp4",
-            "-hls_segment_filename", os.path.join(preview_path, "preview_%03d.mp4"),
-            playlist,
-        ]
-
-        # Run ffmpeg and capture stderr for diagnostics
-        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=300)
-        if result.returncode != 0:
+        try:
+            get_backend('preview').encode_preview(
+                input_path, preview_path, preview_start_offset, preview_preview_duration,
+                video_id=preview.video_id, preview_id=preview_id,
+            )
+        except TranscodeError as e:
             preview.status = Preview.PreviewStatus.FAILED
-            preview.error_message = (result.stderr or "ffmpeg failed").strip()[:2000]
+            preview.error_message = str(e)[:2000]
             preview.save(update_fields=['status', 'error_message'])
             return f"Error transcoding preview: {preview.error_message}"
 
@@ -434,6 +713,10 @@ def transcode_preview(preview_id):
         preview.status = Preview.PreviewStatus.COMPLETED
         preview.error_message = None
         preview.save(update_fields=['is_transcoded', 'status', 'error_message'])
+        # Re-uploads of the same content share this preview folder through a symlink
+        Preview.objects.filter(video__source_video_id=preview.video_id).update(
+            is_transcoded=True, status=Preview.PreviewStatus.COMPLETED, error_message=None,
+        )
         return "Success"
 
     except Exception as e:
@@ -453,109 +736,232 @@ def _run_cmd(cmd):
 		return completed.stdout
 	except subprocess.CalledProcessError as e:
 		raise RuntimeError(f"Command failed: {e.stderr.strip()}")
-	
-def probe_a_video(path):
-	"""Probe the video using ffprobe and return width, height and bitrate for audio and Video in kbps and duration in seconds.
 
-	Returns dict: {'width': int, 'height': int, 'bitrate_kbps': int, 'video_codec': str, 'audio_codec': str, 'audio_bitrate_kbps': int, 'duration_seconds': float}
+def _file_cache_key(kind, path):
+	"""Cache key for data derived from a file, tied to its identity (path, size, mtime, inode).
+
+	Replacing or rewriting the file changes the key, so stale entries simply expire.
 	"""
+	real = os.path.realpath(path)
+	st = os.stat(real)
+	digest = hashlib.sha1(real.encode()).hexdigest()[:16]
+	return f"{kind}_{digest}_{st.st_size}_{st.st_mtime_ns}_{st.st_ino}"
+
+def prime_file_cache(kind, path, value):
+	"""Store an already computed probe result or keyframe list ('probe' / 'keyframes') for `path`."""
+	cache.set(_file_cache_key(kind, path), value, timeout=settings.PROBE_CACHE_TIMEOUT)
+
+def forget_file_cache(kind, path):
+	"""Drop the cached probe result or keyframe list ('probe' / 'keyframes') of `path`."""
+	cache.delete(_file_cache_key(kind, path))
+
+def _to_int(value):
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+def _to_kbps(value):
+	value = _to_int(value)
+	return int(value / 1000) if value else None
+
+def _to_float(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return None
+
+def _frame_rate(value):
+	"""'30000/1001' -> 29.97"""
+	try:
+		num, _, den = (value or '').partition('/')
+		return round(int(num) / int(den or 1), 3) if int(den or 1) else None
+	except ValueError:
+		return None
+
+def _run_probe(path):
+	"""Single ffprobe invocation for stream, format and keyframe-relevant timing data (no caching)."""
 	if not os.path.exists(path):
 		raise FileNotFoundError(path)
 
 	cmd = [
-		'ffprobe', '-v', 'error', '-show_entries', 'stream=index,codec_type,codec_name,width,height,bit_rate', '-of', 'json', path
+		'ffprobe', '-v', 'error',
+		'-show_entries',
+		'stream=index,codec_type,codec_name,profile,pix_fmt,width,height,bit_rate,'
+		'r_frame_rate,avg_frame_rate,time_base,start_time,nb_frames,has_b_frames'
+		':format=bit_rate,duration,start_time',
+		'-of', 'json', path
 	]
-	out = _run_cmd(cmd)
-	data = json.loads(out)
+	data = json.loads(_run_cmd(cmd))
 
 	video_stream = None
 	audio_stream = None
-	if 'streams' in data and len(data['streams']) > 0:
-		for s in data['streams']:
-			if s.get('codec_type') == 'video' and video_stream is None:
-				video_stream = s
-			if s.get('codec_type') == 'audio' and audio_stream is None:
-				audio_stream = s
-
-	width = None
-	height = None
-	bit_rate = None
-	video_codec = None
-	audio_codec = None
-	audio_bit_rate = None
-
-	if video_stream:
-		width = int(video_stream.get('width')) if video_stream.get('width') else None
-		height = int(video_stream.get('height')) if video_stream.get('height') else None
+	for s in data.get('streams', []):
+		if s.get('codec_type') == 'video' and video_stream is None:
+			video_stream = s
+		if s.get('codec_type') == 'audio' and audio_stream is None:
+			audio_stream = s
+	video_stream = video_stream or {}
+	audio_stream = audio_stream or {}
+	fmt = data.get('format') or {}
+
+	return {
+		'width': _to_int(video_stream.get('width')),
+		'height': _to_int(video_stream.get('height')),
 		# stream bit_rate might be None for some codecs
-		bit_rate = video_stream.get('bit_rate')
-		video_codec = video_stream.get('codec_name')
+		'bitrate_kbps': _to_kbps(video_stream.get('bit_rate') or fmt.get('bit_rate')),
+		'video_codec': video_stream.get('codec_name'),
+		'audio_codec': audio_stream.get('codec_name'),
+		'audio_bitrate_kbps': _to_kbps(audio_stream.get('bit_rate')),
+		'duration_seconds': _to_float(fmt.get('duration')),
+		'frame_rate': _frame_rate(video_stream.get('avg_frame_rate')) or _frame_rate(video_stream.get('r_frame_rate')),
+		'time_base': video_stream.get('time_base'),
+		'start_time': _to_float(video_stream.get('start_time')),
+		'frame_count': _to_int(video_stream.get('nb_frames')),
+		'has_b_frames': bool(_to_int(video_stream.get('has_b_frames'))),
+		'video_profile': video_stream.get('profile'),
+		'pix_fmt': video_stream.get('pix_fmt'),
+	}
 
-	if audio_stream:
-		audio_codec = audio_stream.get('codec_name')
-		audio_bit_rate = audio_stream.get('bit_rate')
+def probe_a_video(path, use_cache=True):
+	"""Probe the video using ffprobe and return width, height and bitrate for audio and Video in kbps and duration in seconds.
 
-	cmd2 = ['ffprobe', '-v', 'error', '-show_entries', 'format=bit_rate,duration', '-of', 'json', path]
-	out2 = _run_cmd(cmd2)
-	data2 = json.loads(out2)
-	fmt = data2.get('format')
+	Returns dict: {'width': int, 'height': int, 'bitrate_kbps': int, 'video_codec': str, 'audio_codec': str, 'audio_bitrate_kbps': int, 'duration_seconds': float,
+	'frame_rate': float, 'time_base': str, 'start_time': float, 'frame_count': int, 'has_b_frames': bool, 'video_profile': str, 'pix_fmt': str}
 
-	if fmt:
-		if not bit_rate:
-			bit_rate = fmt.get('bit_rate')
-		duration = fmt.get('duration')
+	Results are cached per file identity, so re-probing an unchanged file does not spawn ffprobe.
+	"""
+	if not os.path.exists(path):
+		raise FileNotFoundError(path)
+	cache_key = _file_cache_key('probe', path)
+	if use_cache:
+		cached = cache.get(cache_key)
+		if cached is not None:
+			return cached
+	info = _run_probe(path)
+	cache.set(cache_key, info, timeout=settings.PROBE_CACHE_TIMEOUT)
+	return info
+
+def _probe_job(path, with_keyframes):
+	"""Process pool entry point: returns (info, keyframes, error) without touching Django's cache."""
+	try:
+		info = _run_probe(path)
+		keyframes = _extract_keyframes(path) if with_keyframes else None
+		return info, keyframes, None
+	except Exception as e:
+		return None, None, str(e)
 
-	bitrate_kbps = None
-	if bit_rate:
-		try:
-			bitrate_kbps = int(int(bit_rate) / 1000)
-		except Exception:
-			bitrate_kbps = None
+def probe_many(paths, workers=None, with_keyframes=False, use_cache=True, on_result=None):
+	"""Probe many files in parallel with a process pool and fill the probe (and keyframe) cache.
 
-	audio_bitrate_kbps = None
-	if audio_bit_rate:
+	Cache lookups and writes happen in this process; the pool workers only run ffprobe.
+	Returns {path: info or None}; on_result(path, info, error, cached) is called as results arrive.
+	"""
+	results = {}
+	pending = []
+	for path in paths:
 		try:
-			audio_bitrate_kbps = int(int(audio_bit_rate) / 1000)
-		except Exception:
-			audio_bitrate_kbps = None
-
-	duration_seconds = None
+			cached = cache.get(_file_cache_key('probe', path)) if use_cache else None
+			if cached is not None and with_keyframes and cache.get(_file_cache_key('keyframes', path)) is None:
+				cached = None
+		except OSError as e:
+			results[path] = None
+			if on_result:
+				on_result(path, None, str(e), False)
+			continue
+		if cached is not None:
+			results[path] = cached
+			if on_result:
+				on_result(path, cached, None, True)
+		else:
+			pending.append(path)
+
+	if not pending:
+		return results
+	# django.setup lets spawned (non-fork) workers import this module; they never use the DB or cache
+	with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+		futures = {pool.submit(_probe_job, path, with_keyframes): path for path in pending}
+		for future in as_completed(futures):
+			path = futures[future]
+			info, keyframes, error = future.result()
+			if info is not None:
+				cache.set(_file_cache_key('probe', path), info, timeout=settings.PROBE_CACHE_TIMEOUT)
+			if keyframes:
+				cache.set(_file_cache_key('keyframes', path), keyframes, timeout=settings.PROBE_CACHE_TIMEOUT)
+			results[path] = info
+			if on_result:
+				on_result(path, info, error, False)
+	return results
+
+def thumbnail_score(candidate):
+	"""Higher is better: luma entropy (detail), scaled down for frames that are nearly black or white."""
+	entropy = candidate.get('entropy') or 0.0
+	yavg = candidate.get('yavg')
+	if yavg is None:
+		return entropy
+	# Video luma is limited range: black at 16 and white at 235 (scaled up for higher bit depths)
+	scale = 1 << (int(candidate.get('bitdepth') or 8) - 8)
+	brightness = min(max((yavg - 16 * scale) / (219 * scale), 0.0), 1.0)
+	exposure = min(1.0, min(brightness, 1.0 - brightness) / 0.15)
+	return entropy * exposure
+
+def pick_best_thumbnail(candidates):
+	"""Best candidate by thumbnail_score(); the earliest one wins ties."""
+	best = None
+	for candidate in candidates:
+		if best is None or thumbnail_score(candidate) > thumbnail_score(best):
+			best = candidate
+	return best
+
+def thumbnail_variant_widths(source_width):
+	"""Configured THUMBNAIL_WIDTHS that do not upscale the source (at least the smallest one)."""
+	widths = sorted(settings.THUMBNAIL_WIDTHS)
+	if not source_width:
+		return widths
+	return [w for w in widths if w <= source_width] or widths[:1]
+
+def render_thumbnail(input_path, output_dir, timestamps, source_width, video_id=None):
+	"""Score candidate frames at `timestamps`, write the best as thumbnail.jpg plus variants in output_dir.
+
+	Returns (thumbnail path, picked candidate).
+	"""
+	os.makedirs(output_dir, exist_ok=True)
+	output_path = os.path.join(output_dir, "thumbnail.jpg")
+	candidates_dir = os.path.join(output_dir, "thumbnail_candidates")
 	try:
-		if 'duration' in locals() and duration:
-			duration_seconds = float(duration)
-	except Exception:
-		duration_seconds = None
+		backend = get_backend('thumbnail')
+		shutil.rmtree(candidates_dir, ignore_errors=True)
+		os.makedirs(candidates_dir)
+		best = pick_best_thumbnail(backend.extract_thumbnail_candidates(input_path, candidates_dir, timestamps, video_id=video_id))
+		shutil.copyfile(best['path'], output_path)
+		backend.write_thumbnail_variants(
+			output_path, output_dir, thumbnail_variant_widths(source_width), settings.THUMBNAIL_FORMATS, video_id=video_id,
+		)
+		return output_path, best
+	finally:
+		shutil.rmtree(candidates_dir, ignore_errors=True)
 
-	return {
-		'width': width,
-		'height': height,
-		'bitrate_kbps': bitrate_kbps,
-		'video_codec': video_codec,
-		'audio_codec': audio_codec,
-		'audio_bitrate_kbps': audio_bitrate_kbps,
-		'duration_seconds': duration_seconds,
-	}
+def thumbnail_timestamps(duration):
+	"""Candidate frame times for a video of `duration` seconds (THUMBNAIL_CANDIDATE_POSITIONS)."""
+	if not duration:
+		return [0]
+	return sorted({round(duration * position, 3) for position in settings.THUMBNAIL_CANDIDATE_POSITIONS})
 
 def get_thumbnail_from_video(video_id):
+	"""Pick the best of several candidate frames and write it as thumbnail.jpg plus pre-sized variants.
+
+	Candidates are taken at THUMBNAIL_CANDIDATE_POSITIONS (fractions of the duration) in one
+	ffmpeg pass; variants are written as thumbnail_<width>.<format> next to thumbnail.jpg.
+	"""
 	video = Video.objects.get(pk=video_id)
 	input_path = video.video_file.path
 	output_dir = os.path.join("media", "index", f"video_{video_id}")
-	os.makedirs(output_dir, exist_ok=True)
-	output_path = os.path.join(output_dir, "thumbnail.jpg")
-	timestamp = video.duration / 10
-
-	cmd = [
-		"ffmpeg", "-y",
-		"-ss", str(timestamp),
-		"-i", input_path,
-		"-frames:v", "1",
-		output_path
-	]
 
 	try:
-		result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60)
-		if result.returncode != 0:
-			raise Exception(f"FFmpeg error: {result.stderr.strip()}")
+		info = probe_a_video(input_path)
+		duration = video.duration.total_seconds() if video.duration else (info.get('duration_seconds') or 0)
+		output_path, best = render_thumbnail(input_path, output_dir, thumbnail_timestamps(duration), info.get('width'), video_id=video_id)
+		print(f"Picked thumbnail at {best['timestamp']:.1f}s for video {video_id} (score {thumbnail_score(best):.3f})")
 		return output_path
 	except Exception as e:
 		print(f"Error generating thumbnail: {str(e)}")
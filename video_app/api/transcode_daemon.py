@@ -0,0 +1,130 @@
+import asyncio
+import json
+import signal
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from video_app.api.transcode import ContinuousEncode
+from video_app.api.job_registry import register_job, touch_job, unregister_job, is_job_active
+
+# Continuous encodes requested from the web processes wait on a Redis list; the daemon
+# (manage.py transcode_daemon) pops them and runs each encoder's monitor loop as an asyncio task,
+# so hour-long encodes never occupy an RQ worker. Requests use the job registry like RQ jobs do:
+# the entry is kept fresh while the encoder runs and removed when it ends.
+CHECK_INTERVAL = 2
+TOUCH_INTERVAL = 30
+POP_TIMEOUT = 1
+
+
+def _requests_key():
+	return cache.make_key("transcode_daemon_requests")
+
+
+def submit_continuous(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=None, job_id=None):
+	"""Ask the transcode daemon for a continuous encode (the arguments of transcode_continuously). Returns the job id."""
+	job_id = job_id or uuid.uuid4().hex
+	register_job(video_id, resolution, job_id)
+	get_redis_connection('default').rpush(_requests_key(), json.dumps({
+		'job_id': job_id, 'video_id': video_id, 'resolution': resolution, 'scale_param': scale_param,
+		'segment_name': segment_name, 'codec_param': codec_param, 'bitrate': bitrate,
+		'audio_param': audio_param, 'segment_duration': segment_duration, 'worker_id': worker_id,
+	}))
+	return job_id
+
+
+class TranscodeDaemon:
+	"""Runs the continuous encoders of this host: one asyncio task per encoder, at most `max_encoders` at once.
+
+	Blocking calls (Redis, the database, psutil) go to threads so one slow check does not hold
+	up the other encoders. SIGTERM and SIGINT stop taking requests and close all encoders.
+	"""
+
+	def __init__(self, max_encoders=None, check_interval=CHECK_INTERVAL):
+		self.max_encoders = max_encoders or settings.TRANSCODE_DAEMON_MAX_ENCODERS
+		self.check_interval = check_interval
+		self.tasks = {}  # job id -> asyncio task
+		self.waiting = deque()
+		self.stopping = False
+
+	def stop(self):
+		self.stopping = True
+
+	def _pop_request(self):
+		item = get_redis_connection('default').blpop(_requests_key(), POP_TIMEOUT)
+		return json.loads(item[1]) if item else None
+
+	async def run(self):
+		loop = asyncio.get_running_loop()
+		for sig in (signal.SIGTERM, signal.SIGINT):
+			try:
+				loop.add_signal_handler(sig, self.stop)
+			except (NotImplementedError, RuntimeError):
+				pass
+		print(f"Transcode daemon started, up to {self.max_encoders} encoders")
+		while not self.stopping:
+			try:
+				request = await asyncio.to_thread(self._pop_request)
+			except Exception as e:
+				print(f"Transcode daemon could not read requests: {e}")
+				await asyncio.sleep(self.check_interval)
+				continue
+			if request:
+				self.waiting.append(request)
+			self._start_waiting()
+		await self.shutdown()
+
+	def _start_waiting(self):
+		while self.waiting and len(self.tasks) < self.max_encoders:
+			request = self.waiting.popleft()
+			job_id = request['job_id']
+			if job_id in self.tasks:
+				continue
+			# kill_continuous_worker unregisters requests that were cancelled before they started
+			if not is_job_active(request['video_id'], request['resolution'], job_id):
+				continue
+			self.tasks[job_id] = asyncio.create_task(self._supervise(request))
+
+	async def _supervise(self, request):
+		"""Start one encoder and run its monitor loop until it finishes, is killed or goes idle."""
+		args = dict(request)
+		job_id = args.pop('job_id')
+		video_id, resolution = args['video_id'], args['resolution']
+		encode = ContinuousEncode(**args)
+		result = None
+		try:
+			await asyncio.to_thread(touch_job, video_id, resolution, job_id)
+			last_touch = time.monotonic()
+			result = await asyncio.to_thread(encode.start)
+			while result is None:
+				await asyncio.sleep(self.check_interval)
+				if time.monotonic() - last_touch > TOUCH_INTERVAL:
+					await asyncio.to_thread(touch_job, video_id, resolution, job_id)
+					last_touch = time.monotonic()
+				result = await asyncio.to_thread(encode.check)
+		except asyncio.CancelledError:
+			result = "Stopped by daemon shutdown"
+			raise
+		except Exception as e:
+			result = f"Error in continuous transcode: {str(e)}"
+		finally:
+			encode.close()
+			unregister_job(video_id, resolution, job_id)
+			self.tasks.pop(job_id, None)
+			print(f"Continuous transcode {job_id} (video {video_id}, {resolution}) ended: {result}")
+		return result
+
+	async def shutdown(self):
+		"""Close running encoders and drop requests that never started; viewers re-request them."""
+		for request in self.waiting:
+			unregister_job(request['video_id'], request['resolution'], request['job_id'])
+		self.waiting.clear()
+		tasks = list(self.tasks.values())
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		print("Transcode daemon stopped")
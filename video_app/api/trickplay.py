@@ -0,0 +1,155 @@
+import math
+import os
+import re
+import shutil
+
+from django.conf import settings
+
+from video_app.models import Video
+from video_app.api.fmp4 import fragment_index
+from video_app.api.progress import run_ffmpeg
+from video_app.api.transcode import probe_a_video, lock_a_file, get_rid_of_lockfile
+
+# Files served by TrickplayView.
+TRICKPLAY_FILE_RE = re.compile(r'^(thumbnails\.vtt|iframes\.m3u8|iframes\.mp4|sprite_\d{3}\.jpg)$')
+
+# Tolerance for comparing keyframe spacing; keeps ffmpeg's select filter and thin_timestamps() in agreement.
+_EPSILON = 0.001
+
+
+def generate_trickplay_path(video_id):
+	"""Directory holding the sprite sheets, WebVTT index and I-frame playlist of a video."""
+	return f"media/index/video_{video_id}/trickplay/"
+
+
+def scaled_size(width, src_width, src_height):
+	"""(width, height) for a thumbnail `width` pixels wide, keeping the source aspect ratio with an even height."""
+	if not src_width or not src_height:
+		return width, int(round(width * 9 / 16 / 2)) * 2
+	return width, max(2, int(round(width * src_height / src_width / 2)) * 2)
+
+
+def thin_timestamps(timestamps, min_interval):
+	"""Keep the first timestamp and every following one at least `min_interval` seconds after the last kept one."""
+	kept = []
+	for ts in timestamps:
+		if not kept or ts - kept[-1] >= min_interval - _EPSILON:
+			kept.append(ts)
+	return kept
+
+
+def _select_filter(min_interval):
+	return f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{min_interval - _EPSILON})'"
+
+
+def _vtt_time(seconds):
+	ms = int(round(seconds * 1000))
+	return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def build_thumbnails_vtt(timestamps, duration, width, height, columns, rows):
+	"""WebVTT cues mapping each time range to its tile in sprite_NNN.jpg (media fragment #xywh)."""
+	per_sheet = columns * rows
+	vtt = "WEBVTT\n"
+	for i, start in enumerate(timestamps):
+		end = timestamps[i + 1] if i + 1 < len(timestamps) else max(duration or 0, start + 1)
+		sheet, tile = divmod(i, per_sheet)
+		x = tile % columns * width
+		y = tile // columns * height
+		vtt += f"\n{_vtt_time(0 if i == 0 else start)} --> {_vtt_time(end)}\n"
+		vtt += f"sprite_{sheet:03d}.jpg#xywh={x},{y},{width},{height}\n"
+	return vtt
+
+
+def build_iframe_playlist(init_size, fragments, duration, uri='iframes.mp4'):
+	"""EXT-X-I-FRAMES-ONLY playlist addressing each fragment of the trick-play stream by byte range."""
+	entries = []
+	for i, (offset, size, start) in enumerate(fragments):
+		end = fragments[i + 1][2] if i + 1 < len(fragments) else max(duration or 0, start + 1)
+		entries.append((max(end - start, 0.001), offset, size))
+	target = max([int(math.ceil(d)) for d, _, _ in entries] or [1])
+
+	m3u8_content = "#EXTM3U\n#EXT-X-VERSION:6\n"
+	m3u8_content += f"#EXT-X-TARGETDURATION:{target}\n"
+	m3u8_content += "#EXT-X-MEDIA-SEQUENCE:0\n"
+	m3u8_content += "#EXT-X-PLAYLIST-TYPE:VOD\n"
+	m3u8_content += "#EXT-X-I-FRAMES-ONLY\n"
+	m3u8_content += f"#EXT-X-MAP:URI=\"{uri}\",BYTERANGE=\"{init_size}@0\"\n"
+	for seconds, offset, size in entries:
+		m3u8_content += f"#EXTINF:{seconds:.3f},\n#EXT-X-BYTERANGE:{size}@{offset}\n{uri}\n"
+	m3u8_content += "#EXT-X-ENDLIST\n"
+	return m3u8_content
+
+
+def generate_trickplay(video_id):
+	"""RQ worker: build scrubbing assets for a video in a single keyframe-only ffmpeg pass.
+
+	Only keyframes are decoded (-skip_frame nokey). They are thinned to TRICKPLAY_IFRAME_INTERVAL
+	and encoded as a low resolution all-intra fragmented MP4 (one fragment per frame) for the
+	I-frame playlist, then thinned further to TRICKPLAY_SPRITE_INTERVAL and tiled into JPEG sprite
+	sheets indexed by thumbnails.vtt. Cue and EXTINF times are read back from the fragments, so
+	they are exactly the source keyframe times.
+	"""
+	video = Video.objects.get(pk=video_id)
+	input_path = video.video_file.path
+	output_dir = generate_trickplay_path(video_id)
+	lockfile = os.path.join(os.path.dirname(os.path.normpath(output_dir)), "trickplay.lock")
+	if not lock_a_file(lockfile):
+		return "Failed to acquire lock for trick-play generation. Generation is already in progress."
+
+	tmp_dir = os.path.normpath(output_dir) + f".tmp{os.getpid()}"
+	try:
+		info = probe_a_video(input_path)
+		duration = info.get('duration_seconds') or 0
+		columns = settings.TRICKPLAY_SPRITE_COLUMNS
+		rows = settings.TRICKPLAY_SPRITE_ROWS
+		sprite_w, sprite_h = scaled_size(settings.TRICKPLAY_SPRITE_WIDTH, info.get('width'), info.get('height'))
+		iframe_w, iframe_h = scaled_size(settings.TRICKPLAY_IFRAME_WIDTH, info.get('width'), info.get('height'))
+
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+		os.makedirs(tmp_dir)
+		filters = (
+			f"[0:v]{_select_filter(settings.TRICKPLAY_IFRAME_INTERVAL)},scale={iframe_w}:{iframe_h},split=2[iframes][s];"
+			f"[s]{_select_filter(settings.TRICKPLAY_SPRITE_INTERVAL)},scale={sprite_w}:{sprite_h},tile={columns}x{rows}[sprites]"
+		)
+		cmd = [
+			"ffmpeg", "-y",
+			"-skip_frame", "nokey",
+			"-i", input_path,
+			"-filter_complex", filters,
+			"-map", "[iframes]",
+			"-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-g", "1",
+			"-fps_mode", "passthrough", "-an",
+			"-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+			"-f", "mp4", os.path.join(tmp_dir, "iframes.mp4"),
+			"-map", "[sprites]",
+			"-fps_mode", "vfr", "-q:v", "5", "-start_number", "0",
+			os.path.join(tmp_dir, "sprite_%03d.jpg"),
+		]
+		result = run_ffmpeg(cmd, video_id, 'trickplay', timeout=60 * 60)
+		if result.returncode != 0:
+			return f"Error generating trick-play assets: {result.stderr.strip()[-2000:]}"
+
+		init_size, _timescale, fragments = fragment_index(os.path.join(tmp_dir, "iframes.mp4"))
+		if not fragments:
+			return "Error generating trick-play assets: no keyframes were encoded."
+		origin = fragments[0][2] or 0
+		fragments = [(offset, size, (start or 0) - origin) for offset, size, start in fragments]
+		sprite_times = thin_timestamps([start for _, _, start in fragments], settings.TRICKPLAY_SPRITE_INTERVAL)
+
+		with open(os.path.join(tmp_dir, "iframes.m3u8"), 'w') as f:
+			f.write(build_iframe_playlist(init_size, fragments, duration))
+		with open(os.path.join(tmp_dir, "thumbnails.vtt"), 'w') as f:
+			f.write(build_thumbnails_vtt(sprite_times, duration, sprite_w, sprite_h, columns, rows))
+
+		shutil.rmtree(output_dir, ignore_errors=True)
+		os.rename(tmp_dir, os.path.normpath(output_dir))
+		return "Success"
+	except Exception as e:
+		return f"Error generating trick-play assets: {str(e)}"
+	finally:
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+		try:
+			get_rid_of_lockfile(lockfile)
+		except Exception:
+			pass
@@ -0,0 +1,123 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from video_app.models import ChunkedUpload
+from video_app.api.dedupe import BlockHasher, store_content_addressed
+from video_app.api.early_ingest import hand_over_early_ingest, discard_early_ingest
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ChunkError(Exception):
+	"""A chunk that does not fit its upload. `offset` is where the client has to continue."""
+
+	def __init__(self, message, offset=None):
+		super().__init__(message)
+		self.offset = offset
+
+
+def create_upload(user, filename, total_size):
+	"""Start a resumable upload and create its empty .part file."""
+	upload = ChunkedUpload.objects.create(user=user, filename=os.path.basename(filename), total_size=total_size)
+	os.makedirs(os.path.dirname(upload.part_path), exist_ok=True)
+	open(upload.part_path, 'wb').close()
+	return upload
+
+
+def write_chunk(upload, start, stream, length):
+	"""Stream `length` bytes from `stream` into the .part file at `start`.
+
+	The body is copied in COPY_BUFFER_SIZE blocks straight to its final position, so neither the
+	chunk nor the file is ever held in memory or reassembled later. The offset only advances if
+	nobody else advanced it meanwhile; a retried chunk just rewrites the same bytes. Bytes are
+	hashed on the way through, so the content hash is known as soon as the last chunk lands.
+	"""
+	if upload.status != ChunkedUpload.UploadStatus.UPLOADING:
+		raise ChunkError("Upload is already complete.", upload.offset)
+	if start != upload.offset:
+		raise ChunkError(f"Chunk starts at {start}, expected {upload.offset}.", upload.offset)
+	if length <= 0 or start + length > upload.total_size:
+		raise ChunkError("Chunk is empty or exceeds the announced file size.", upload.offset)
+
+	end = start + length
+	with open(upload.part_path, 'r+b') as f:
+		hasher = BlockHasher(upload.blocks_path, f, start)
+		f.seek(start)
+		remaining = length
+		while remaining:
+			block = stream.read(min(COPY_BUFFER_SIZE, remaining))
+			if not block:
+				break
+			f.write(block)
+			hasher.update(block)
+			remaining -= len(block)
+	if remaining:
+		raise ChunkError(f"Chunk body ended {remaining} bytes early.", upload.offset)
+	hasher.finish(end, upload.total_size)
+
+	fields = {'offset': end, 'updated_at': timezone.now()}
+	if end == upload.total_size:
+		fields['status'] = ChunkedUpload.UploadStatus.COMPLETE
+		fields['content_hash'] = BlockHasher.content_hash(upload.blocks_path, upload.total_size)
+	updated = ChunkedUpload.objects.filter(
+		pk=upload.pk, offset=start, status=ChunkedUpload.UploadStatus.UPLOADING,
+	).update(**fields)
+	upload.refresh_from_db()
+	if not updated:
+		raise ChunkError("Another request wrote this chunk first.", upload.offset)
+	return upload
+
+
+def attach_upload(video, upload):
+	"""Move a completed upload into content-addressed storage and point video.video_file at it (caller saves).
+
+	Re-uploads of stored content are dropped here and the video points at the existing file.
+	"""
+	if upload.status != ChunkedUpload.UploadStatus.COMPLETE:
+		raise ValueError(f"Upload {upload.id} is not complete ({upload.offset}/{upload.total_size} bytes).")
+	if upload.content_hash:
+		# Same filesystem: a rename, no copy of a multi-GB file
+		name = store_content_addressed(upload.part_path, upload.content_hash, upload.filename)
+		video.content_hash = upload.content_hash
+	else:
+		name = default_storage.get_available_name(video.video_file.field.generate_filename(video, upload.filename))
+		destination = default_storage.path(name)
+		os.makedirs(os.path.dirname(destination), exist_ok=True)
+		os.replace(upload.part_path, destination)
+	_remove(upload.blocks_path)
+	hand_over_early_ingest(upload)
+	video.video_file.name = name
+	upload.status = ChunkedUpload.UploadStatus.ATTACHED
+	upload.save(update_fields=['status', 'updated_at'])
+	return name
+
+
+def discard_upload(upload):
+	"""Delete an upload, its .part and .blocks files and anything staged by early ingest."""
+	_remove(upload.part_path)
+	_remove(upload.blocks_path)
+	discard_early_ingest(upload)
+	upload.delete()
+
+
+def _remove(path):
+	try:
+		os.remove(path)
+	except OSError:
+		pass
+
+
+def cleanup_stale_uploads(max_age_seconds=None):
+	"""Discard unfinished or unattached uploads not touched for UPLOAD_STALE_SECONDS. Returns how many were removed."""
+	max_age_seconds = settings.UPLOAD_STALE_SECONDS if max_age_seconds is None else max_age_seconds
+	cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+	stale = ChunkedUpload.objects.exclude(status=ChunkedUpload.UploadStatus.ATTACHED).filter(updated_at__lt=cutoff)
+	count = 0
+	for upload in stale:
+		discard_upload(upload)
+		count += 1
+	return count
@@ -1,7 +1,8 @@
 from django.urls import path
 
 from video_app.api.views import (
-    VideoListView, VideoM3U8View, VideoSegmentView, PreviewM3U8View, PreviewSegmentView, ThumbnailView
+    VideoListView, VideoM3U8View, VideoSegmentView, PreviewM3U8View, PreviewSegmentView, ThumbnailView,
+    TrickplayView, ChunkedUploadView, ChunkedUploadDetailView,
 )
 
 urlpatterns = [
@@ -10,5 +11,8 @@ urlpatterns = [
     path('video/<int:video_id>/<str:resolution>/<str:segment_name>', VideoSegmentView.as_view()),
     path('preview/<int:video_id>/index.m3u8', PreviewM3U8View.as_view()),
     path('preview/<int:video_id>/<str:segment_name>', PreviewSegmentView.as_view()),
-    path('thumbnail/video_<int:video_id>/thumbnail.jpg', ThumbnailView.as_view())
+    path('thumbnail/video_<int:video_id>/thumbnail.jpg', ThumbnailView.as_view()),
+    path('trickplay/<int:video_id>/<str:file_name>', TrickplayView.as_view()),
+    path('uploads/', ChunkedUploadView.as_view()),
+    path('uploads/<uuid:upload_id>/', ChunkedUploadDetailView.as_view()),
 ]
@@ -0,0 +1,217 @@
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from video_app.models import Video, ViewingStats
+from video_app.api.transcode import queue_heartbeat, STALE_VIEWER_SECONDS
+from video_app.api.warmup import add_popularity, PLAY_WEIGHT, SEGMENT_WEIGHT
+from video_app.api.workers import schedule_periodic_job
+
+FLUSH_JOB_KEY = "viewing_stats_flush_job_id"
+FLUSH_BATCH_SIZE = 500
+
+# Fields of the pending Redis hash per video: v:<resolution> play starts, s:<resolution> segments,
+# h:<segment number> requests of that segment, t last request (unix time).
+
+# Per-process coalescing state: (video_id, resolution, viewer) -> counters not written yet and the last write
+_viewers = {}
+_viewers_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _pending_key(video_id):
+	return cache.make_key(f"viewing_stats_{video_id}")
+
+
+def _dirty_key():
+	return cache.make_key("viewing_stats_dirty")
+
+
+def _new_viewer():
+	return {'plays': 0, 'segments': {}, 'playhead': 0, 'seen': 0.0, 'written_at': None, 'written_playhead': None}
+
+
+def _has_pending(entry):
+	return bool(entry['plays'] or entry['segments'])
+
+
+def _must_write(entry, now, play_start):
+	"""Write now for play starts, seeks and the first request; otherwise once per HEARTBEAT_COALESCE_SECONDS."""
+	if play_start or entry['written_at'] is None:
+		return True
+	if now - entry['written_at'] >= settings.HEARTBEAT_COALESCE_SECONDS:
+		return True
+	# Linear playback only moves a segment or two per interval; anything else is a seek
+	return not 0 <= entry['playhead'] - entry['written_playhead'] <= 2
+
+
+def _queue_viewer(pipe, key, entry, now):
+	"""Queue a viewer's coalesced heartbeat and counters on `pipe` and reset them."""
+	video_id, resolution, viewer = key
+	segments = sum(entry['segments'].values())
+	queue_heartbeat(pipe, video_id, resolution, viewer, entry['playhead'], ts=entry['seen'], hits=entry['plays'] + segments)
+	add_popularity(pipe, video_id, resolution, entry['plays'] * PLAY_WEIGHT + segments * SEGMENT_WEIGHT)
+	stats_key = _pending_key(video_id)
+	if entry['plays']:
+		pipe.hincrby(stats_key, f"v:{resolution}", entry['plays'])
+	if segments:
+		pipe.hincrby(stats_key, f"s:{resolution}", segments)
+		for segment_number, count in entry['segments'].items():
+			pipe.hincrby(stats_key, f"h:{segment_number}", count)
+	pipe.hset(stats_key, "t", int(entry['seen']))
+	pipe.sadd(_dirty_key(), video_id)
+	entry.update(plays=0, segments={}, written_at=now, written_playhead=entry['playhead'])
+
+
+def record_view(video_id, resolution, viewer='', segment_number=None):
+	"""Count a playlist request (no segment number) or a segment request: heartbeat, popularity and viewing counters.
+
+	Requests are coalesced per process: a viewer is written at most once per
+	HEARTBEAT_COALESCE_SECONDS (play starts and seeks right away), everything in one pipelined
+	round trip. Viewers that went quiet are written by the sweep of a later request. Nothing is
+	written to the database here; flush_viewing_stats() moves the counters into ViewingStats.
+	"""
+	global _last_sweep
+	now = time.monotonic()
+	key = (video_id, resolution, viewer)
+	try:
+		with _viewers_lock:
+			entry = _viewers.setdefault(key, _new_viewer())
+			if segment_number is None:
+				entry['plays'] += 1
+				entry['playhead'] = 0
+			else:
+				entry['segments'][int(segment_number)] = entry['segments'].get(int(segment_number), 0) + 1
+				entry['playhead'] = int(segment_number)
+			entry['seen'] = time.time()
+
+			due = [key] if _must_write(entry, now, segment_number is None) else []
+			if now - _last_sweep >= settings.HEARTBEAT_COALESCE_SECONDS:
+				_last_sweep = now
+				for other, other_entry in list(_viewers.items()):
+					if other == key:
+						continue
+					if _has_pending(other_entry):
+						if other_entry['written_at'] is None or now - other_entry['written_at'] >= settings.HEARTBEAT_COALESCE_SECONDS:
+							due.append(other)
+					elif now - other_entry['written_at'] >= STALE_VIEWER_SECONDS:
+						del _viewers[other]
+			if not due:
+				return
+			pipe = get_redis_connection('default').pipeline(transaction=False)
+			for due_key in due:
+				_queue_viewer(pipe, due_key, _viewers[due_key], now)
+		pipe.execute()
+	except Exception:
+		pass
+
+
+def merge_counters(stats, counters):
+	"""Add pending counters ({field: int}, see above) to a ViewingStats instance. The caller saves it."""
+	for field, value in counters.items():
+		kind, _, name = field.partition(':')
+		if kind == 'v':
+			stats.views += value
+			stats.resolution_views[name] = stats.resolution_views.get(name, 0) + value
+		elif kind == 's':
+			stats.segments += value
+			stats.resolution_segments[name] = stats.resolution_segments.get(name, 0) + value
+		elif kind == 'h':
+			stats.segment_histogram[name] = stats.segment_histogram.get(name, 0) + value
+		elif kind == 't':
+			viewed = datetime.fromtimestamp(value, tz=dt_timezone.utc)
+			if stats.last_viewed_at is None or viewed > stats.last_viewed_at:
+				stats.last_viewed_at = viewed
+	return stats
+
+
+def _take_pending(redis, batch_size):
+	"""Pop up to `batch_size` videos with pending counters and read-and-delete their hashes atomically."""
+	video_ids = [int(v) for v in redis.spop(_dirty_key(), batch_size) or []]
+	if not video_ids:
+		return {}
+	pipe = redis.pipeline(transaction=True)
+	for video_id in video_ids:
+		pipe.hgetall(_pending_key(video_id))
+		pipe.delete(_pending_key(video_id))
+	results = pipe.execute()[::2]
+	return {
+		video_id: {field.decode(): int(value) for field, value in counters.items()}
+		for video_id, counters in zip(video_ids, results) if counters
+	}
+
+
+def _restore(redis, pending):
+	"""Put counters back after a failed database write, so the next flush retries them."""
+	pipe = redis.pipeline(transaction=False)
+	for video_id, counters in pending.items():
+		key = _pending_key(video_id)
+		for field, value in counters.items():
+			if field == 't':
+				pipe.hsetnx(key, field, value)
+			else:
+				pipe.hincrby(key, field, value)
+		pipe.sadd(_dirty_key(), video_id)
+	pipe.execute()
+
+
+def _write(pending):
+	"""Merge one batch into ViewingStats: one locked read, one bulk insert and one bulk update."""
+	video_ids = set(Video.objects.filter(id__in=pending).values_list('id', flat=True))
+	now = timezone.now()
+	with transaction.atomic():
+		rows = {s.video_id: s for s in ViewingStats.objects.select_for_update().filter(video_id__in=video_ids)}
+		created = []
+		for video_id in video_ids:
+			stats = rows.get(video_id)
+			if stats is None:
+				created.append(merge_counters(ViewingStats(video_id=video_id), pending[video_id]))
+			else:
+				merge_counters(stats, pending[video_id])
+				stats.updated_at = now
+		ViewingStats.objects.bulk_create(created)
+		ViewingStats.objects.bulk_update(rows.values(), [
+			'views', 'segments', 'resolution_views', 'resolution_segments', 'segment_histogram',
+			'last_viewed_at', 'updated_at',
+		])
+	return len(video_ids)
+
+
+def flush_viewing_stats(batch_size=FLUSH_BATCH_SIZE):
+	"""Move pending counters from Redis into ViewingStats, `batch_size` videos per transaction. Returns videos updated.
+
+	Counters of deleted videos are dropped. Stops after a partial batch, so steady traffic
+	cannot keep one flush running forever.
+	"""
+	redis = get_redis_connection('default')
+	flushed = 0
+	while True:
+		pending = _take_pending(redis, batch_size)
+		if pending:
+			try:
+				flushed += _write(pending)
+			except Exception:
+				_restore(redis, pending)
+				raise
+		if len(pending) < batch_size:
+			return flushed
+
+
+def flush_viewing_stats_job():
+	"""RQ worker: flush the pending counters, then queue the next flush VIEWING_STATS_FLUSH_SECONDS later."""
+	try:
+		flushed = flush_viewing_stats()
+	finally:
+		if settings.VIEWING_STATS_FLUSH_SECONDS:
+			schedule_flush(settings.VIEWING_STATS_FLUSH_SECONDS)
+	return f"Flushed viewing stats of {flushed} videos"
+
+
+def schedule_flush(delay=0):
+	return schedule_periodic_job(flush_viewing_stats_job, FLUSH_JOB_KEY, delay)
@@ -1,15 +1,86 @@
-import os, time
+import os, re, time
 
+from django.conf import settings
 from django.core.cache import cache
 
 from rest_framework import status
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
+from django.utils.http import http_date
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from video_app.models import Video
-from video_app.api.scripts import get_m3u8_file, generate_transcode_path
-from video_app.api.workers import start_transcode_worker
-from .serializers import TranscodeRequestSerializer
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from video_app.models import Video, ChunkedUpload
+from video_app.api.scripts import get_m3u8_file, generate_transcode_path, wait_for_segment_completion
+from video_app.api.workers import start_transcode_worker, continuous_encode_pending
+from video_app.api.trickplay import generate_trickplay_path, TRICKPLAY_FILE_RE
+from video_app.api.uploads import ChunkError, create_upload, write_chunk, discard_upload, cleanup_stale_uploads
+from video_app.api.early_ingest import schedule_early_ingest
+from video_app.api.viewing_stats import record_view
+from video_app.api.fmp4 import complete_fragments
+from video_app.api.llhls import blocking_llhls_playlist, segment_in_progress, wait_for_part, wait_for_complete_segment
+from video_app.api.compact import RENDITION_FILE, rendition_index, compacted_playlist, file_range, segment_starting_at
+from video_app.api.playlist_cache import get_playlist
+from .serializers import TranscodeRequestSerializer, ChunkedUploadSerializer
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+THUMBNAIL_VARIANT_RE = re.compile(r'^thumbnail_(\d+)\.(webp|jpg)$')
+
+# Retry-After of a segment request that timed out waiting for its encode
+SEGMENT_RETRY_AFTER_SECONDS = 2
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mp4': 'video/mp4',
+    '.jpg': 'image/jpeg',
+    '.vtt': 'text/vtt',
+}
+
+def _remaining(deadline):
+    """Seconds left until `deadline` (time.monotonic()), 0 once it has passed."""
+    return max(0.0, deadline - time.monotonic())
+
+def serve_media_file(request, path, content_type, max_age=None, public=False):
+    """Serve a file with ETag revalidation, optional browser/proxy caching and single byte-range support."""
+    st = os.stat(path)
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(st.st_mtime)
+        response['Accept-Ranges'] = 'bytes'
+        if max_age is not None:
+            response['Cache-Control'] = f"{'public' if public else 'private'}, max-age={max_age}"
+        return response
+
+    if request.headers.get('If-None-Match') == etag:
+        return finish(HttpResponse(status=status.HTTP_304_NOT_MODIFIED))
+
+    match = RANGE_RE.match(request.headers.get('Range', ''))
+    if match and (match.group(1) or match.group(2)):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), st.st_size - 1) if last else st.st_size - 1
+        else:
+            start, end = max(st.st_size - int(last), 0), st.st_size - 1
+        if start > end or start >= st.st_size:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return finish(response)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            response = HttpResponse(f.read(end - start + 1), content_type=content_type, status=status.HTTP_206_PARTIAL_CONTENT)
+        response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+        return finish(response)
+
+    return finish(FileResponse(open(path, 'rb'), content_type=content_type))
+
+class AnyAcceptMixin:
+    """For views returning raw files: don't reject Accept headers (image/webp, text/vtt) that no DRF renderer handles."""
+
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
 
 class VideoListView(APIView):
     """API view to list all videos."""
@@ -22,36 +93,68 @@ class VideoM3U8View(APIView):
     """API view to serve the M3U8 playlist for a video."""
 
     def get(self, request, video_id, resolution):
-        from video_app.api.transcode import set_heartbeat
-        
         output_path = f"media/index/video_{video_id}/"
         m3u8_path = os.path.join(output_path, 'index.m3u8')
         recreate = request.query_params.get('recreate', 'false').lower() == 'true'
         
         # Set initial heartbeat when playlist is requested
-        set_heartbeat(video_id, resolution, 0)
+        record_view(video_id, resolution, request.user.username)
 
         worker_id = str(video_id) + "_" + "_" + resolution + "_" + request.user.username
 
-        m3u8 = get_m3u8_file(m3u8_path, video_id, recreate_file=recreate)
-        start_transcode_worker(video_id, resolution, segment_name="segment_000.mp4", codec='h264', worker_id=worker_id, continuous=True)
+        # Regenerating the index invalidates the cached playlists of the video in every process
+        m3u8 = get_m3u8_file(m3u8_path, video_id, recreate_file=True) if recreate else None
+        gzipped = None
+        if not recreate or (m3u8 and m3u8.startswith("#EXTM3U")):
+            # Fully transcoded outputs are one file addressed with byte ranges
+            m3u8, gzipped = get_playlist(
+                video_id, resolution,
+                lambda: compacted_playlist(video_id, resolution) or get_m3u8_file(m3u8_path, video_id),
+            )
 
         if m3u8 is None or m3u8.startswith("Error"):
             return Response({"error": m3u8}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         if m3u8.startswith("Failed"):
             return Response({"error": m3u8}, status=status.HTTP_202_ACCEPTED)
-        return HttpResponse(m3u8, content_type='application/vnd.apple.mpegurl')
+
+        # Only start the encoder: the player parses the playlist while it works, and the segment
+        # view waits for the segments it is about to write (see continuous_encode_pending)
+        start_transcode_worker(video_id, resolution, segment_name="segment_000.mp4", codec='h264', worker_id=worker_id, continuous=True, wait=False)
+        ll_hls = settings.LL_HLS_ENABLED and not recreate
+        if ll_hls and rendition_index(generate_transcode_path(video_id, resolution)) is None:
+            # Blocking playlist reload: _HLS_msn/_HLS_part name the part the player waits for
+            msn, part = (request.query_params.get(name, '') for name in ('_HLS_msn', '_HLS_part'))
+            playlist = blocking_llhls_playlist(
+                video_id, resolution, int(msn) if msn.isdigit() else None, int(part) if part.isdigit() else None,
+            )
+            if playlist:
+                response = HttpResponse(playlist, content_type='application/vnd.apple.mpegurl')
+                response['Cache-Control'] = 'no-cache'
+                return response
+        if gzipped is not None and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(gzipped, content_type='application/vnd.apple.mpegurl')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(m3u8, content_type='application/vnd.apple.mpegurl')
+        response['Vary'] = 'Accept-Encoding'
+        return response
     
 class VideoSegmentView(APIView):
     """API view to serve individual video segments."""
 
     def get(self, request, video_id, resolution, segment_name):
-        from video_app.api.transcode import set_heartbeat
         from video_app.api.workers import kill_continuous_worker
         serializer = TranscodeRequestSerializer(data={'codec': 'h264', 'resolution': resolution, 'bitrate': None})
         serializer.is_valid(raise_exception=True)
         
         segment_path = generate_transcode_path(video_id, resolution)
+
+        index = rendition_index(segment_path)
+        if index is not None:
+            return self._serve_compacted(request, video_id, resolution, segment_path, segment_name, index)
+
+        # Waiting for the encoder, encoding the file here and waiting for it to appear share one deadline
+        deadline = time.monotonic() + settings.SEGMENT_WAIT_TIMEOUT_SECONDS
         
         if segment_name == 'init.mp4':
             if os.path.exists(segment_path + segment_name):
@@ -60,24 +163,43 @@ class VideoSegmentView(APIView):
                     response['Content-Disposition'] = f'inline; filename="{segment_name}"'
                     return response
             else:
-                worker_id = str(video_id) + "_" + "_" + resolution + "_" + request.user.username + "_init"
-                start_transcode_worker(video_id, resolution, segment_name, codec='h264', worker_id=worker_id, continuous=False)
-                while not os.path.exists(segment_path + segment_name):
-                    print(f"Waiting for {segment_name} to be transcoded...")
-                    time.sleep(1)
-                with open(segment_path + segment_name, 'rb') as f:
-                    response = HttpResponse(f.read(), content_type='video/mpegts')
-                    response['Content-Disposition'] = f'inline; filename="{segment_name}"'
-                    return response
+                # The continuous encode started by the playlist request writes init.mp4 first (not in LL-HLS mode)
+                viewer_id = str(video_id) + "_" + "_" + resolution + "_" + request.user.username
+                written = (
+                    not settings.LL_HLS_ENABLED and continuous_encode_pending(video_id, resolution, viewer_id, 0)
+                    and wait_for_segment_completion(video_id, resolution, segment_name, timeout=_remaining(deadline), stable_time=0.5)
+                )
+                if not written and _remaining(deadline):
+                    worker_id = viewer_id + "_init"
+                    start_transcode_worker(video_id, resolution, segment_name, codec='h264', worker_id=worker_id, continuous=False, timeout=_remaining(deadline))
+                return self._await_file(request, video_id, resolution, segment_path, segment_name, deadline)
         
         requested_segment_num = None
         try:
             if segment_name.startswith('segment_') and segment_name.endswith('.mp4'):
                 requested_segment_num = int(segment_name.split('_')[1].split('.')[0])
-                set_heartbeat(video_id, resolution, requested_segment_num)
+                # LL-HLS players fetch a segment as several parts: count it once, on its first part
+                if not self._is_later_part(request, segment_path + segment_name):
+                    record_view(video_id, resolution, request.user.username, requested_segment_num)
         except Exception:
             pass  # Continue even if heartbeat fails
-        
+
+        if requested_segment_num is not None and not os.path.exists(segment_path + segment_name):
+            # Wait for a segment the running (or just started) encoder is about to write
+            worker_id = str(video_id) + "_" + "_" + resolution + "_" + request.user.username
+            if continuous_encode_pending(video_id, resolution, worker_id, requested_segment_num):
+                wait_for_segment_completion(video_id, resolution, segment_name, timeout=_remaining(deadline), stable_time=0)
+
+        if settings.LL_HLS_ENABLED and requested_segment_num is not None:
+            if segment_in_progress(video_id, resolution, requested_segment_num):
+                part = self._serve_part(request, segment_path + segment_name)
+                if part is not None:
+                    return part
+                # A whole segment is only served once the encoder has moved on
+                wait_for_complete_segment(video_id, resolution, requested_segment_num, timeout=_remaining(deadline))
+            if request.headers.get('Range') and os.path.exists(segment_path + segment_name):
+                return serve_media_file(request, segment_path + segment_name, CONTENT_TYPES['.mp4'])
+
         # If segment exists, serve it
         if os.path.exists(segment_path + segment_name):
                 with open(segment_path + segment_name, 'rb') as f:
@@ -101,15 +223,94 @@ class VideoSegmentView(APIView):
             worker_id = str(video_id) + "_" + "_" + resolution + "_" + request.user.username
             
             # Use single-segment transcode (not continuous) for this request
-            start_transcode_worker(video_id, resolution, segment_name, codec='h264', worker_id=worker_id, continuous=False)
-            while not os.path.exists(segment_path + segment_name):
-                print(f"Waiting for segment {segment_name} to be transcoded...")
-                time.sleep(2)
-            with open(segment_path + segment_name, 'rb') as f:
-                response = HttpResponse(f.read(), content_type='video/mpegts')
-                response['Content-Disposition'] = f'inline; filename="{segment_name}"'
-                return response
+            if _remaining(deadline):
+                start_transcode_worker(video_id, resolution, segment_name, codec='h264', worker_id=worker_id, continuous=False, timeout=_remaining(deadline))
+            return self._await_file(request, video_id, resolution, segment_path, segment_name, deadline)
         return Response({"error": "Segment not found after transcoding."}, status=status.HTTP_404_NOT_FOUND)
+
+    def _await_file(self, request, video_id, resolution, segment_path, segment_name, deadline):
+        """Serve a file once the encoder has written it, or from rendition.mp4 if the output is compacted meanwhile.
+
+        503 if neither happens before `deadline` (time.monotonic()).
+        """
+        while True:
+            # Compaction removes the segment files once the index is written: look for the index first
+            index = rendition_index(segment_path)
+            if index is not None:
+                return self._serve_compacted(request, video_id, resolution, segment_path, segment_name, index)
+            try:
+                with open(segment_path + segment_name, 'rb') as f:
+                    response = HttpResponse(f.read(), content_type='video/mpegts')
+                    response['Content-Disposition'] = f'inline; filename="{segment_name}"'
+                    return response
+            except FileNotFoundError:
+                pass
+            if time.monotonic() >= deadline:
+                response = Response({"error": f"{segment_name} is still being transcoded."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response['Retry-After'] = str(SEGMENT_RETRY_AFTER_SECONDS)
+                return response
+            time.sleep(0.5)
+
+    def _serve_compacted(self, request, video_id, resolution, segment_path, segment_name, index):
+        """Serve a compacted output: byte ranges of rendition.mp4, or a file of the per-file playlist cut out of it."""
+        rendition_path = segment_path + RENDITION_FILE
+        if segment_name == RENDITION_FILE:
+            # Count a segment on the request for its first byte, like a segment file
+            match = RANGE_RE.match(request.headers.get('Range', ''))
+            segment_number = segment_starting_at(index, int(match.group(1))) if match and match.group(1) else None
+            if segment_number is not None:
+                try:
+                    record_view(video_id, resolution, request.user.username, segment_number)
+                except Exception:
+                    pass
+            return serve_media_file(request, rendition_path, CONTENT_TYPES['.mp4'])
+        byte_range = file_range(index, segment_name)
+        if byte_range is None:
+            return Response({"error": "Segment not found."}, status=status.HTTP_404_NOT_FOUND)
+        if segment_name != 'init.mp4':
+            try:
+                record_view(video_id, resolution, request.user.username, int(segment_name.split('_')[1].split('.')[0]))
+            except Exception:
+                pass
+        offset, size = byte_range
+        with open(rendition_path, 'rb') as f:
+            f.seek(offset)
+            response = HttpResponse(f.read(size), content_type='video/mpegts')
+        response['Content-Disposition'] = f'inline; filename="{segment_name}"'
+        return response
+
+    def _is_later_part(self, request, path):
+        """True for an LL-HLS part request that does not start at the segment's first fragment."""
+        match = RANGE_RE.match(request.headers.get('Range', ''))
+        if not (settings.LL_HLS_ENABLED and match and match.group(1)) or not os.path.exists(path):
+            return False
+        return int(match.group(1)) > (complete_fragments(path)[1] or 0)
+
+    def _serve_part(self, request, path):
+        """Serve a byte range of a segment the encoder is still writing, or None if the request has no range.
+
+        An open range (a preload hint, `bytes=<start>-`) is held until the fragment starting there is
+        complete and answered with exactly that fragment.
+        """
+        match = RANGE_RE.match(request.headers.get('Range', ''))
+        if not match or not match.group(1):
+            return None
+        start = int(match.group(1))
+        if match.group(2):
+            end = int(match.group(2))
+            if not os.path.exists(path) or os.path.getsize(path) <= end:
+                end = wait_for_part(path, start, settings.LL_HLS_PART_TARGET_SECONDS * 3)
+        else:
+            end = wait_for_part(path, start, settings.LL_HLS_PART_TARGET_SECONDS * 3)
+        if end is None:
+            return Response({"error": "Part not available."}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            response = HttpResponse(f.read(end - start + 1), content_type=CONTENT_TYPES['.mp4'], status=status.HTTP_206_PARTIAL_CONTENT)
+        # The total size is not known while the encoder is writing
+        response['Content-Range'] = f'bytes {start}-{end}/*'
+        response['Cache-Control'] = 'no-cache'
+        return response
     
 class PreviewM3U8View(APIView):
     """API view to serve the M3U8 playlist for a preview."""
@@ -139,8 +340,13 @@ class PreviewSegmentView(APIView):
                 return response
         return Response({"error": "Preview segment not found."}, status=status.HTTP_404_NOT_FOUND)
     
-class ThumbnailView(APIView):
-    """API view to serve video thumbnails."""
+class ThumbnailView(AnyAcceptMixin, APIView):
+    """API view to serve video thumbnails.
+
+    `?size=<width>` serves the smallest pre-sized variant at least that wide (or the largest one),
+    as WebP when the client accepts it unless `?ext=jpg|webp` is given (`format` is taken by DRF). Without a size the
+    full resolution thumbnail.jpg is served.
+    """
 
     permission_classes = []  # Allow public access to thumbnails
     authentication_classes = []  # Disable authentication for thumbnail access
@@ -148,11 +354,121 @@ class ThumbnailView(APIView):
     def get(self, request, video_id):
         video = Video.objects.filter(id=video_id).first()
         if video and video.thumbnail_url:
-            thumbnail_path = os.path.join(f'media/index/video_{video_id}/thumbnail.jpg')
+            thumbnail_dir = f'media/index/video_{video_id}/'
+            thumbnail_path = os.path.join(thumbnail_dir, 'thumbnail.jpg')
+            size = request.query_params.get('size')
+            if size:
+                if not size.isdigit():
+                    return Response({"error": "size must be a width in pixels."}, status=status.HTTP_400_BAD_REQUEST)
+                fmt = request.query_params.get('ext')
+                if fmt not in ('webp', 'jpg'):
+                    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpg'
+                thumbnail_path = self._closest_variant(thumbnail_dir, int(size), fmt) or thumbnail_path
             if os.path.exists(thumbnail_path):
-                with open(thumbnail_path, 'rb') as f:
-                    response = HttpResponse(f.read(), content_type='image/jpeg')
-                    response['Content-Disposition'] = f'inline; filename="{os.path.basename(video.thumbnail_url)}"'
-                    return response
+                content_type = 'image/webp' if thumbnail_path.endswith('.webp') else 'image/jpeg'
+                response = serve_media_file(request, thumbnail_path, content_type, max_age=settings.THUMBNAIL_CACHE_MAX_AGE, public=True)
+                response['Content-Disposition'] = f'inline; filename="{os.path.basename(thumbnail_path)}"'
+                response['Vary'] = 'Accept'
+                return response
         return Response({"error": "Thumbnail not found."}, status=status.HTTP_404_NOT_FOUND)
-        
\ No newline at end of file
+
+    def _closest_variant(self, thumbnail_dir, width, fmt):
+        """Path of the smallest thumbnail_<w>.<fmt> with w >= width, else the largest one; None if there are none."""
+        widths = []
+        for name in os.listdir(thumbnail_dir) if os.path.isdir(thumbnail_dir) else []:
+            match = THUMBNAIL_VARIANT_RE.match(name)
+            if match and match.group(2) == fmt:
+                widths.append(int(match.group(1)))
+        if not widths:
+            return None
+        fitting = [w for w in widths if w >= width]
+        chosen = min(fitting) if fitting else max(widths)
+        return os.path.join(thumbnail_dir, f'thumbnail_{chosen}.{fmt}')
+
+class TrickplayView(AnyAcceptMixin, APIView):
+    """API view to serve trick-play assets (sprite sheets, WebVTT index, I-frame playlist and stream).
+
+    The files are generated once after upload, so they are cached by the browser and support
+    byte ranges; scrubbing never has to start a segment transcode.
+    """
+
+    def get(self, request, video_id, file_name):
+        if not TRICKPLAY_FILE_RE.match(file_name):
+            return Response({"error": "Trick-play file not found."}, status=status.HTTP_404_NOT_FOUND)
+        path = os.path.join(generate_trickplay_path(video_id), file_name)
+        if not os.path.exists(path):
+            return Response({"error": "Trick-play file not found."}, status=status.HTTP_404_NOT_FOUND)
+        content_type = CONTENT_TYPES[os.path.splitext(file_name)[1]]
+        return serve_media_file(request, path, content_type, max_age=settings.TRICKPLAY_CACHE_MAX_AGE)
+
+class ChunkedUploadView(APIView):
+    """API view to start a resumable upload (POST) or find an unfinished one to resume (GET ?filename=&size=).
+
+    Used by the admin video form, so it authenticates with the admin session.
+    """
+
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        uploads = ChunkedUpload.objects.filter(user=request.user, status=ChunkedUpload.UploadStatus.UPLOADING)
+        if request.query_params.get('filename'):
+            uploads = uploads.filter(filename=os.path.basename(request.query_params['filename']))
+        if request.query_params.get('size', '').isdigit():
+            uploads = uploads.filter(total_size=int(request.query_params['size']))
+        serializer = ChunkedUploadSerializer(uploads.order_by('-updated_at')[:20], many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = ChunkedUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cleanup_stale_uploads()
+        upload = create_upload(request.user, serializer.validated_data['filename'], serializer.validated_data['total_size'])
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+class ChunkedUploadDetailView(APIView):
+    """API view to query (GET), append a chunk to (PUT with Content-Range) or abort (DELETE) a resumable upload.
+
+    Chunk bodies are raw bytes and are streamed straight into the upload's .part file.
+    """
+
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, upload_id):
+        upload = ChunkedUpload.objects.filter(id=upload_id, user=request.user).first()
+        if upload is None:
+            return Response({"error": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_200_OK)
+
+    def put(self, request, upload_id):
+        upload = ChunkedUpload.objects.filter(id=upload_id, user=request.user).first()
+        if upload is None:
+            return Response({"error": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        match = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({"error": "Content-Range: bytes <start>-<end>/<total> is required."}, status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = (int(v) for v in match.groups())
+        length = end - start + 1
+        if total != upload.total_size or length != int(request.META.get('CONTENT_LENGTH') or 0):
+            return Response({"error": "Content-Range does not match the upload or the request body."}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+            return Response({"error": f"Chunks may be at most {settings.UPLOAD_MAX_CHUNK_SIZE} bytes."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        try:
+            upload = write_chunk(upload, start, request.stream, length)
+        except ChunkError as e:
+            return Response({"error": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT)
+        try:
+            # Probe, thumbnail and preview the part already on disk while the rest is uploading
+            schedule_early_ingest(upload)
+        except Exception as e:
+            print(f"Could not schedule early ingest for upload {upload.id}: {e}")
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, upload_id):
+        upload = ChunkedUpload.objects.filter(id=upload_id, user=request.user).first()
+        if upload is None:
+            return Response({"error": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
@@ -0,0 +1,103 @@
+import importlib
+import json
+import time
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from django_redis import get_redis_connection
+from rq import SimpleWorker, Worker
+from rq.utils import now
+
+# Imported once by the pool before it forks its workers, so no job pays for them
+PRELOAD_MODULES = [
+	'imdb', 'psutil', 'rest_framework', 'django_redis',
+	'video_app.models', 'video_app.api.transcode', 'video_app.api.pipeline', 'video_app.api.early_ingest',
+	'video_app.api.warmup', 'video_app.api.viewing_stats', 'video_app.api.scripts',
+	'jwt_auth_app.api.scripts',
+]
+INPROCESS = 'inprocess'
+FORK = 'fork'
+LATENCY_SAMPLES = 1000
+
+
+def _latency_key(queue_name):
+	return cache.make_key(f"rq_start_latency_{queue_name}")
+
+
+def isolation(queue_name):
+	"""How jobs of a queue run: 'inprocess' in the warm worker itself, or 'fork' in a fresh work horse."""
+	return settings.RQ_JOB_ISOLATION.get(queue_name, FORK)
+
+
+def preload():
+	"""Import the modules jobs use and check the database and Redis are reachable."""
+	for name in PRELOAD_MODULES:
+		try:
+			importlib.import_module(name)
+		except ImportError:
+			pass
+	connections['default'].ensure_connection()
+	get_redis_connection('default').ping()
+
+
+def record_start_latency(queue_name, mode, wait, startup):
+	"""Keep the last LATENCY_SAMPLES (queue wait, dequeue -> job code) samples of a queue."""
+	try:
+		key = _latency_key(queue_name)
+		pipe = get_redis_connection('default').pipeline(transaction=False)
+		pipe.lpush(key, json.dumps([mode, round(wait, 4), round(startup, 4)]))
+		pipe.ltrim(key, 0, LATENCY_SAMPLES - 1)
+		pipe.execute()
+	except Exception:
+		pass
+
+
+def start_latency_samples(queue_name):
+	"""{mode: {'wait': [seconds], 'startup': [seconds], 'total': [seconds]}} of the recorded samples of a queue."""
+	samples = {}
+	for raw in get_redis_connection('default').lrange(_latency_key(queue_name), 0, -1):
+		mode, wait, startup = json.loads(raw)
+		entry = samples.setdefault(mode, {'wait': [], 'startup': [], 'total': []})
+		entry['wait'].append(wait)
+		entry['startup'].append(startup)
+		entry['total'].append(wait + startup)
+	return samples
+
+
+class WarmWorker(Worker):
+	"""RQ worker that runs jobs of 'inprocess' queues (RQ_JOB_ISOLATION) in its own warm process.
+
+	Those jobs skip the fork and reuse the worker's imports and its database and Redis
+	connections (kept for CONN_MAX_AGE, checked between jobs like between requests). Jobs of
+	'fork' queues (long or crash-prone encodes) still get a work horse; the database connection
+	is closed first so the horse does not share its socket.
+	"""
+
+	def execute_job(self, job, queue):
+		self._dequeued_at = time.monotonic()
+		enqueued_at = job.enqueued_at
+		if enqueued_at is not None and enqueued_at.tzinfo is None:
+			enqueued_at = enqueued_at.replace(tzinfo=dt_timezone.utc)
+		self._queue_wait = max(0.0, (now() - enqueued_at).total_seconds()) if enqueued_at else 0.0
+		if isolation(queue.name) == INPROCESS:
+			close_old_connections()
+			try:
+				SimpleWorker.execute_job(self, job, queue)
+			finally:
+				close_old_connections()
+		else:
+			connections.close_all()
+			super().execute_job(job, queue)
+
+	def perform_job(self, job, queue):
+		# Runs in the work horse for forked jobs, so the startup time includes the fork
+		record_start_latency(queue.name, isolation(queue.name), self._queue_wait, time.monotonic() - self._dequeued_at)
+		return super().perform_job(job, queue)
+
+	def get_heartbeat_ttl(self, job):
+		# Nothing heartbeats while an in-process job runs: cover its whole timeout like SimpleWorker
+		if isolation(job.origin) == INPROCESS:
+			return SimpleWorker.get_heartbeat_ttl(self, job)
+		return super().get_heartbeat_ttl(job)
@@ -0,0 +1,165 @@
+import os
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from video_app.models import Video, ViewingStats
+from video_app.api.compact import rendition_index
+from video_app.api.eviction import EVICTION_STATS_KEY
+from video_app.api.scripts import get_m3u8_file
+from video_app.api.transcode import generate_transcode_path, transcode_video_segment
+from video_app.api.workers import get_rendition_params, playlist_segment_durations, schedule_periodic_job
+
+# Popularity added per playlist request (a play start) and per segment request (about 5s watched),
+# see viewing_stats.record_view.
+PLAY_WEIGHT = 1.0
+SEGMENT_WEIGHT = 0.1
+WARMUP_JOB_KEY = "warmup_job_id"
+
+
+def _day_key(day):
+	# Raw Redis keys: prefix them like cache keys so test and production data stay apart
+	return cache.make_key(f"popularity_{day:%Y%m%d}")
+
+
+def add_popularity(pipe, video_id, resolution, weight):
+	"""Queue on a Redis pipeline: add `weight` to today's score of an output (a sorted set per day, kept for the window)."""
+	key = _day_key(date.today())
+	pipe.zincrby(key, weight, f"{video_id}:{resolution}")
+	pipe.expire(key, (settings.POPULARITY_WINDOW_DAYS + 1) * 24 * 60 * 60)
+
+
+def popularity_scores(limit=1000):
+	"""[(video_id, resolution, score)] of the most popular outputs, best first.
+
+	Sums the daily sorted sets of the popularity window server-side (ZUNIONSTORE), each day
+	weighted down by POPULARITY_HALF_LIFE_DAYS.
+	"""
+	today = date.today()
+	weights = {
+		_day_key(today - timedelta(days=age)): 0.5 ** (age / settings.POPULARITY_HALF_LIFE_DAYS)
+		for age in range(settings.POPULARITY_WINDOW_DAYS)
+	}
+	redis = get_redis_connection('default')
+	ranking = cache.make_key("popularity_ranking")
+	pipe = redis.pipeline(transaction=False)
+	pipe.zunionstore(ranking, weights)
+	pipe.zrevrange(ranking, 0, limit - 1, withscores=True)
+	pipe.delete(ranking)
+	_count, members, _deleted = pipe.execute()
+
+	scores = []
+	for member, score in members:
+		video_id, _, resolution = member.decode().partition(':')
+		if video_id.isdigit() and resolution:
+			scores.append((int(video_id), resolution, score))
+	return scores
+
+
+def stats_scores(limit=1000):
+	"""[(video_id, resolution, play starts)] from the all-time ViewingStats counters, for when Redis has no ranking."""
+	scores = []
+	for video_id, resolution_views in ViewingStats.objects.order_by('-views').values_list('video_id', 'resolution_views')[:limit]:
+		scores.extend((video_id, resolution, count) for resolution, count in resolution_views.items())
+	return scores
+
+
+def rank_outputs(scores, titles, per_title):
+	"""Pick the outputs to warm: the `per_title` most requested resolutions of the `titles` best titles.
+
+	`scores` is [(video_id, resolution, score)]; a title ranks by the sum over its resolutions.
+	"""
+	by_title = {}
+	for video_id, resolution, score in scores:
+		resolutions = by_title.setdefault(video_id, {})
+		resolutions[resolution] = resolutions.get(resolution, 0) + score
+	ranked = sorted(by_title.items(), key=lambda item: (-sum(item[1].values()), item[0]))[:titles]
+	return [
+		(video_id, resolution)
+		for video_id, resolutions in ranked
+		for resolution in sorted(resolutions, key=lambda r: (-resolutions[r], r))[:per_title]
+	]
+
+
+def popular_outputs(titles=None, per_title=None):
+	"""Outputs worth warming, ranked by popularity. Views of a duplicate count for the video owning the files."""
+	titles = titles or settings.WARMUP_TITLES
+	per_title = per_title or settings.WARMUP_RESOLUTIONS_PER_TITLE
+	try:
+		scores = popularity_scores()
+	except Exception:
+		scores = []
+	# Redis was flushed or the window is empty: fall back to the all-time counters
+	scores = [s for s in scores or stats_scores() if s[1] in settings.TRANSCODE_LADDER]
+	owners = dict(Video.objects.filter(id__in={s[0] for s in scores}).values_list('id', 'source_video_id'))
+	return rank_outputs(
+		[(owners[video_id] or video_id, resolution, score) for video_id, resolution, score in scores if video_id in owners],
+		titles, per_title,
+	)
+
+
+def warm_opening(video_id, resolution, segments=None):
+	"""Encode init.mp4 and the first `segments` segments of an output unless they are on disk. Returns the number encoded."""
+	segments = settings.WARMUP_SEGMENTS if segments is None else segments
+	video = Video.objects.get(pk=video_id)
+	m3u8 = get_m3u8_file(os.path.join(f"media/index/video_{video_id}/", 'index.m3u8'), video_id)
+	if not m3u8 or not m3u8.startswith("#EXTM3U"):
+		raise ValueError(f"No playlist for video {video_id}: {m3u8}")
+	durations = playlist_segment_durations(m3u8)
+	scale_param, codec_param, bitrate, audio_param = get_rendition_params(video, resolution)
+	output_dir = generate_transcode_path(video_id, resolution)
+	if rendition_index(output_dir) is not None:
+		return 0
+
+	encoded = 0
+	for segment_name in ['init.mp4'] + list(durations)[:segments]:
+		if os.path.exists(os.path.join(output_dir, segment_name)):
+			continue
+		result = transcode_video_segment(
+			video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param,
+			segment_duration=durations.get(segment_name) or 5,
+		)
+		if result == "Success":
+			encoded += 1
+	return encoded
+
+
+def cache_has_room():
+	"""False once the last eviction pass found the transcode cache over budget: warming would only churn it."""
+	stats = cache.get(EVICTION_STATS_KEY)
+	return not stats or stats['total_bytes'] < stats['max_bytes']
+
+
+def warm_popular_openings(titles=None, segments=None, per_title=None, on_result=None):
+	"""Warm the openings of the most popular outputs, best first. Returns {(video_id, resolution): encoded or error}."""
+	results = {}
+	for video_id, resolution in popular_outputs(titles, per_title):
+		if not cache_has_room():
+			break
+		try:
+			results[(video_id, resolution)] = warm_opening(video_id, resolution, segments)
+		except Exception as e:
+			results[(video_id, resolution)] = f"Error: {e}"
+		if on_result:
+			on_result(video_id, resolution, results[(video_id, resolution)])
+	return results
+
+
+def warmup_job(reschedule=True):
+	"""RQ worker: one warm-up pass, then queue the next one WARMUP_INTERVAL_SECONDS later."""
+	started = time.time()
+	try:
+		results = warm_popular_openings()
+	finally:
+		if reschedule and settings.WARMUP_INTERVAL_SECONDS:
+			schedule_warmup(settings.WARMUP_INTERVAL_SECONDS)
+	encoded = sum(r for r in results.values() if isinstance(r, int))
+	return f"Warmed {len(results)} outputs, {encoded} files encoded in {time.time() - started:.1f}s"
+
+
+def schedule_warmup(delay=0):
+	"""Queue the periodic warm-up job on 'low' unless one is already waiting."""
+	return schedule_periodic_job(warmup_job, WARMUP_JOB_KEY, delay)
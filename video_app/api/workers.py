@@ -1,12 +1,16 @@
-import os, subprocess, json, psutil
+import os, json, psutil, uuid
 from django.conf import settings
+from django.core.cache import cache
 from datetime import timedelta
 import django_rq
 from django_rq import enqueue
+from rq import get_current_job
 
-from video_app.api.transcode import transcode_video_segment, transcode_continuously, generate_transcode_path, generate_m3u8_file, get_thumbnail_from_video
+from video_app.api.transcode import transcode_video_segment, transcode_continuously, generate_transcode_path
 from video_app.api.scripts import wait_for_segment_completion
-from video_app.models import Thumbnail
+from video_app.api.job_registry import enqueue_transcode_job, is_job_active, unregister_job
+from video_app.api.transcode_daemon import submit_continuous
+from video_app.api.compact import rendition_index
 
 def kill_continuous_worker(video_id, resolution):
 	"""Kill the continuous transcode worker for a given video/resolution."""
@@ -21,28 +25,23 @@ def kill_continuous_worker(video_id, resolution):
 			pid = data.get('pid')
 			worker_id = data.get('worker_id')
 
-			# Kill the process only if it exists
+			# Kill the process only if it exists; its monitor (RQ job or transcode daemon) then ends
 			if pid:
 				try:
 					if psutil.pid_exists(int(pid)):
-						subprocess.run(['taskkill', '/F', '/PID', str(int(pid))], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+						psutil.Process(int(pid)).kill()
 				except Exception:
 					pass
 
-			# Remove the RQ job if it exists
+			# Remove the RQ job if it is still waiting in the queue
 			if worker_id:
 				try:
-					queue = django_rq.get_queue('low')
-					jobs = queue.get_jobs()
-					for job in jobs:
-						if job.id == worker_id:
-							try:
-								job.cancel()
-							except Exception:
-								pass
-							break
+					job = django_rq.get_queue('low').fetch_job(worker_id)
+					if job is not None and job.get_status() == 'queued':
+						job.cancel()
 				except Exception:
 					pass
+				unregister_job(video_id, resolution, worker_id)
 
 		# Remove lockfile
 		try:
@@ -56,53 +55,16 @@ def kill_continuous_worker(video_id, resolution):
 		return False
 
 
-def start_transcode_worker(video_id, resolution, segment_name, codec='h264', worker_id=None, continuous=False):
-	"""Helper function to start a background worker for transcoding a video segment."""
-	from video_app.models import Video
-
-	queue = django_rq.get_queue('low')
-	jobs = queue.get_jobs()
-	# Normalize job ids: use per-user-per-output ids for continuous workers so a user can
-	# run multiple continuous workers for different videos/resolutions.
-	continuous_job_id = None
-	if worker_id:
-		continuous_job_id = f"{worker_id}_video{video_id}_{resolution}"
-
-	for job in jobs:
-		# avoid duplicate segment jobs for same worker
-		if worker_id and job.id == f"{worker_id}_{segment_name}":
-			return
-
-	# If a continuous job for this exact output already exists (same job id), wait for the
-	# requested segment to be completed by the running worker instead of enqueuing another.
-	if continuous and continuous_job_id:
-		for job in jobs:
-			if job.id == continuous_job_id:
-				# Wait for requested segment to be fully written before returning to the view
-				wait_for_segment_completion(video_id, resolution, segment_name, timeout=60, stable_time=2)
-				return  # Continuous worker already exists for this video/resolution/user
-
-	try:
-		video = Video.objects.get(pk=video_id)
-	except Video.DoesNotExist:
-		return  # Cannot start worker if video does not exist
-
-	# Determine resolution parameters
-	if resolution == '480p':
-		scale_param = 'scale=-2:480'
-		bitrate = '1200k'
-	elif resolution == '720p':
-		scale_param = 'scale=-2:720'
-		bitrate = '2500k'
-	elif resolution == '1080p':
-		scale_param = 'scale=-2:1080'
-		bitrate = '5000k'
-	elif resolution == '2160p':
-		scale_param = 'scale=-2:2160'
-		bitrate = '12000k'
-	else:
+def get_rendition_params(video, resolution):
+	"""Return (scale_param, codec_param, bitrate, audio_param) ffmpeg settings for a rendition of `video`."""
+	# Determine resolution parameters from the configured ladder
+	rendition = settings.TRANSCODE_LADDER.get(resolution)
+	if not rendition:
 		raise ValueError(f"Unsupported resolution: {resolution}")
+	scale_param = f"scale=-2:{rendition['height']}"
+	bitrate = rendition['bitrate']
 
+	codec_param = 'libx264'
 	if video.resolution:
 		try:
 			orig_width, orig_height = map(int, video.resolution.split('x'))
@@ -114,36 +76,100 @@ def start_transcode_worker(video_id, resolution, segment_name, codec='h264', wor
 			if orig_width and orig_height and getattr(video, 'bitrate_kbps', None):
 				bitrate = str(int(video.bitrate_kbps * 0.8)) + 'k'  # Reduce bitrate for lower resolution
 
-		codec_param = 'libx264' 
-
 	if getattr(video, 'audio_codec', None) == 'aac':
 		audio_param = 'copy'
 	else:
 		audio_param = 'aac'
-		
+
+	return scale_param, codec_param, bitrate, audio_param
+
+def playlist_segment_durations(m3u8_content):
+	"""{segment file name: #EXTINF duration} of a media playlist, in playlist order."""
+	durations = {}
+	duration = None
+	for line in m3u8_content.splitlines():
+		line = line.strip()
+		if line.startswith('#EXTINF:'):
+			try:
+				duration = float(line.split(':', 1)[1].split(',')[0].strip())
+			except ValueError:
+				duration = None
+		elif line and not line.startswith('#'):
+			durations[line.replace('\\', '/').rsplit('/', 1)[-1]] = duration
+			duration = None
+	return durations
+
+# How many segments past the newest one on disk a request may be and still wait for the running encoder
+CONTINUOUS_WAIT_AHEAD = 2
+
+def continuous_encode_pending(video_id, resolution, worker_id, segment_number):
+	"""True if a continuous encode of the output runs (or this viewer's is queued) and is about to write `segment_number`.
+
+	The playlist view only starts the encoder, so the segment requests right after it wait for
+	that encoder instead of encoding the same segments a second time.
+	"""
+	output_dir = generate_transcode_path(video_id, resolution)
+	try:
+		with open(os.path.join(output_dir, 'continuous.lock'), 'r') as lf:
+			start = json.load(lf).get('segment')
+	except (OSError, ValueError):
+		if not is_job_active(video_id, resolution, f"{worker_id}_video{video_id}_{resolution}"):
+			return False
+		start = None
+	if start is None:
+		# Not started yet: the playlist view starts encodes at the opening
+		return segment_number < CONTINUOUS_WAIT_AHEAD
+	newest = start - 1
+	while os.path.exists(os.path.join(output_dir, f"segment_{newest + 1:03d}.mp4")):
+		newest += 1
+	return start <= segment_number <= newest + CONTINUOUS_WAIT_AHEAD
+
+def start_transcode_worker(video_id, resolution, segment_name, codec='h264', worker_id=None, continuous=False, wait=True, timeout=None):
+	"""Helper function to start a background worker for transcoding a video segment.
+
+	With wait=False a continuous encode is only submitted, without waiting for its first segment: the
+	playlist view returns right away and segment requests wait for the encoder instead. A single segment
+	(continuous=False) is encoded in this process, within `timeout` seconds if given.
+	"""
+	from video_app.models import Video
+
+	# A compacted output is served from rendition.mp4, there is nothing left to encode
+	if rendition_index(generate_transcode_path(video_id, resolution)) is not None:
+		return
+
+	queue = django_rq.get_queue('low')
+	# Normalize job ids: use per-user-per-output ids for continuous workers so a user can
+	# run multiple continuous workers for different videos/resolutions.
+	continuous_job_id = None
+	if worker_id:
+		continuous_job_id = f"{worker_id}_video{video_id}_{resolution}"
+
+	# avoid duplicate segment jobs for same worker
+	if worker_id and is_job_active(video_id, resolution, f"{worker_id}_{segment_name}"):
+		return
+
+	# If a continuous job for this exact output is queued or running (same job id), wait for the
+	# requested segment to be completed by that worker instead of enqueuing another.
+	if continuous and continuous_job_id and is_job_active(video_id, resolution, continuous_job_id):
+		# Wait for requested segment to be fully written before returning to the view
+		if wait:
+			wait_for_segment_completion(video_id, resolution, segment_name, timeout=60, stable_time=2)
+		return  # Continuous worker already exists for this video/resolution/user
+
+	try:
+		video = Video.objects.get(pk=video_id)
+	except Video.DoesNotExist:
+		return  # Cannot start worker if video does not exist
+
+	scale_param, codec_param, bitrate, audio_param = get_rendition_params(video, resolution)
+
 	index_path = os.path.join(settings.BASE_DIR, f"media/index/video_{video_id}/index.m3u8")
-	segment_duration = None
 	try:
 		with open(index_path, 'r', encoding='utf-8') as f:
-			lines = [ln.strip() for ln in f.readlines()]
-
-		target_basename = os.path.basename(segment_name)
-		for i, line in enumerate(lines):
-			if line == target_basename or line.endswith('/' + target_basename) or line.endswith('\\' + target_basename):
-				# search backwards for the nearest #EXTINF: line
-				for j in range(i - 1, -1, -1):
-					if lines[j].startswith('#EXTINF:'):
-						val = lines[j].split(':', 1)[1].split(',')[0].strip()
-						try:
-							segment_duration = float(val)
-						except Exception:
-							segment_duration = None
-						break
-				break
-
+			segment_duration = playlist_segment_durations(f.read()).get(os.path.basename(segment_name))
 	except Exception:
 		segment_duration = None
-		
+
 	if not continuous:
 		# If a continuous transcode is running for same video/resolution/user, kill it so this segment job can run
 		if worker_id:
@@ -160,179 +186,115 @@ def start_transcode_worker(video_id, resolution, segment_name, codec='h264', wor
 							kill_continuous_worker(video_id, resolution)
 				except Exception:
 					pass
-		transcode_video_segment(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration=segment_duration or 5)
+		# A viewer is waiting on this segment (startup or a seek): trade some bitrate efficiency for encode time
+		transcode_video_segment(
+			video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param,
+			segment_duration=segment_duration or 5, preset=settings.TRANSCODE_ON_DEMAND_PRESET, timeout=timeout,
+		)
 		#queue.enqueue(transcode_video_segment, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, job_id=worker_id + segment_name)
 	else:
-		# Enqueue a continuous job with a per-output job id and pass that id into the worker so
+		# Start a continuous encode with a per-output job id and pass that id into the worker so
 		# the worker writes it into the lockfile. This allows multiple continuous workers per user
 		# for different videos/resolutions while preventing duplicates for the same output.
-		if continuous_job_id:
-			queue.enqueue(
-				transcode_continuously,
-				video_id,
-				resolution,
-				scale_param,
-				segment_name,
-				codec_param,
-				bitrate,
-				audio_param,
-				segment_duration or 5,
-				continuous_job_id,
-				job_id=continuous_job_id,
-			)
-			# Wait for requested segment to be completed by ffmpeg before returning
-			wait_for_segment_completion(video_id, resolution, segment_name, timeout=60, stable_time=2)
-		else:
-			queue.enqueue(transcode_continuously, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration=segment_duration or 5)
+		start_continuous_transcode(
+			queue, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param,
+			segment_duration or 5, worker_id=continuous_job_id, job_id=continuous_job_id,
+		)
+		# Wait for requested segment to be completed by ffmpeg before returning
+		if wait:
 			wait_for_segment_completion(video_id, resolution, segment_name, timeout=60, stable_time=2)
 
-def video_post_upload_worker(video_id):
-	"""Background worker to process a newly uploaded video.
-
-	Performs:
-	1. IMDb metadata fetch (if imdb_id is set)
-	2. FFprobe to extract technical metadata
-	3. Create/update Preview and trigger preview transcode
-
-	This runs in RQ to prevent request timeouts during upload.
-	"""
-	from video_app.models import Video, Preview
-	from video_app.api.scripts import fetch_and_fill_imdb_metadata
-	from video_app.api.transcode import probe_a_video, transcode_preview
-
-	try:
-		video = Video.objects.get(pk=video_id)
-	except Video.DoesNotExist:
-		return {'error': f'Video {video_id} not found'}
-
-	result = {
-		'video_id': video_id,
-		'imdb_fetched': False,
-		'imdb_error': None,
-		'probe_success': False,
-		'probe_error': None,
-		'preview_created': False,
-	}
-
-	# 1. Fetch IMDb metadata if imdb_id is provided
-	if video.imdb_id:
-		try:
-			video, data = fetch_and_fill_imdb_metadata(video)
-			video.save()
-			result['imdb_fetched'] = True
-			result['imdb_title'] = data.get('title')
-			result['imdb_year'] = data.get('year')
-			print(f"video_post_upload_worker: IMDb metadata fetched for video {video_id}: {result.get('imdb_title')} ({result.get('imdb_year')})")
-		except Exception as e:
-			result['imdb_error'] = str(e)
-			print(f"video_post_upload_worker: IMDb fetch failed for video {video_id}: {result['imdb_error']}")
-
-	# 2. Probe video file for technical metadata
-	try:
-		path = video.video_file.path
-		info = probe_a_video(path)
-
-		changed = False
-		# video codec
-		vcodec = info.get('video_codec')
-		if vcodec and video.codec != vcodec:
-			video.codec = vcodec
+def start_continuous_transcode(queue, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=None, job_id=None):
+	"""Hand a continuous encode to the transcode daemon, or to an RQ job on `queue` when TRANSCODE_DAEMON is off."""
+	if settings.TRANSCODE_DAEMON:
+		return submit_continuous(video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param, segment_duration, worker_id=worker_id, job_id=job_id)
+	return enqueue_transcode_job(
+		queue, transcode_continuously, video_id, resolution, scale_param, segment_name, codec_param, bitrate, audio_param,
+		segment_duration, worker_id, job_id=job_id,
+	).id
+
+def apply_probe_info(video, info):
+	"""Copy codec, resolution and duration from a probe_a_video() result onto a Video. Returns True if anything changed (caller saves)."""
+	changed = False
+	# video codec
+	vcodec = info.get('video_codec')
+	if vcodec and video.codec != vcodec:
+		video.codec = vcodec
+		changed = True
+
+	# audio codec
+	acodec = info.get('audio_codec')
+	if acodec and video.audio_codec != acodec:
+		video.audio_codec = acodec
+		changed = True
+
+	# resolution -> store as 'WxH'
+	w = info.get('width')
+	h = info.get('height')
+	if w and h:
+		res = f"{w}x{h}"
+		if video.resolution != res:
+			video.resolution = res
 			changed = True
 
-		# audio codec
-		acodec = info.get('audio_codec')
-		if acodec and video.audio_codec != acodec:
-			video.audio_codec = acodec
-			changed = True
-
-		# resolution -> store as 'WxH'
-		w = info.get('width')
-		h = info.get('height')
-		if w and h:
-			res = f"{w}x{h}"
-			if video.resolution != res:
-				video.resolution = res
+	# duration -> DurationField expects timedelta
+	ds = info.get('duration_seconds')
+	if ds:
+		try:
+			td = timedelta(seconds=int(round(ds)))
+			if video.duration != td:
+				video.duration = td
 				changed = True
+		except Exception:
+			pass
+	return changed
 
-		# duration -> DurationField expects timedelta
-		ds = info.get('duration_seconds')
-		if ds:
-			try:
-				td = timedelta(seconds=int(round(ds)))
-				if video.duration != td:
-					video.duration = td
-					changed = True
-			except Exception:
-				pass
-
-		if changed:
-			video.save()
-
-		result['probe_success'] = True
-		result['probe_info'] = info
-		print(f"video_post_upload_worker: probe info for video {video_id}: {result.get('probe_info')}")
+def deduplicate_video(video):
+	"""Hash and store a video's source by content; link to an existing video with the same content.
 
-	except Exception as e:
-		result['probe_error'] = str(e)
-		print(f"video_post_upload_worker: probe failed for video {video_id}: {result['probe_error']}")
-		return result
-	
-	# 3. Get thumbnail from video if not already set
-	if video.thumbnail_url == '' or video.thumbnail_url is None:
-			print(f"video_post_upload_worker: Generating thumbnail for video {video_id}...")
-			thumbnail_object = Thumbnail.objects.create(video=video)
-			thumbnail_object.image = get_thumbnail_from_video(video.id)
-			thumbnail_object.save()
-			site_url = os.getenv('SITE_URL', default='http://localhost:8000')
-			app_url = site_url + 'api/thumbnail/video_' + str(video.id)
-			video.poster_url = app_url + '/' + 'thumbnail.jpg'
-			video.thumbnail_url = video.poster_url
-			video.save()
-
-	# 4. Create Preview and trigger transcode
-	duration_seconds = info.get('duration_seconds') or 0
-
-	# Calculate smart start offset (start at 10% of video, or 0 if short)
-	if duration_seconds > 180:  # If video is longer than 3 minutes
-		start_offset = int(duration_seconds * 0.1)  # Start at 10%
+	Chunked uploads arrive already hashed and stored (see uploads.attach_upload); plain uploads are
+	hashed here. Returns the video whose outputs are now shared, or None. Saves `video`.
+	"""
+	from video_app.api.dedupe import CONTENT_DIR, hash_file, store_content_addressed, find_duplicate, link_duplicate, release_shared_outputs
+
+	name = video.video_file.name
+	if not (video.content_hash and name.startswith(CONTENT_DIR + '/')):
+		video.content_hash = hash_file(video.video_file.path)
+		video.video_file.name = store_content_addressed(video.video_file.path, video.content_hash, name)
+
+	# The file was replaced: stop sharing folders that belong to the old content
+	if (video.source_video and video.source_video.content_hash != video.content_hash) or \
+			video.duplicates.exclude(content_hash=video.content_hash).exists():
+		release_shared_outputs(video)
+		video.source_video = None
+
+	# Only the fields set here: the IMDb stage saves the same row concurrently
+	fields = ['video_file', 'content_hash', 'source_video']
+	source = find_duplicate(video)
+	if source is not None and source.pk != video.source_video_id:
+		link_duplicate(video, source)
+		fields += ['codec', 'resolution', 'audio_codec', 'duration', 'is_transcoded', 'thumbnail_url', 'poster_url']
+	video.save(update_fields=fields)
+	return source
+
+def schedule_periodic_job(func, cache_key, delay=0, queue_name='low'):
+	"""Queue `func` (after `delay` seconds) unless the job last queued under `cache_key` is still waiting.
+
+	Periodic jobs call this at the end of each run to queue the next one. Delayed jobs need a
+	worker started with --with-scheduler. Returns the new job, or None if one is already waiting.
+	"""
+	queue = django_rq.get_queue(queue_name)
+	current = get_current_job()
+	job_id = cache.get(cache_key)
+	if job_id and (current is None or job_id != current.id):
+		job = queue.fetch_job(job_id)
+		if job is not None and job.get_status() in ('scheduled', 'queued', 'started', 'deferred'):
+			return None
+	# A fresh id per run: re-using the running job's id would be overwritten when it finishes
+	job_id = f"{func.__name__}_{uuid.uuid4().hex[:8]}"
+	if delay:
+		job = queue.enqueue_in(timedelta(seconds=delay), func, job_id=job_id)
 	else:
-		start_offset = 0
-
-	# Preview duration: 2 minutes or video length if shorter
-	preview_duration = min(120, int(duration_seconds)) if duration_seconds > 0 else 120
-
-	try:
-		# Get or create Preview
-		preview, created = Preview.objects.get_or_create(
-			video=video,
-			defaults={
-				'preview_duration': preview_duration,
-				'start_offset': start_offset,
-				'status': Preview.PreviewStatus.PENDING,
-			}
-		)
-
-		if not created:
-			# Video file was replaced, reset preview
-			preview.preview_duration = preview_duration
-			preview.start_offset = start_offset
-			preview.status = Preview.PreviewStatus.PENDING
-			preview.is_transcoded = False
-			preview.error_message = None
-			preview.save()
-
-		# Enqueue the preview transcode job
-		q = django_rq.get_queue('low')
-		q.enqueue(transcode_preview, preview.id)
-		result['preview_created'] = created
-		result['preview_id'] = preview.id
-
-		# Enqueue M3U8 generation for the full video
-		m3u8_output_path = f"media/index/video_{video_id}/"
-		m3u8_path = os.path.join(m3u8_output_path, 'index.m3u8')
-		q.enqueue(generate_m3u8_file, m3u8_path, video_id)
-		
-	except Exception as e:
-		result['preview_error'] = str(e)
-
-	return result
+		job = queue.enqueue(func, job_id=job_id)
+	cache.set(cache_key, job.id, timeout=None)
+	return job
@@ -0,0 +1,21 @@
+import math
+
+
+def percentiles(values):
+    """Nearest-rank p50/p90/p99 plus min/max/mean of a list of seconds."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        'count': len(ordered),
+        'min': round(ordered[0], 4),
+        'p50': round(rank(50), 4),
+        'p90': round(rank(90), 4),
+        'p99': round(rank(99), 4),
+        'max': round(ordered[-1], 4),
+        'mean': round(sum(ordered) / len(ordered), 4),
+    }
@@ -0,0 +1,254 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from video_app.models import Video, Preview
+from video_app.api.transcode import (
+    generate_m3u8_file, transcode_video_segment, transcode_continuously, transcode_preview,
+    probe_a_video, generate_transcode_path, forget_file_cache,
+)
+from video_app.api.playlist_cache import invalidate_playlists
+from video_app.api.progress import get_progress
+from video_app.api.workers import get_rendition_params
+from video_app.management.commands._stats import percentiles
+
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _segment_durations(m3u8_content):
+    durations = []
+    for line in m3u8_content.splitlines():
+        if line.startswith('#EXTINF:'):
+            durations.append(float(line.split(':', 1)[1].split(',')[0]))
+    return durations
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the transcode pipeline end to end on synthetic lavfi sources and print '
+            'latency percentiles, x-realtime speed and CPU-seconds per output minute as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='1280x720,1920x1080', help='Comma-separated source sizes (WxH)')
+        parser.add_argument('--gops', type=str, default='48,250', help='Comma-separated source GOP lengths in frames')
+        parser.add_argument('--durations', type=str, default='30', help='Comma-separated source durations in seconds')
+        parser.add_argument('--fps', type=int, default=24, help='Source frame rate')
+        parser.add_argument('--resolution', type=str, default='720p', help='Rendition to benchmark')
+        parser.add_argument('--segments', type=int, default=5, help='On-demand segments to transcode per source')
+        parser.add_argument('--repeat', type=int, default=1, help='Repeat each measurement this many times')
+        parser.add_argument('--skip', type=str, default='', help='Comma-separated stages to skip: m3u8,segments,continuous,preview')
+        parser.add_argument('--output', type=str, default=None, help='Write the JSON results to this file instead of stdout')
+        parser.add_argument('--keep', action='store_true', help='Keep generated sources, rows and outputs')
+
+    def handle(self, *args, **options):
+        if shutil.which('ffmpeg') is None:
+            raise CommandError('ffmpeg is not installed')
+
+        try:
+            sizes = [tuple(int(v) for v in s.lower().split('x')) for s in options['sizes'].split(',') if s]
+            gops = [int(g) for g in options['gops'].split(',') if g]
+            durations = [int(d) for d in options['durations'].split(',') if d]
+        except ValueError as e:
+            raise CommandError(f'Invalid benchmark matrix: {e}')
+        skip = {s.strip() for s in options['skip'].split(',') if s.strip()}
+
+        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+        report = {
+            'environment': {
+                'ffmpeg': ffmpeg_version,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+            },
+            'resolution': options['resolution'],
+            'results': [],
+        }
+
+        # A finished continuous encode would queue the compaction of an output that is deleted right after
+        with override_settings(TRANSCODE_COMPACT_RENDITIONS=False):
+            for width, height in sizes:
+                for gop in gops:
+                    for duration in durations:
+                        self.stderr.write(f'Benchmarking {width}x{height} gop={gop} duration={duration}s...')
+                        report['results'].append(self._benchmark_source(width, height, gop, duration, options, skip))
+
+        body = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(body)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        else:
+            self.stdout.write(body)
+
+    def _make_source(self, width, height, gop, duration, fps):
+        name = f'media/benchmark/lavfi_{width}x{height}_g{gop}_{duration}s.mp4'
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            cmd = [
+                'ffmpeg', '-y',
+                '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={duration}',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+                '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+                '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest',
+                path,
+            ]
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0:
+                raise CommandError(f'Failed to generate lavfi source: {result.stderr.strip()[-2000:]}')
+        return name, path
+
+    def _benchmark_source(self, width, height, gop, duration, options, skip):
+        name, path = self._make_source(width, height, gop, duration, options['fps'])
+        info = probe_a_video(path)
+        video = Video.objects.create(
+            title=f'benchmark {width}x{height} gop {gop}',
+            video_file=name,
+            codec=info.get('video_codec') or '',
+            audio_codec=info.get('audio_codec') or '',
+            resolution=f"{info.get('width')}x{info.get('height')}",
+        )
+        resolution = options['resolution']
+        result = {
+            'source': {'width': width, 'height': height, 'gop': gop, 'duration_seconds': duration, 'fps': options['fps']},
+            'video_id': video.id,
+        }
+        try:
+            scale_param, codec_param, bitrate, audio_param = get_rendition_params(video, resolution)
+            m3u8_path = os.path.join('media', 'index', f'video_{video.id}', 'index.m3u8')
+            output_dir = generate_transcode_path(video.id, resolution)
+
+            durations = []
+            if 'm3u8' not in skip or 'segments' not in skip:
+                timings = []
+                for _ in range(options['repeat']):
+                    self._forget_cached_playlist(video.id, path)
+                    started = time.perf_counter()
+                    content = generate_m3u8_file(m3u8_path, video.id)
+                    timings.append(time.perf_counter() - started)
+                    if content.startswith('Error') or content.startswith('Failed'):
+                        raise CommandError(content)
+                durations = _segment_durations(content)
+                result['m3u8'] = {'latency': percentiles(timings), 'segments': len(durations)}
+
+            if 'segments' not in skip:
+                init_timings, segment_timings, first_segment = [], [], []
+                cpu_before = _children_cpu_seconds()
+                encoded_seconds = 0.0
+                for _ in range(options['repeat']):
+                    shutil.rmtree(output_dir, ignore_errors=True)
+                    started = time.perf_counter()
+                    transcode_video_segment(video.id, resolution, scale_param, 'init.mp4', codec_param, bitrate, audio_param, durations[0] if durations else 5)
+                    init_timings.append(time.perf_counter() - started)
+                    for i, seg_duration in enumerate(durations[:options['segments']]):
+                        seg_started = time.perf_counter()
+                        status = transcode_video_segment(video.id, resolution, scale_param, f'segment_{i:03d}.mp4', codec_param, bitrate, audio_param, seg_duration)
+                        if status != 'Success':
+                            raise CommandError(status)
+                        segment_timings.append(time.perf_counter() - seg_started)
+                        encoded_seconds += seg_duration
+                        if i == 0:
+                            first_segment.append(time.perf_counter() - started)
+                cpu = _children_cpu_seconds() - cpu_before
+                result['segments'] = {
+                    'init_latency': percentiles(init_timings),
+                    'segment_latency': percentiles(segment_timings),
+                    'time_to_first_segment': percentiles(first_segment),
+                    'x_realtime': round(encoded_seconds / sum(segment_timings), 3) if segment_timings else None,
+                    'cpu_seconds_per_output_minute': round(cpu / (encoded_seconds / 60), 3) if encoded_seconds else None,
+                }
+
+            if 'continuous' not in skip:
+                shutil.rmtree(output_dir, ignore_errors=True)
+                first_segment_path = os.path.join(output_dir, 'segment_000.mp4')
+                cpu_before = _children_cpu_seconds()
+                outcome = {}
+
+                worker_id = f'benchmark_{video.id}_{resolution}'
+
+                def run():
+                    outcome['status'] = transcode_continuously(
+                        video.id, resolution, scale_param, 'segment_000.mp4', codec_param, bitrate, audio_param,
+                        durations[0] if durations else 5, worker_id,
+                    )
+
+                started = time.perf_counter()
+                worker = threading.Thread(target=run)
+                worker.start()
+                ttfs = None
+                progress = {}
+                while worker.is_alive():
+                    if ttfs is None and os.path.exists(first_segment_path):
+                        ttfs = time.perf_counter() - started
+                    # The record is removed once the encoder ends: keep the last one seen
+                    progress = get_progress(video.id, resolution, job=worker_id) or progress
+                    time.sleep(0.05)
+                wall = time.perf_counter() - started
+                cpu = _children_cpu_seconds() - cpu_before
+                result['continuous'] = {
+                    'status': outcome.get('status'),
+                    'time_to_first_segment': round(ttfs, 4) if ttfs is not None else None,
+                    'wall_seconds': round(wall, 3),
+                    'x_realtime': progress.get('speed') or round(duration / wall, 3),
+                    'cpu_seconds_per_output_minute': round(cpu / (duration / 60), 3),
+                }
+
+            if 'preview' not in skip:
+                timings = []
+                cpu_before = _children_cpu_seconds()
+                for _ in range(options['repeat']):
+                    preview, _created = Preview.objects.update_or_create(
+                        video=video, defaults={'start_offset': 0, 'preview_duration': duration, 'status': Preview.PreviewStatus.PENDING},
+                    )
+                    started = time.perf_counter()
+                    status = transcode_preview(preview.id)
+                    timings.append(time.perf_counter() - started)
+                    if status != 'Success':
+                        raise CommandError(status)
+                cpu = _children_cpu_seconds() - cpu_before
+                output_minutes = duration * options['repeat'] / 60
+                result['preview'] = {
+                    'latency': percentiles(timings),
+                    'x_realtime': round(duration * options['repeat'] / sum(timings), 3),
+                    'cpu_seconds_per_output_minute': round(cpu / output_minutes, 3),
+                }
+        finally:
+            if not options['keep']:
+                self._cleanup(video, path)
+        return result
+
+    def _forget_cached_playlist(self, video_id, path):
+        """Drop the cached playlists, keyframes and probe of a source so every playlist run is cold."""
+        cache.delete(f"m3u8_{video_id}")
+        invalidate_playlists(video_id)
+        for kind in ('keyframes', 'probe'):
+            forget_file_cache(kind, path)
+
+    def _cleanup(self, video, path):
+        for directory in (
+            os.path.join('media', 'transcode', f'video_{video.id}'),
+            os.path.join('media', 'index', f'video_{video.id}'),
+        ):
+            shutil.rmtree(directory, ignore_errors=True)
+        try:
+            shutil.rmtree(os.path.join('media', 'hls_preview', f'preview_{video.preview.id}'), ignore_errors=True)
+        except Preview.DoesNotExist:
+            pass
+        video.delete()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,17 +1,53 @@
 from django.core.management.base import BaseCommand, CommandError
 
 from video_app.api.transcode import cleanup_inactive_transcodes
+from video_app.api.eviction import TranscodeCacheEvictor
+from video_app.api.compact import compact_complete_renditions
 
 
 class Command(BaseCommand):
-    help = 'Cleanup inactive per-user transcode folders older than given seconds'
+    help = 'Cleanup inactive per-user transcode folders older than given seconds, or keep the transcode tree under a byte budget'
 
     def add_arguments(self, parser):
         parser.add_argument('--base-dir', type=str, default='media/transcode', help='Base transcode directory')
         parser.add_argument('--inactive-seconds', type=int, default=3600, help='Inactive threshold in seconds')
+        parser.add_argument('--max-bytes', type=int, default=None, help='Evict least recently/frequently used outputs until the tree fits this budget (default: TRANSCODE_CACHE_MAX_BYTES)')
+        parser.add_argument('--daemon', action='store_true', help='Keep running and enforce the byte budget every --interval seconds')
+        parser.add_argument('--interval', type=int, default=30, help='Seconds between eviction passes in daemon mode')
+        parser.add_argument('--compact', action='store_true', help='Pack idle, fully transcoded outputs into a single rendition.mp4 instead of cleaning up')
 
     def handle(self, *args, **options):
         base_dir = options['base_dir']
+
+        if options['compact']:
+            compacted = compact_complete_renditions(base_dir=base_dir)
+            self.stdout.write(self.style.SUCCESS(f'Compacted {len(compacted)} outputs'))
+            for p in compacted:
+                self.stdout.write(p)
+            return
+
+        if options['daemon'] or options['max_bytes'] is not None:
+            if options['max_bytes'] is not None and options['max_bytes'] < 0:
+                raise CommandError('--max-bytes must not be negative')
+            evictor = TranscodeCacheEvictor(base_dir=base_dir, max_bytes=options['max_bytes'])
+
+            def report(removed):
+                for path, size in removed:
+                    self.stdout.write(f'{path} ({size} bytes)')
+                if removed:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Evicted {len(removed)} directories, {sum(size for _, size in removed)} bytes reclaimed '
+                        f'({evictor.reclaimed_bytes} total). Cache size {evictor.total_bytes}/{evictor.max_bytes} bytes'
+                    ))
+
+            if options['daemon']:
+                self.stdout.write(f'Enforcing {evictor.max_bytes} byte budget on {base_dir} every {options["interval"]}s')
+                evictor.run_forever(interval=options['interval'], on_pass=report)
+            else:
+                report(evictor.run_once())
+                self.stdout.write(self.style.SUCCESS(f'Reclaimed {evictor.reclaimed_bytes} bytes, cache size {evictor.total_bytes} bytes'))
+            return
+
         inactive_seconds = options['inactive_seconds']
         removed = cleanup_inactive_transcodes(base_dir=base_dir, inactive_seconds=inactive_seconds)
         self.stdout.write(self.style.SUCCESS(f'Removed {len(removed)} directories'))
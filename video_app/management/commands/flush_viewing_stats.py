@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from video_app.api.viewing_stats import FLUSH_BATCH_SIZE, flush_viewing_stats, schedule_flush
+
+
+class Command(BaseCommand):
+    help = 'Merge the viewing counters aggregated in Redis into the ViewingStats table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH_SIZE, help='Videos merged per database transaction')
+        parser.add_argument('--schedule', action='store_true', help='Queue the periodic RQ flush job instead of flushing now')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            job = schedule_flush()
+            if job is None:
+                self.stdout.write('The viewing stats flush job is already queued or scheduled')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Queued flush job {job.id}, repeating every {settings.VIEWING_STATS_FLUSH_SECONDS}s'
+                ))
+            return
+
+        flushed = flush_viewing_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed viewing stats of {flushed} videos'))
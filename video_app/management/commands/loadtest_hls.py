@@ -0,0 +1,261 @@
+import json
+import random
+import shutil
+import threading
+import time
+import uuid
+from collections import defaultdict
+from unittest import mock
+
+import django_rq
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils.module_loading import import_string
+from rest_framework.test import APIClient
+
+from video_app.models import Video
+from video_app.api import scripts, workers
+from video_app.management.commands._stats import percentiles
+
+SCRIPTS = ('linear', 'seek', 'switch', 'abandon')
+
+
+class _ThreadJob:
+	def __init__(self, job_id, meta=None):
+		self.id = job_id
+		self.meta = meta or {}
+		self.cancelled = False
+
+	def get_status(self):
+		return 'canceled' if self.cancelled else 'started'
+
+	def cancel(self):
+		self.cancelled = True
+
+
+class ThreadQueue:
+	"""In-process stand-in for the RQ 'low' queue: enqueued jobs run in background threads."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._jobs = {}
+		self.enqueued = 0
+		self.threads = []
+
+	def enqueue(self, func, *args, job_id=None, meta=None, on_success=None, on_failure=None, on_stopped=None, **kwargs):
+		job = _ThreadJob(job_id or uuid.uuid4().hex, meta)
+		with self._lock:
+			self._jobs[job.id] = job
+			self.enqueued += 1
+
+		def run():
+			try:
+				result = func(*args, **kwargs)
+				if on_success:
+					on_success.func(job, None, result)
+			except Exception as e:
+				if on_failure:
+					on_failure.func(job, None, type(e), e, None)
+				raise
+			finally:
+				with self._lock:
+					self._jobs.pop(job.id, None)
+				connection.close()
+
+		t = threading.Thread(target=run, daemon=True)
+		self.threads.append(t)
+		t.start()
+		return job
+
+	def fetch_job(self, job_id):
+		with self._lock:
+			return self._jobs.get(job_id)
+
+	@property
+	def running(self):
+		with self._lock:
+			return len(self._jobs)
+
+
+class Command(BaseCommand):
+	help = ('Simulate concurrent HLS viewers (linear play, seeks, resolution switches, abandonments) against '
+	        'VideoM3U8View/VideoSegmentView with a stub transcoder and report latency and encoder usage as JSON')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--viewers', type=int, default=20, help='Number of concurrent viewers')
+		parser.add_argument('--mix', type=str, default='linear=0.5,seek=0.2,switch=0.2,abandon=0.1', help='Viewer script weights')
+		parser.add_argument('--segments-per-viewer', type=int, default=12, help='Segments a non-abandoning viewer watches')
+		parser.add_argument('--resolutions', type=str, default='480p,720p,1080p', help='Resolutions viewers pick from')
+		parser.add_argument('--time-scale', type=float, default=0.05, help='Wall seconds per second of playback (pacing between segment requests)')
+		parser.add_argument('--ramp-up', type=float, default=2.0, help='Spread viewer start times over this many seconds')
+		parser.add_argument('--transcoder', type=str, default='video_app.api.stub_transcoder.StubTranscoder', help='Dotted path of the fake transcoder class')
+		parser.add_argument('--segment-delay', type=float, default=0.5, help='Fake encode time per segment in seconds')
+		parser.add_argument('--startup-delay', type=float, default=1.0, help='Fake encoder start-up time (init.mp4) in seconds')
+		parser.add_argument('--playlist-segments', type=int, default=120, help='Segments in the fake playlist')
+		parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+		parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file instead of stdout')
+		parser.add_argument('--keep', action='store_true', help='Keep the synthetic video, viewer users and written files')
+
+	def handle(self, *args, **options):
+		rng = random.Random(options['seed'])
+		try:
+			mix = {k: float(v) for k, v in (item.split('=') for item in options['mix'].split(',') if item)}
+		except ValueError:
+			raise CommandError('--mix must look like linear=0.5,seek=0.5')
+		unknown = set(mix) - set(SCRIPTS)
+		if unknown:
+			raise CommandError(f'Unknown viewer scripts: {", ".join(sorted(unknown))}')
+		resolutions = [r for r in options['resolutions'].split(',') if r]
+
+		transcoder = import_string(options['transcoder'])(
+			segments=options['playlist_segments'],
+			segment_delay=options['segment_delay'],
+			startup_delay=options['startup_delay'],
+		)
+		queue = ThreadQueue()
+		video = Video.objects.create(title='loadtest', video_file='media/loadtest/stub.mp4', resolution='1920x1080', audio_codec='aac')
+		users = [f'loadtest_viewer_{i}' for i in range(options['viewers'])]
+		for username in users:
+			User.objects.get_or_create(username=username, defaults={'email': f'{username}@example.com'})
+
+		local = threading.local()
+		encoders_per_viewer = defaultdict(lambda: defaultdict(int))
+		counter_lock = threading.Lock()
+
+		def count(viewer, kind):
+			with counter_lock:
+				encoders_per_viewer[viewer][kind] += 1
+
+		def segment_job(*args, **kwargs):
+			count(getattr(local, 'viewer', 'unknown'), 'segment')
+			return transcoder.transcode_video_segment(*args, **kwargs)
+
+		def continuous_job(*args, **kwargs):
+			worker_id = kwargs.get('worker_id') or (args[8] if len(args) > 8 else None) or ''
+			viewer = next((u for u in users if f'_{u}_video' in worker_id), 'unknown')
+			count(viewer, 'continuous')
+			return transcoder.transcode_continuously(*args, **kwargs)
+
+		latencies = defaultdict(list)
+		errors = defaultdict(int)
+		in_flight = [0]
+		samples = []
+
+		def request(client, kind, url):
+			with counter_lock:
+				in_flight[0] += 1
+			started = time.perf_counter()
+			try:
+				response = client.get(url)
+			finally:
+				with counter_lock:
+					in_flight[0] -= 1
+			latencies[kind].append(time.perf_counter() - started)
+			if response.status_code != 200:
+				errors[f'{kind}_{response.status_code}'] += 1
+			return response
+
+		def viewer(index, username, script):
+			local.viewer = username
+			client = APIClient()
+			client.force_authenticate(user=User.objects.get(username=username))
+			time.sleep(rng.uniform(0, options['ramp_up']))
+			resolution = rng.choice(resolutions)
+			base = f'/api/video/{video.id}'
+			length = options['segments_per_viewer']
+			if script == 'abandon':
+				length = rng.randint(1, 3)
+
+			def open_rendition(res):
+				request(client, 'playlist', f'{base}/{res}/index.m3u8')
+				request(client, 'init', f'{base}/{res}/init.mp4')
+
+			try:
+				open_rendition(resolution)
+				segment = 0
+				for watched in range(length):
+					if script == 'seek' and watched == length // 2:
+						segment = rng.randint(segment + 5, max(segment + 5, options['playlist_segments'] - length))
+					if script == 'switch' and watched == length // 2:
+						resolution = rng.choice([r for r in resolutions if r != resolution] or resolutions)
+						open_rendition(resolution)
+					if segment >= options['playlist_segments']:
+						break
+					request(client, 'segment', f'{base}/{resolution}/segment_{segment:03d}.mp4')
+					time.sleep(transcoder.segment_duration * options['time_scale'])
+					segment += 1
+			finally:
+				connection.close()
+
+		weights = [mix.get(s, 0) for s in SCRIPTS]
+		assignments = [rng.choices(SCRIPTS, weights=weights)[0] for _ in users]
+
+		patches = [
+			mock.patch.object(workers, 'transcode_video_segment', segment_job),
+			mock.patch.object(workers, 'transcode_continuously', continuous_job),
+			mock.patch.object(scripts, 'generate_m3u8_file', transcoder.generate_m3u8_file),
+			mock.patch.object(django_rq, 'get_queue', lambda *a, **k: queue),
+		]
+		for p in patches:
+			p.start()
+		try:
+			scripts.cache.delete(f"m3u8_{video.id}")
+			threads = [threading.Thread(target=viewer, args=(i, u, s)) for i, (u, s) in enumerate(zip(users, assignments))]
+			started = time.perf_counter()
+			# Continuous encodes go to the in-process queue instead of the transcode daemon
+			with override_settings(ALLOWED_HOSTS=['*'], TRANSCODE_DAEMON=False):
+				for t in threads:
+					t.start()
+				while any(t.is_alive() for t in threads):
+					samples.append((in_flight[0], transcoder.running, queue.running))
+					time.sleep(0.1)
+			duration = time.perf_counter() - started
+		finally:
+			transcoder.stop_event.set()
+			for t in queue.threads:
+				t.join(timeout=5)
+			for p in patches:
+				p.stop()
+			if not options['keep']:
+				self._cleanup(video, users)
+
+		def occupancy(column):
+			values = [s[column] for s in samples] or [0]
+			return {'mean': round(sum(values) / len(values), 3), 'max': max(values)}
+
+		per_viewer = [sum(kinds.values()) for kinds in encoders_per_viewer.values()]
+		report = {
+			'viewers': options['viewers'],
+			'scripts': {s: assignments.count(s) for s in SCRIPTS},
+			'duration_seconds': round(duration, 3),
+			'latency': {kind: percentiles(values) for kind, values in latencies.items()},
+			'errors': dict(errors),
+			'occupancy': {
+				'requests_in_flight': occupancy(0),
+				'encoders_running': occupancy(1),
+				'queue_jobs_running': occupancy(2),
+				'encoders_max_concurrent': transcoder.max_running,
+			},
+			'encoders_started': {
+				'total': len(transcoder.started),
+				'segment': sum(1 for s in transcoder.started if s[0] == 'segment'),
+				'continuous': sum(1 for s in transcoder.started if s[0] == 'continuous'),
+				'per_viewer_mean': round(sum(per_viewer) / len(users), 3) if users else 0,
+				'per_viewer_max': max(per_viewer) if per_viewer else 0,
+			},
+		}
+		body = json.dumps(report, indent=2)
+		if options['output']:
+			with open(options['output'], 'w') as f:
+				f.write(body)
+			self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+		else:
+			self.stdout.write(body)
+
+	def _cleanup(self, video, users):
+		shutil.rmtree(f'media/transcode/video_{video.id}', ignore_errors=True)
+		shutil.rmtree(f'media/index/video_{video.id}', ignore_errors=True)
+		video.delete()
+		User.objects.filter(username__in=users).delete()
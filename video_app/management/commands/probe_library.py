@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from video_app.models import Video
+from video_app.api.transcode import probe_many
+from video_app.api.workers import apply_probe_info
+
+
+class Command(BaseCommand):
+    help = 'Probe every video file with a process pool, fill the probe/keyframe cache and backfill codec, resolution and duration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Parallel ffprobe processes (default: CPU count)')
+        parser.add_argument('--keyframes', action='store_true', help='Also extract and cache keyframe timestamps')
+        parser.add_argument('--force', action='store_true', help='Ignore cached probe results and probe every file again')
+        parser.add_argument('--video-id', type=int, action='append', dest='video_ids', help='Only probe these videos (repeatable)')
+
+    def handle(self, *args, **options):
+        videos = Video.objects.exclude(video_file='').order_by('id')
+        if options['video_ids']:
+            videos = videos.filter(id__in=options['video_ids'])
+
+        by_path = {}
+        for video in videos:
+            try:
+                by_path.setdefault(video.video_file.path, []).append(video)
+            except Exception as e:
+                self.stderr.write(f'video {video.id}: {e}')
+
+        missing = [path for path in by_path if not os.path.exists(path)]
+        for path in missing:
+            self.stderr.write(f'missing file {path} (videos {", ".join(str(v.id) for v in by_path.pop(path))})')
+
+        counts = {'probed': 0, 'cached': 0, 'updated': 0, 'failed': 0}
+        started = time.perf_counter()
+
+        def on_result(path, info, error, cached):
+            if info is None:
+                counts['failed'] += 1
+                self.stderr.write(f'failed {path}: {error}')
+                return
+            counts['cached' if cached else 'probed'] += 1
+            for video in by_path.get(path, []):
+                if apply_probe_info(video, info):
+                    video.save(update_fields=['codec', 'audio_codec', 'resolution', 'duration'])
+                    counts['updated'] += 1
+
+        probe_many(
+            list(by_path), workers=options['workers'], with_keyframes=options['keyframes'],
+            use_cache=not options['force'], on_result=on_result,
+        )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(by_path)} files in {elapsed:.1f}s: {counts["probed"]} probed, {counts["cached"]} from cache, '
+            f'{counts["failed"]} failed, {counts["updated"]} videos updated, {len(missing)} missing'
+        ))
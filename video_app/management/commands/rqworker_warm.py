@@ -0,0 +1,45 @@
+import django_rq
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from rq.worker_pool import WorkerPool
+
+from video_app.api.warm_worker import WarmWorker, isolation, preload, start_latency_samples
+from video_app.management.commands._stats import percentiles
+
+
+class Command(BaseCommand):
+    help = ('Run a pool of pre-imported RQ workers. Jobs of in-process queues (RQ_JOB_ISOLATION) skip the '
+            'per-job fork and keep their database and Redis connections; --latency reports job start latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*', default=['high', 'default', 'low'], help='Queues in priority order')
+        parser.add_argument('--num-workers', type=int, default=None, help='Workers in the pool (default: RQ_WARM_WORKERS)')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queues are empty')
+        parser.add_argument('--latency', action='store_true', help='Print the recorded job start latency per queue and exit')
+
+    def handle(self, *args, **options):
+        if options['latency']:
+            self._report(options['queues'])
+            return
+
+        preload()
+        # The workers are forked from this process: they must open their own connections
+        connections.close_all()
+        pool = WorkerPool(
+            options['queues'], connection=django_rq.get_connection(options['queues'][0]),
+            num_workers=options['num_workers'] or settings.RQ_WARM_WORKERS, worker_class=WarmWorker,
+        )
+        self.stdout.write(', '.join(f'{name}: {isolation(name)}' for name in options['queues']))
+        pool.start(burst=options['burst'])
+
+    def _report(self, queues):
+        for name in queues:
+            samples = start_latency_samples(name)
+            if not samples:
+                self.stdout.write(f'{name:8} no jobs recorded')
+            for mode, values in samples.items():
+                self.stdout.write(f'{name:8} {mode:9} ' + '  '.join(
+                    f'{part} p50 {stats["p50"] * 1000:.1f}ms p99 {stats["p99"] * 1000:.1f}ms'
+                    for part, stats in ((part, percentiles(values[part])) for part in ('wait', 'startup', 'total'))
+                ) + f'  ({len(values["total"])} jobs)')
@@ -0,0 +1,20 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from video_app.api.transcode_daemon import TranscodeDaemon
+
+
+class Command(BaseCommand):
+    help = ('Run the continuous transcodes requested by the web workers (one ffmpeg per viewer session) '
+            'and their heartbeat monitors in one event loop, outside the RQ workers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-encoders', type=int, default=None,
+                            help='Concurrent encoders (default: TRANSCODE_DAEMON_MAX_ENCODERS)')
+
+    def handle(self, *args, **options):
+        if not settings.TRANSCODE_DAEMON:
+            self.stderr.write('TRANSCODE_DAEMON is off: continuous encodes are queued as RQ jobs, nothing will be submitted here')
+        asyncio.run(TranscodeDaemon(options['max_encoders']).run())
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from video_app.api.warmup import popular_outputs, warm_popular_openings, schedule_warmup
+
+
+class Command(BaseCommand):
+    help = ('Pre-encode init.mp4 and the opening segments of the most popular titles and resolutions, '
+            'so their first play is served from disk')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=None, help='Number of titles to warm (default: WARMUP_TITLES)')
+        parser.add_argument('--per-title', type=int, default=None, help='Resolutions per title (default: WARMUP_RESOLUTIONS_PER_TITLE)')
+        parser.add_argument('--segments', type=int, default=None, help='Segments after init.mp4 to encode (default: WARMUP_SEGMENTS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the outputs that would be warmed')
+        parser.add_argument('--schedule', action='store_true', help='Queue the periodic RQ warm-up job instead of warming now')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            job = schedule_warmup()
+            if job is None:
+                self.stdout.write('The warm-up job is already queued or scheduled')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Queued warm-up job {job.id}, repeating every {settings.WARMUP_INTERVAL_SECONDS}s'
+                ))
+            return
+
+        if options['dry_run']:
+            for rank, (video_id, resolution) in enumerate(popular_outputs(options['titles'], options['per_title']), 1):
+                self.stdout.write(f'{rank:4} video {video_id} {resolution}')
+            return
+
+        def report(video_id, resolution, result):
+            if isinstance(result, str):
+                self.stderr.write(f'video {video_id} {resolution}: {result}')
+            else:
+                self.stdout.write(f'video {video_id} {resolution}: {result} files encoded')
+
+        started = time.perf_counter()
+        results = warm_popular_openings(options['titles'], options['segments'], options['per_title'], on_result=report)
+        encoded = sum(r for r in results.values() if isinstance(r, int))
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed {len(results)} outputs in {time.perf_counter() - started:.1f}s, {encoded} files encoded'
+        ))
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0004_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestStage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('job_id', models.CharField(blank=True, default='', max_length=100)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('message', models.TextField(blank=True, default='')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingest_stages', to='video_app.video')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('video', 'name')},
+            },
+        ),
+    ]
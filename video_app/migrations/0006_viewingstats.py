@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_app', '0005_ingeststage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views', models.BigIntegerField(default=0)),
+                ('segments', models.BigIntegerField(default=0)),
+                ('resolution_views', models.JSONField(blank=True, default=dict)),
+                ('resolution_segments', models.JSONField(blank=True, default=dict)),
+                ('segment_histogram', models.JSONField(blank=True, default=dict)),
+                ('last_viewed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='viewing_stats', to='video_app.video')),
+            ],
+            options={
+                'verbose_name_plural': 'viewing stats',
+            },
+        ),
+    ]
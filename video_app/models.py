@@ -1,3 +1,7 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 
 # Create your models here.
@@ -19,6 +23,10 @@ class Video(models.Model):
     duration = models.DurationField(blank=True, null=True)
     # Flag to indicate if the video has been transcoded (prevents re-transcoding)
     is_transcoded = models.BooleanField(default=False)
+    # sha256 block-tree hash of the source file (see video_app.api.dedupe)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Set on re-uploads of existing content: outputs are shared with (symlinked to) this video
+    source_video = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates')
 
     def __str__(self):
         return self.title
@@ -67,3 +75,100 @@ class Thumbnail(models.Model):
 
     def __str__(self):
         return f"Thumbnail for {self.video.title} at {self.created_at}"
+
+
+class IngestStage(models.Model):
+    """One step of a video's post-upload pipeline (see video_app.api.pipeline) with its status and timing."""
+
+    class StageStatus(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        SUCCEEDED = 'succeeded', 'Succeeded'
+        FAILED = 'failed', 'Failed'
+        SKIPPED = 'skipped', 'Skipped'
+
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='ingest_stages')
+    name = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=StageStatus.choices, default=StageStatus.PENDING)
+    # Runs of this stage, including RQ retries
+    attempts = models.IntegerField(default=0)
+    job_id = models.CharField(max_length=100, blank=True, default='')
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Result summary on success, reason when skipped, last error when failed
+    message = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"{self.name} for video {self.video_id}: {self.status}"
+
+    @property
+    def elapsed(self):
+        if self.started_at and self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+    class Meta:
+        unique_together = ('video', 'name')
+        ordering = ['id']
+
+
+class ViewingStats(models.Model):
+    """Viewing counters of a video, aggregated in Redis from playlist/segment requests and flushed in batches
+    (see video_app.api.viewing_stats)."""
+
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name='viewing_stats')
+    # Playlist requests (play starts) and segment requests (about one per segment watched)
+    views = models.BigIntegerField(default=0)
+    segments = models.BigIntegerField(default=0)
+    # {resolution: count} of play starts and of watched segments
+    resolution_views = models.JSONField(default=dict, blank=True)
+    resolution_segments = models.JSONField(default=dict, blank=True)
+    # {segment number: requests}, all resolutions together; shows where viewers drop off
+    segment_histogram = models.JSONField(default=dict, blank=True)
+    last_viewed_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Viewing stats for video {self.video_id}: {self.views} views"
+
+    def retention(self, segment_number):
+        """Share of play starts that reached a segment."""
+        if not self.views:
+            return 0.0
+        return min(1.0, self.segment_histogram.get(str(segment_number), 0) / self.views)
+
+    class Meta:
+        verbose_name_plural = 'viewing stats'
+
+
+class ChunkedUpload(models.Model):
+    """Resumable admin upload of a source video, written in place to a .part file chunk by chunk."""
+
+    class UploadStatus(models.TextChoices):
+        UPLOADING = 'uploading', 'Uploading'
+        COMPLETE = 'complete', 'Complete'
+        ATTACHED = 'attached', 'Attached'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    # Number of bytes received so far; the next chunk must start here
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=UploadStatus.choices, default=UploadStatus.UPLOADING)
+    # Filled in when the last chunk arrives, from the block digests hashed while streaming
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size} bytes)"
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'media', 'uploads', f'{self.id}.part')
+
+    @property
+    def blocks_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'media', 'uploads', f'{self.id}.blocks')
+
@@ -1,6 +1,7 @@
 /**
  * Video Upload Progress Handler for Django Admin
- * Shows loading animation and upload progress when submitting video forms
+ * Uploads the video file in resumable chunks to /api/uploads/ (showing progress), then submits
+ * the form with the completed upload id instead of the file
  */
 (function() {
     'use strict';
@@ -54,11 +55,112 @@
         const videoFileInput = form.querySelector('input[type="file"][name="video_file"]');
         if (!videoFileInput) return;
 
+        const uploadIdInput = form.querySelector('input[name="upload_id"]');
+        const csrfInput = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        const apiBase = '/api/uploads/';
+        const maxRetries = 8;
+
+        function api(method, url, body) {
+            return fetch(url, {
+                method: method,
+                credentials: 'same-origin',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': csrfInput ? csrfInput.value : '',
+                },
+                body: body ? JSON.stringify(body) : undefined,
+            }).then(function(response) {
+                return response.json().catch(function() { return {}; }).then(function(data) {
+                    return { status: response.status, data: data };
+                });
+            });
+        }
+
+        // Reuse an unfinished upload of the same file (after a reload or network failure)
+        function findOrCreateUpload(file, storageKey) {
+            const knownId = localStorage.getItem(storageKey);
+            const lookup = knownId
+                ? api('GET', apiBase + knownId + '/').then(function(r) { return r.status === 200 ? r.data : null; })
+                : api('GET', apiBase + '?filename=' + encodeURIComponent(file.name) + '&size=' + file.size)
+                    .then(function(r) { return r.status === 200 && r.data.length ? r.data[0] : null; });
+            return lookup.then(function(upload) {
+                if (upload && upload.status !== 'attached') return upload;
+                return api('POST', apiBase, { filename: file.name, total_size: file.size }).then(function(r) {
+                    if (r.status !== 201) throw new Error(JSON.stringify(r.data));
+                    return r.data;
+                });
+            }).then(function(upload) {
+                localStorage.setItem(storageKey, upload.id);
+                return upload;
+            });
+        }
+
+        // PUT one chunk with XHR so progress is reported within the chunk as well
+        function sendChunk(upload, file, offset, onProgress) {
+            return new Promise(function(resolve, reject) {
+                const end = Math.min(offset + upload.chunk_size, file.size);
+                const xhr = new XMLHttpRequest();
+                xhr.open('PUT', apiBase + upload.id + '/', true);
+                xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+                xhr.setRequestHeader('Content-Range', 'bytes ' + offset + '-' + (end - 1) + '/' + file.size);
+                xhr.setRequestHeader('X-CSRFToken', csrfInput ? csrfInput.value : '');
+                xhr.upload.addEventListener('progress', function(e) { onProgress(offset + e.loaded); });
+                xhr.addEventListener('load', function() {
+                    let data = {};
+                    try { data = JSON.parse(xhr.responseText); } catch (err) {}
+                    // 409: the server has a different offset (e.g. a retried chunk) - continue from there
+                    if (xhr.status === 200 || (xhr.status === 409 && typeof data.offset === 'number')) {
+                        resolve(data.offset);
+                    } else if (xhr.status >= 500) {
+                        reject(new Error('Server error ' + xhr.status));
+                    } else {
+                        reject(Object.assign(new Error(data.error || ('Upload failed (' + xhr.status + ')')), { fatal: true }));
+                    }
+                });
+                xhr.addEventListener('error', function() { reject(new Error('Network error')); });
+                xhr.send(file.slice(offset, end));
+            });
+        }
+
+        function uploadFile(file, onProgress) {
+            const storageKey = 'videoUpload:' + file.name + ':' + file.size + ':' + file.lastModified;
+            return findOrCreateUpload(file, storageKey).then(function(upload) {
+                let offset = upload.offset;
+                let retries = 0;
+                onProgress(offset, offset);
+
+                function next() {
+                    if (offset >= file.size) {
+                        localStorage.removeItem(storageKey);
+                        return upload.id;
+                    }
+                    return sendChunk(upload, file, offset, function(loaded) { onProgress(loaded, null); })
+                        .then(function(newOffset) {
+                            offset = newOffset;
+                            retries = 0;
+                            return next();
+                        }, function(err) {
+                            if (err.fatal || retries >= maxRetries) throw err;
+                            retries += 1;
+                            statusText.textContent = 'Connection lost, retrying (' + retries + '/' + maxRetries + ')...';
+                            return new Promise(function(r) { setTimeout(r, Math.min(30000, 1000 * Math.pow(2, retries))); })
+                                .then(function() { return api('GET', apiBase + upload.id + '/'); })
+                                .then(function(r) {
+                                    if (r.status === 200) offset = r.data.offset;
+                                    statusText.textContent = 'Uploading video...';
+                                    return next();
+                                }, next);
+                        });
+                }
+                return next();
+            });
+        }
+
         form.addEventListener('submit', function(e) {
             const file = videoFileInput.files[0];
             
             // Only show progress for actual file uploads
-            if (!file) {
+            if (!file || !uploadIdInput) {
                 // No file selected, just show simple loading
                 overlay.classList.add('active');
                 statusText.textContent = 'Saving...';
@@ -71,83 +173,57 @@
             // Prevent default form submission
             e.preventDefault();
 
+            // Keep track of the clicked button (Save / Save and continue / Save and add another)
+            if (e.submitter && e.submitter.name) {
+                const button = document.createElement('input');
+                button.type = 'hidden';
+                button.name = e.submitter.name;
+                button.value = e.submitter.value;
+                form.appendChild(button);
+            }
+
             // Show overlay
             overlay.classList.add('active');
             statusText.textContent = 'Uploading video...';
             uploadDetails.textContent = formatBytes(file.size);
 
-            // Create FormData from form
-            const formData = new FormData(form);
-
-            // Create XMLHttpRequest for progress tracking
-            const xhr = new XMLHttpRequest();
             let startTime = Date.now();
+            let startOffset = 0;
 
-            xhr.upload.addEventListener('progress', function(e) {
-                if (e.lengthComputable) {
-                    const percent = Math.round((e.loaded / e.total) * 100);
-                    progressPercent.textContent = percent + '%';
-                    progressBar.style.width = percent + '%';
-
-                    // Calculate speed and ETA
-                    const elapsed = (Date.now() - startTime) / 1000;
-                    const speed = e.loaded / elapsed;
-                    const remaining = (e.total - e.loaded) / speed;
-
-                    uploadDetails.textContent = formatBytes(e.loaded) + ' / ' + formatBytes(e.total) + 
-                        ' • ' + formatBytes(speed) + '/s' +
-                        (remaining > 0 ? ' • ' + formatTime(remaining) : '');
-
-                    if (percent === 100) {
-                        statusText.textContent = 'Processing video...';
-                        uploadDetails.textContent = 'Fetching metadata and creating preview...';
-                    }
-                }
-            });
-
-            xhr.addEventListener('load', function() {
-                if (xhr.status >= 200 && xhr.status < 400) {
-                    statusText.textContent = 'Complete!';
-                    progressPercent.textContent = '✓';
-                    uploadDetails.textContent = 'Redirecting...';
-                    
-                    // Redirect to the response URL or parse redirect from response
-                    setTimeout(function() {
-                        // Try to follow redirect from response
-                        if (xhr.responseURL) {
-                            window.location.href = xhr.responseURL;
-                        } else {
-                            // Fallback: reload or go to changelist
-                            window.location.reload();
-                        }
-                    }, 500);
-                } else {
-                    // Error occurred
-                    overlay.classList.remove('active');
-                    // Create a temporary form to resubmit and show Django's error
-                    const tempDiv = document.createElement('div');
-                    tempDiv.innerHTML = xhr.responseText;
-                    document.body.innerHTML = xhr.responseText;
+            uploadFile(file, function(loaded, resumedAt) {
+                if (resumedAt !== null) {
+                    startOffset = resumedAt;
+                    startTime = Date.now();
+                    if (resumedAt > 0) statusText.textContent = 'Resuming upload...';
                 }
-            });
-
-            xhr.addEventListener('error', function() {
+                const percent = Math.round((loaded / file.size) * 100);
+                progressPercent.textContent = percent + '%';
+                progressBar.style.width = percent + '%';
+
+                // Calculate speed and ETA from the bytes sent in this session
+                const elapsed = (Date.now() - startTime) / 1000;
+                const speed = elapsed > 0 ? (loaded - startOffset) / elapsed : 0;
+                const remaining = speed > 0 ? (file.size - loaded) / speed : 0;
+
+                uploadDetails.textContent = formatBytes(loaded) + ' / ' + formatBytes(file.size) +
+                    ' • ' + formatBytes(speed) + '/s' +
+                    (remaining > 0 ? ' • ' + formatTime(remaining) : '');
+            }).then(function(uploadId) {
+                statusText.textContent = 'Processing video...';
+                progressPercent.textContent = '✓';
+                uploadDetails.textContent = 'Fetching metadata and creating preview...';
+                // The file is already on the server: submit the form with the upload id only
+                uploadIdInput.value = uploadId;
+                videoFileInput.value = '';
+                form.submit();
+            }).catch(function(err) {
                 statusText.textContent = 'Upload failed!';
                 progressPercent.textContent = '✗';
-                uploadDetails.textContent = 'Network error. Please try again.';
+                uploadDetails.textContent = err.message + ' Select the same file again to resume.';
                 setTimeout(function() {
                     overlay.classList.remove('active');
-                }, 2000);
+                }, 4000);
             });
-
-            xhr.addEventListener('abort', function() {
-                overlay.classList.remove('active');
-            });
-
-            // Open and send request
-            xhr.open('POST', form.action || window.location.href, true);
-            xhr.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
-            xhr.send(formData);
         });
     });
 })();
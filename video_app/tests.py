@@ -1,3 +1,872 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import struct
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
 
-# Create your tests here.
+import pytest
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from django.test import override_settings
+
+from video_app.api import backends, compact, dedupe, early_ingest, job_registry, llhls, pipeline, playlist_cache, transcode, transcode_daemon, viewing_stats, warm_worker, warmup, workers
+from video_app.api.eviction import TranscodeCacheEvictor
+from video_app.api import progress
+from video_app.api.progress import parse_progress_block, with_progress
+from video_app.api.segment_plan import plan_segments, segment_at, write_plan
+from video_app.api.trickplay import build_iframe_playlist, build_thumbnails_vtt, thin_timestamps
+
+"""!!! You need to configure a local PostgreSQL database and Redis instance with local reachable ports for tests to run successfully !!! """
+
+
+def _write_output(base_dir, video_id, resolution, sizes, age=0):
+	output_dir = os.path.join(base_dir, f"video_{video_id}", resolution)
+	os.makedirs(output_dir, exist_ok=True)
+	for i, size in enumerate(sizes):
+		path = os.path.join(output_dir, f"segment_{i:03d}.mp4")
+		with open(path, 'wb') as f:
+			f.write(b'\0' * size)
+		if age:
+			past = time.time() - age
+			os.utime(path, (past, past))
+	return output_dir
+
+
+def test_evictor_removes_least_recently_used_output_first(tmp_path):
+	cache.clear()
+	base_dir = str(tmp_path)
+	old = _write_output(base_dir, 1, '720p', [400, 400], age=7200)
+	recent = _write_output(base_dir, 2, '720p', [400, 400], age=60)
+
+	evictor = TranscodeCacheEvictor(base_dir=base_dir, max_bytes=1000, popularity_seconds=0)
+	removed = evictor.run_once()
+
+	assert removed == [(old, 800)]
+	assert not os.path.exists(old)
+	assert os.path.exists(recent)
+	assert evictor.total_bytes == 800
+	assert evictor.reclaimed_bytes == 800
+
+
+def test_evictor_keeps_outputs_with_running_encoder(tmp_path):
+	cache.clear()
+	base_dir = str(tmp_path)
+	busy = _write_output(base_dir, 1, '720p', [600], age=7200)
+	open(os.path.join(busy, 'continuous.lock'), 'w').close()
+	idle = _write_output(base_dir, 2, '720p', [600], age=60)
+
+	evictor = TranscodeCacheEvictor(base_dir=base_dir, max_bytes=700, popularity_seconds=0)
+	evictor.run_once()
+
+	assert os.path.exists(busy)
+	assert not os.path.exists(idle)
+
+
+def test_evictor_removes_stale_locks_of_crashed_encoders(tmp_path):
+	import subprocess
+	cache.clear()
+	base_dir = str(tmp_path)
+	crashed = _write_output(base_dir, 1, '720p', [600], age=7200)
+	old_lock = os.path.join(crashed, 'segment_001.mp4lockfile.lock')
+	open(old_lock, 'w').close()
+	past = time.time() - 7200
+	os.utime(old_lock, (past, past))
+	dead = subprocess.Popen(['true'])
+	dead.wait()
+	dead_lock = os.path.join(crashed, 'continuous.lock')
+	with open(dead_lock, 'w') as f:
+		json.dump({'pid': dead.pid, 'worker_id': 'w', 'segment': 0}, f)
+	idle = _write_output(base_dir, 2, '720p', [600], age=60)
+	assert not transcode.is_transcode_output_busy(crashed)
+
+	evictor = TranscodeCacheEvictor(base_dir=base_dir, max_bytes=700, popularity_seconds=0)
+	evictor.run_once()
+
+	assert not os.path.exists(crashed)
+	assert os.path.exists(idle)
+	# a stale lock no longer keeps the file from being encoded again
+	with open(old_lock.replace('video_1', 'video_2'), 'w') as f:
+		f.write(str(dead.pid))
+	assert transcode.lock_a_file(old_lock.replace('video_1', 'video_2'))
+
+def test_evictor_tracks_size_incrementally(tmp_path):
+	cache.clear()
+	base_dir = str(tmp_path)
+	output_dir = _write_output(base_dir, 1, '480p', [100, 100])
+
+	evictor = TranscodeCacheEvictor(base_dir=base_dir, max_bytes=10_000)
+	assert evictor.refresh() == 200
+
+	with open(os.path.join(output_dir, 'segment_002.mp4'), 'wb') as f:
+		f.write(b'\0' * 50)
+	future = time.time() + 5
+	os.utime(output_dir, (future, future))
+	assert evictor.refresh() == 250
+
+
+def test_evictor_ignores_symlinked_duplicate_folders(tmp_path):
+	cache.clear()
+	base_dir = str(tmp_path)
+	_write_output(base_dir, 1, '720p', [300])
+	os.symlink('video_1', os.path.join(base_dir, 'video_2'))
+
+	evictor = TranscodeCacheEvictor(base_dir=base_dir, max_bytes=10_000)
+	assert evictor.refresh() == 300
+	assert transcode.transcode_aliases(base_dir) == {1: [2]}
+
+
+def test_with_progress_adds_global_progress_options_once():
+	cmd = with_progress(["ffmpeg", "-y", "-i", "in.mp4", "out.mp4"])
+	assert cmd[:4] == ["ffmpeg", "-progress", "pipe:1", "-nostats"]
+	assert with_progress(cmd) == cmd
+
+
+def test_parse_progress_block():
+	data = parse_progress_block({
+		'frame': '240', 'fps': '96.12', 'bitrate': '2490.3kbits/s', 'total_size': '3112000',
+		'out_time_us': '10000000', 'speed': '4.01x', 'progress': 'continue',
+	})
+	assert data['frame'] == 240
+	assert data['bitrate_kbps'] == pytest.approx(2490.3)
+	assert data['out_time_seconds'] == pytest.approx(10.0)
+	assert data['speed'] == pytest.approx(4.01)
+	assert data['state'] == 'continue'
+
+	assert parse_progress_block({'bitrate': 'N/A', 'speed': 'N/A', 'progress': 'end'})['speed'] is None
+
+
+def test_get_backend_uses_job_class_with_default_fallback():
+	backends._instances.clear()
+	with override_settings(TRANSCODER_BACKENDS={
+		'default': 'video_app.api.backends.FFmpegCLIBackend',
+		'segment': 'video_app.api.backends.StubBackend',
+	}):
+		assert isinstance(backends.get_backend('segment'), backends.StubBackend)
+		assert isinstance(backends.get_backend('preview'), backends.FFmpegCLIBackend)
+		assert backends.get_backend('segment') is backends.get_backend('segment')
+	backends._instances.clear()
+
+
+def test_stub_backend_output_is_deterministic(tmp_path):
+	stub = backends.StubBackend()
+	params = {'scale': 'scale=-2:720', 'codec': 'libx264', 'bitrate': '2500k', 'audio': 'aac'}
+	first, second, other = (str(tmp_path / name) for name in ('a.mp4', 'b.mp4', 'c.mp4'))
+	stub.encode_segment('in.mp4', first, params, 0, 5, 5)
+	stub.encode_segment('in.mp4', second, params, 0, 5, 5)
+	stub.encode_segment('in.mp4', other, params, 5, 10, 5)
+	with open(first, 'rb') as a, open(second, 'rb') as b, open(other, 'rb') as c:
+		content = a.read()
+		assert content == b.read()
+		assert content != c.read()
+
+
+def test_plan_segments_cuts_at_keyframes_near_the_target():
+	# 2s GOPs with a scene cut at 7.1s, then a 20s GOP
+	keyframes = [0.0, 2.0, 4.0, 6.0, 7.1, 8.0, 10.0, 12.0, 32.0]
+	segments = plan_segments(keyframes, 40.0, target=6, ramp=())
+	assert [start for start, _ in segments] == [0.0, 6.0, 12.0, 18.0, 24.0, 32.0]
+	assert sum(duration for _, duration in segments) == pytest.approx(40.0)
+	# a short tail is merged into the last segment
+	assert plan_segments([0.0, 6.0, 12.0], 13.0, target=6, ramp=()) == [(0.0, 6.0), (6.0, 7.0)]
+	assert segment_at(segments, 0) == 0 and segment_at(segments, 12.5) == 2 and segment_at(segments, 39) == 5
+
+
+def test_plan_segments_starts_with_the_startup_ramp():
+	# 2s GOPs: the 1s opener is cut between keyframes, the next cuts snap to the nearest keyframe
+	keyframes = [float(t) for t in range(0, 30, 2)]
+	segments = plan_segments(keyframes, 30.0, target=6, ramp=[1, 2, 4])
+	assert [start for start, _ in segments] == [0.0, 1.0, 2.0, 6.0, 12.0, 18.0, 24.0]
+	assert sum(duration for _, duration in segments) == pytest.approx(30.0)
+	# a video shorter than the ramp is not padded with openers
+	assert plan_segments([0.0], 2.0, target=6, ramp=[1, 2, 4]) == [(0.0, 1.0), (1.0, 1.0)]
+
+
+
+def test_compact_rendition_packs_segments_into_byte_ranges(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	write_plan(7, [(0.0, 1.0), (1.0, 5.5)], 6)
+	output_dir = transcode.generate_transcode_path(7, '720p')
+	os.makedirs(output_dir)
+	files = {'init.mp4': b'I' * 10, 'segment_000.mp4': b'A' * 30, 'segment_001.mp4': b'B' * 20}
+	for name, data in files.items():
+		if name != 'segment_001.mp4':
+			with open(os.path.join(output_dir, name), 'wb') as f:
+				f.write(data)
+	assert compact.compact_rendition(7, '720p').startswith("Not compacted")
+
+	with open(os.path.join(output_dir, 'segment_001.mp4'), 'wb') as f:
+		f.write(files['segment_001.mp4'])
+	assert compact.compact_rendition(7, '720p') == "Success"
+	assert sorted(os.listdir(output_dir)) == ['rendition.json', 'rendition.mp4']
+	index = compact.rendition_index(output_dir)
+	assert index['segments'] == [(10, 30, 1.0), (40, 20, 5.5)]
+	with open(os.path.join(output_dir, 'rendition.mp4'), 'rb') as f:
+		data = f.read()
+	for name, content in files.items():
+		offset, size = compact.file_range(index, name)
+		assert data[offset:offset + size] == content
+	assert compact.segment_starting_at(index, 40) == 1 and compact.segment_starting_at(index, 41) is None
+
+	playlist = compact.build_byterange_playlist(index)
+	assert '#EXT-X-MAP:URI="rendition.mp4",BYTERANGE="10@0"' in playlist
+	assert '#EXTINF:5.500,\n#EXT-X-BYTERANGE:20@40\nrendition.mp4' in playlist
+	assert '#EXT-X-TARGETDURATION:6' in playlist
+
+def test_thin_timestamps_keeps_minimum_spacing():
+	assert thin_timestamps([0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0], 5) == [0.0, 6.0, 12.0]
+	assert thin_timestamps([0.0, 4.999999, 10.0], 5) == [0.0, 4.999999, 10.0]
+
+
+def test_build_thumbnails_vtt_maps_cues_to_sprite_tiles():
+	vtt = build_thumbnails_vtt([0.0, 6.0, 12.0], 15.5, 160, 90, columns=2, rows=1)
+	assert vtt.startswith("WEBVTT\n")
+	assert "00:00:00.000 --> 00:00:06.000\nsprite_000.jpg#xywh=0,0,160,90\n" in vtt
+	assert "00:00:06.000 --> 00:00:12.000\nsprite_000.jpg#xywh=160,0,160,90\n" in vtt
+	assert "00:00:12.000 --> 00:00:15.500\nsprite_001.jpg#xywh=0,0,160,90\n" in vtt
+
+
+def test_build_iframe_playlist_uses_byte_ranges():
+	playlist = build_iframe_playlist(800, [(800, 1000, 0.0), (1800, 1200, 2.0)], 4.5)
+	assert "#EXT-X-I-FRAMES-ONLY\n" in playlist
+	assert '#EXT-X-MAP:URI="iframes.mp4",BYTERANGE="800@0"\n' in playlist
+	assert "#EXTINF:2.000,\n#EXT-X-BYTERANGE:1000@800\niframes.mp4\n" in playlist
+	assert "#EXTINF:2.500,\n#EXT-X-BYTERANGE:1200@1800\niframes.mp4\n" in playlist
+	assert "#EXT-X-TARGETDURATION:3\n" in playlist
+
+
+def test_probe_a_video_is_cached_per_file_identity(tmp_path, monkeypatch):
+	cache.clear()
+	path = tmp_path / 'movie.mp4'
+	path.write_bytes(b'\0' * 100)
+	calls = []
+	monkeypatch.setattr(transcode, '_run_probe', lambda p: calls.append(p) or {'width': 640, 'height': 360})
+
+	assert transcode.probe_a_video(str(path)) == {'width': 640, 'height': 360}
+	assert transcode.probe_a_video(str(path)) == {'width': 640, 'height': 360}
+	assert len(calls) == 1
+
+	path.write_bytes(b'\0' * 200)
+	transcode.probe_a_video(str(path))
+	assert len(calls) == 2
+
+
+def test_pick_best_thumbnail_prefers_detail_and_skips_black_frames():
+	black = {'path': 'a.jpg', 'timestamp': 10.0, 'entropy': 0.9, 'yavg': 16.0, 'bitdepth': 8}
+	flat = {'path': 'b.jpg', 'timestamp': 20.0, 'entropy': 0.2, 'yavg': 120.0, 'bitdepth': 8}
+	detailed = {'path': 'c.jpg', 'timestamp': 30.0, 'entropy': 0.6, 'yavg': 110.0, 'bitdepth': 8}
+	assert transcode.pick_best_thumbnail([black, flat, detailed]) is detailed
+	assert transcode.thumbnail_score(black) < transcode.thumbnail_score(flat)
+
+
+def test_block_hash_does_not_depend_on_chunk_boundaries(tmp_path):
+	data = bytes(range(256)) * 5
+	source = tmp_path / 'source.bin'
+	source.write_bytes(data)
+	part = tmp_path / 'upload.part'
+	part.write_bytes(b'\0' * len(data))
+	blocks = str(tmp_path / 'upload.blocks')
+
+	with open(part, 'r+b') as f:
+		for start, end in [(0, 100), (100, 777), (777, len(data))]:
+			hasher = dedupe.BlockHasher(blocks, f, start, block_size=256)
+			f.seek(start)
+			f.write(data[start:end])
+			hasher.update(data[start:end])
+			hasher.finish(end, len(data))
+
+	expected = dedupe.hash_file(str(source), block_size=256)
+	assert dedupe.BlockHasher.content_hash(blocks, len(data)) == expected
+	assert expected != dedupe.hash_file(str(source), block_size=512)
+
+
+def test_early_ingest_is_scheduled_once_per_unlocked_stage(monkeypatch, settings):
+	cache.clear()
+	settings.EARLY_INGEST_MIN_BYTES = 100
+	enqueued = []
+
+	class Queue:
+		def enqueue(self, func, *args):
+			enqueued.append(args)
+
+	monkeypatch.setattr(early_ingest.django_rq, 'get_queue', lambda name: Queue())
+	upload = type('Upload', (), {'id': 'u1', 'total_size': 1000, 'offset': 50})()
+
+	assert not early_ingest.schedule_early_ingest(upload)
+	upload.offset = 100
+	assert early_ingest.schedule_early_ingest(upload)
+	upload.offset = 200
+	assert not early_ingest.schedule_early_ingest(upload)  # a job is already queued
+
+	early_ingest.cache.delete(early_ingest._queued_key('u1'))
+	early_ingest.cache.set(early_ingest._next_key('u1'), 600)
+	assert not early_ingest.schedule_early_ingest(upload)  # the next stage needs 600 bytes
+	upload.offset = 1000
+	assert early_ingest.schedule_early_ingest(upload)  # the last chunk always triggers the final pass
+	assert enqueued == [('u1',), ('u1',)]
+
+
+@pytest.mark.django_db
+def test_chunked_upload_resumes_at_server_offset(tmp_path, settings):
+	settings.MEDIA_ROOT = str(tmp_path)
+	admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+	client = APIClient()
+	client.force_login(admin)
+	data = b'0123456789' * 3
+
+	resp = client.post('/api/uploads/', {'filename': 'movie.mp4', 'total_size': len(data)}, format='json')
+	assert resp.status_code == 201
+	url = f"/api/uploads/{resp.json()['id']}/"
+
+	def put(start, end):
+		return client.generic('PUT', url, data[start:end], content_type='application/octet-stream',
+			HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(data)}')
+
+	assert put(0, 12).json()['offset'] == 12
+	conflict = put(20, 30)
+	assert conflict.status_code == 409
+	assert conflict.json()['offset'] == 12
+	assert client.get(url).json()['offset'] == 12
+
+	done = put(12, 30).json()
+	assert done['status'] == 'complete'
+	part_path = tmp_path / 'media' / 'uploads' / f"{done['id']}.part"
+	with open(part_path, 'rb') as f:
+		assert f.read() == data
+	assert done['content_hash'] == dedupe.hash_file(str(part_path))
+
+
+def test_pipeline_descendants_follow_dependencies():
+	assert pipeline.descendants({'keyframes'}) == {'playlist'}
+	assert pipeline.descendants({'probe'}) == {'thumbnail', 'preview', 'keyframes', 'playlist', 'trickplay'}
+	assert pipeline.descendants({'imdb'}) == set()
+
+
+@pytest.mark.django_db
+def test_failed_ingest_stage_skips_its_dependents(monkeypatch):
+	from video_app.models import Video, IngestStage
+	video = Video.objects.create(title='t', video_file='media/videos/t.mp4')
+	pipeline.start_ingest(video.id)
+
+	def broken(video):
+		raise RuntimeError("no keyframes")
+
+	monkeypatch.setitem(pipeline.STAGE_FUNCTIONS, 'keyframes', broken)
+	with pytest.raises(RuntimeError):
+		pipeline.run_ingest_stage(video.id, 'keyframes')
+
+	stages = {s.name: s for s in video.ingest_stages.all()}
+	assert stages['keyframes'].status == IngestStage.StageStatus.FAILED
+	assert stages['keyframes'].attempts == 1
+	assert stages['keyframes'].finished_at is not None
+	assert stages['playlist'].status == IngestStage.StageStatus.SKIPPED
+	assert stages['trickplay'].status == IngestStage.StageStatus.PENDING
+	assert pipeline.run_ingest_stage(video.id, 'playlist') == "Skipped"
+
+
+@pytest.mark.django_db
+def test_inline_ingest_resumes_unfinished_stages(monkeypatch):
+	from video_app.models import Video, IngestStage
+	video = Video.objects.create(title='t', video_file='media/videos/t.mp4')
+	calls = []
+
+	def record(name):
+		def stage(video):
+			calls.append(name)
+		return stage
+
+	for name in pipeline.STAGES:
+		monkeypatch.setitem(pipeline.STAGE_FUNCTIONS, name, record(name))
+	monkeypatch.setitem(pipeline.STAGE_FUNCTIONS, 'keyframes', lambda video: 1 / 0)
+
+	stages = pipeline.run_ingest_inline(video.id)
+	assert stages['keyframes'].status == IngestStage.StageStatus.FAILED
+	assert stages['playlist'].status == IngestStage.StageStatus.SKIPPED
+	assert pipeline.unfinished_stages(video.id) == ['keyframes']
+
+	calls.clear()
+	monkeypatch.setitem(pipeline.STAGE_FUNCTIONS, 'keyframes', record('keyframes'))
+	stages = pipeline.run_ingest_inline(video.id, pipeline.unfinished_stages(video.id))
+	assert calls == ['keyframes', 'playlist']
+	assert set(stages) == {'keyframes', 'playlist'}
+	assert pipeline.unfinished_stages(video.id) == []
+
+
+def test_playlist_segment_durations_in_playlist_order():
+	m3u8 = "#EXTM3U\n#EXT-X-MAP:URI=\"init.mp4\"\n#EXTINF:6.006,\nsegment_000.mp4\n#EXT-X-DISCONTINUITY\n#EXTINF:4.5,\nsegment_001.mp4\n#EXT-X-ENDLIST\n"
+	durations = workers.playlist_segment_durations(m3u8)
+	assert list(durations) == ['segment_000.mp4', 'segment_001.mp4']
+	assert durations['segment_001.mp4'] == 4.5
+
+
+def test_rank_outputs_picks_top_resolutions_of_top_titles():
+	scores = [(1, '720p', 5.0), (2, '1080p', 4.0), (1, '480p', 1.0), (2, '720p', 3.0), (1, '1080p', 2.0), (3, '720p', 6.0)]
+	# title 2 (7.0) and title 1 (8.0) beat title 3 (6.0), even though 3 has the best single output
+	assert warmup.rank_outputs(scores, titles=2, per_title=2) == [(1, '720p'), (1, '1080p'), (2, '1080p'), (2, '720p')]
+	assert warmup.rank_outputs(scores, titles=1, per_title=1) == [(1, '720p')]
+
+
+def test_merge_counters_adds_pending_counts_to_viewing_stats():
+	from video_app.models import ViewingStats
+	stats = ViewingStats(views=2, resolution_views={'720p': 2}, segment_histogram={'0': 2})
+	viewing_stats.merge_counters(stats, {'v:720p': 1, 'v:1080p': 1, 's:1080p': 3, 'h:0': 2, 'h:1': 1, 't': 1700000000})
+	assert stats.views == 4
+	assert stats.resolution_views == {'720p': 3, '1080p': 1}
+	assert stats.segments == 3 and stats.resolution_segments == {'1080p': 3}
+	assert stats.segment_histogram == {'0': 4, '1': 1}
+	assert stats.last_viewed_at.timestamp() == 1700000000
+	assert stats.retention(1) == 0.25
+
+
+
+class _RecordingPipeline:
+	def __init__(self, executed):
+		self.commands = []
+		self.executed = executed
+
+	def __getattr__(self, name):
+		return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+	def execute(self):
+		self.executed.append(self.commands)
+
+
+class _RecordingRedis:
+	def __init__(self, executed):
+		self.executed = executed
+
+	def pipeline(self, transaction=True):
+		return _RecordingPipeline(self.executed)
+
+
+def test_record_view_coalesces_heartbeats_per_viewer(monkeypatch, settings):
+	settings.HEARTBEAT_COALESCE_SECONDS = 10
+	executed = []
+	monkeypatch.setattr(viewing_stats, 'get_redis_connection', lambda alias: _RecordingRedis(executed))
+	monkeypatch.setattr(viewing_stats, '_viewers', {})
+	clock = [1000.0]
+	monkeypatch.setattr(viewing_stats.time, 'monotonic', lambda: clock[0])
+
+	viewing_stats.record_view(1, '720p', 'alice')  # play start: written at once
+	viewing_stats.record_view(1, '720p', 'alice', 0)
+	viewing_stats.record_view(1, '720p', 'alice', 1)  # linear playback within the interval: coalesced
+	assert len(executed) == 1
+	viewing_stats.record_view(1, '720p', 'alice', 40)  # seek: written at once, with the coalesced counts
+	assert len(executed) == 2
+	segment_counts = {args[1]: args[2] for name, args, kwargs in executed[1] if name == 'hincrby' and args[1].startswith('h:')}
+	assert segment_counts == {'h:0': 1, 'h:1': 1, 'h:40': 1}
+	hits = [args[2] for name, args, kwargs in executed[1] if name == 'hincrby' and args[1] == transcode.HITS_FIELD]
+	assert hits == [3]
+
+	clock[0] += 11
+	viewing_stats.record_view(1, '720p', 'alice', 41)  # interval passed
+	assert len(executed) == 3
+
+
+
+class _HashRedis:
+	"""Just enough of a Redis client for hash-based registries."""
+
+	def __init__(self):
+		self.hashes = {}
+
+	def pipeline(self, transaction=True):
+		return self
+
+	def execute(self):
+		pass
+
+	def expire(self, key, seconds):
+		pass
+
+	def hset(self, key, field, value):
+		self.hashes.setdefault(key, {})[field.encode()] = value.encode()
+
+	def hget(self, key, field):
+		return self.hashes.get(key, {}).get(field.encode())
+
+	def hgetall(self, key):
+		return dict(self.hashes.get(key, {}))
+
+	def hdel(self, key, *fields):
+		for field in fields:
+			self.hashes.get(key, {}).pop(field if isinstance(field, bytes) else field.encode(), None)
+
+	def delete(self, key):
+		self.hashes.pop(key, None)
+
+
+def test_job_registry_tracks_jobs_until_they_end_or_go_stale(monkeypatch):
+	redis = _HashRedis()
+	monkeypatch.setattr(job_registry, 'get_redis_connection', lambda alias: redis)
+	job_registry.register_job(1, '720p', 'a')
+	job_registry.touch_job(1, '720p', 'b')
+	assert job_registry.is_job_active(1, '720p', 'a')
+	assert not job_registry.is_job_active(1, '1080p', 'a')
+	assert job_registry.active_jobs(1, '720p') == {'a': 'queued', 'b': 'started'}
+
+	job_registry._job_ended(type('Job', (), {'id': 'a', 'meta': {'output': (1, '720p')}})())
+	assert not job_registry.is_job_active(1, '720p', 'a')
+
+	# a running job that stopped refreshing its entry (worker died) no longer counts
+	later = time.time() + job_registry.STARTED_STALE_SECONDS + 1
+	monkeypatch.setattr(job_registry.time, 'time', lambda: later)
+	assert not job_registry.is_job_active(1, '720p', 'b')
+	assert job_registry.active_jobs(1, '720p') == {}
+
+
+class _FakeEncode:
+	"""ContinuousEncode stand-in that finishes after a few checks."""
+	closed = []
+
+	def __init__(self, video_id, resolution, *args, **kwargs):
+		self.video_id = video_id
+		self.checks = 3
+
+	def start(self):
+		return None
+
+	def check(self):
+		self.checks -= 1
+		return "Success" if self.checks == 0 else None
+
+	def close(self):
+		_FakeEncode.closed.append(self.video_id)
+
+
+def test_transcode_daemon_runs_registered_requests_up_to_the_limit(monkeypatch):
+	redis = _HashRedis()
+	monkeypatch.setattr(job_registry, 'get_redis_connection', lambda alias: redis)
+	monkeypatch.setattr(transcode_daemon, 'ContinuousEncode', _FakeEncode)
+	_FakeEncode.closed = []
+	requests = []
+	for video_id in (1, 2, 3):
+		job_id = f"job{video_id}"
+		requests.append({
+			'job_id': job_id, 'video_id': video_id, 'resolution': '720p', 'scale_param': '', 'segment_name': 'segment_000.mp4',
+			'codec_param': '', 'bitrate': '', 'audio_param': '', 'segment_duration': 5, 'worker_id': job_id,
+		})
+		job_registry.register_job(video_id, '720p', job_id)
+	# cancelled before the daemon got to it
+	job_registry.unregister_job(2, '720p', 'job2')
+
+	async def scenario():
+		daemon = transcode_daemon.TranscodeDaemon(max_encoders=1, check_interval=0)
+		daemon.waiting.extend(requests)
+		daemon._start_waiting()
+		assert list(daemon.tasks) == ['job1']
+		while daemon.tasks or daemon.waiting:
+			await asyncio.gather(*daemon.tasks.values())
+			daemon._start_waiting()
+
+	asyncio.run(scenario())
+	assert _FakeEncode.closed == [1, 3]
+	assert job_registry.active_jobs(1, '720p') == {} and job_registry.active_jobs(3, '720p') == {}
+
+
+def test_warm_worker_forks_only_for_isolated_queues(monkeypatch, settings):
+	settings.RQ_JOB_ISOLATION = {'high': 'inprocess', 'low': 'fork'}
+	calls = []
+	monkeypatch.setattr(warm_worker.SimpleWorker, 'execute_job', lambda self, job, queue: calls.append(('inprocess', queue.name)))
+	monkeypatch.setattr(warm_worker.Worker, 'execute_job', lambda self, job, queue: calls.append(('fork', queue.name)))
+	monkeypatch.setattr(warm_worker, 'close_old_connections', lambda: None)
+	monkeypatch.setattr(warm_worker, 'connections', SimpleNamespace(close_all=lambda: None))
+	worker = warm_worker.WarmWorker.__new__(warm_worker.WarmWorker)
+	# RQ stores naive UTC timestamps
+	job = SimpleNamespace(enqueued_at=(datetime.now(dt_timezone.utc) - timedelta(seconds=2)).replace(tzinfo=None))
+	for name in ('high', 'low', 'unknown'):
+		worker.execute_job(job, SimpleNamespace(name=name))
+	assert calls == [('inprocess', 'high'), ('fork', 'low'), ('fork', 'unknown')]
+	assert 2 <= worker._queue_wait < 10
+
+
+def _box(box_type, payload=b''):
+	return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _fragment(decode_time, size):
+	tfdt = _box(b'tfdt', b'\0' * 4 + struct.pack('>I', decode_time))
+	return _box(b'moof', _box(b'traf', tfdt)) + _box(b'mdat', b'x' * size)
+
+
+def test_llhls_lists_complete_fragments_as_parts(tmp_path):
+	mdhd = _box(b'mdhd', b'\0' * 12 + struct.pack('>I', 1000) + b'\0' * 8)
+	header = _box(b'ftyp', b'isom') + _box(b'moov', _box(b'trak', _box(b'mdia', mdhd)))
+	first, second = _fragment(0, 100), _fragment(1000, 120)
+	path = tmp_path / 'segment_004.mp4'
+	# the encoder is halfway through writing the third fragment
+	path.write_bytes(header + first + second + _fragment(2000, 80)[:-40])
+
+	parts, next_offset = llhls.segment_parts(str(path), 3.0, complete=False)
+	assert parts == [(len(header), len(first), 1.0)]
+	assert next_offset == len(header) + len(first)
+	parts, _ = llhls.segment_parts(str(path), 3.0, complete=True)
+	assert [duration for _, _, duration in parts] == [1.0, 2.0]
+
+	plan = [(0.0, 6.0)] * 5
+	playlist = llhls.build_llhls_playlist(plan, 4, {4: parts[:1]}, next_offset, 1.0)
+	assert "#EXTINF:6.000,\nsegment_003.mp4\n" in playlist
+	assert "segment_004.mp4\n" not in playlist
+	assert f'#EXT-X-PART:DURATION=1.000,URI="segment_004.mp4",BYTERANGE="{len(first)}@{len(header)}",INDEPENDENT=YES\n' in playlist
+	assert playlist.endswith(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="segment_004.mp4",BYTERANGE-START={next_offset}\n')
+
+
+def test_playlist_cache_serves_local_copy_until_the_version_changes(monkeypatch, settings):
+	settings.PLAYLIST_LOCAL_TTL_SECONDS = 0
+	version = [0]
+	builds = []
+	monkeypatch.setattr(playlist_cache, '_ensure_listener', lambda: None)
+	monkeypatch.setattr(playlist_cache, 'playlist_version', lambda video_id: version[0])
+	monkeypatch.setattr(playlist_cache, '_local', {})
+
+	def build():
+		builds.append(1)
+		return f"#EXTM3U\n#v{version[0]}\n"
+
+	body, gzipped = playlist_cache.get_playlist(9, '720p', build)
+	assert gzip.decompress(gzipped).decode() == body == "#EXTM3U\n#v0\n"
+	assert playlist_cache.get_playlist(9, '720p', build) == (body, gzipped)
+	assert len(builds) == 1
+	# another process regenerated the playlist
+	version[0] = 1
+	assert playlist_cache.get_playlist(9, '720p', build)[0] == "#EXTM3U\n#v1\n"
+	assert len(builds) == 2
+	# errors are passed through and never cached
+	assert playlist_cache.get_playlist(9, '1080p', lambda: "Error: no keyframes") == ("Error: no keyframes", None)
+
+
+def test_segment_requests_wait_only_for_segments_the_encoder_is_about_to_write(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	active = [False]
+	monkeypatch.setattr(workers, 'is_job_active', lambda video_id, resolution, job_id: active[0])
+	output_dir = transcode.generate_transcode_path(5, '480p')
+	os.makedirs(output_dir)
+	assert not workers.continuous_encode_pending(5, '480p', 'viewer', 0)
+	# submitted, not started yet: only the opening is worth waiting for
+	active[0] = True
+	assert workers.continuous_encode_pending(5, '480p', 'viewer', 1)
+	assert not workers.continuous_encode_pending(5, '480p', 'viewer', 2)
+
+	with open(os.path.join(output_dir, 'continuous.lock'), 'w') as f:
+		json.dump({'pid': 1, 'worker_id': 'viewer_video5_480p', 'segment': 10}, f)
+	for number in (10, 11):
+		open(os.path.join(output_dir, f"segment_{number:03d}.mp4"), 'wb').close()
+	assert [n for n in range(8, 16) if workers.continuous_encode_pending(5, '480p', 'viewer', n)] == [10, 11, 12, 13]
+
+
+@pytest.mark.django_db
+def test_regenerated_index_invalidates_playlists_for_every_caller(tmp_path, monkeypatch):
+	from video_app.models import Video
+	monkeypatch.chdir(tmp_path)
+	video = Video.objects.create(title='t', video_file='videos/t.mp4', duration=timedelta(seconds=20))
+	invalidated = []
+	monkeypatch.setattr(transcode, 'get_keyframes', lambda path: [0.0, 6.0, 12.0, 18.0])
+	monkeypatch.setattr(transcode, 'invalidate_playlists', lambda *ids: invalidated.append(ids))
+	cache.set(f"m3u8_{video.id}", "#EXTM3U\nstale\n")
+
+	# the ingest pipeline calls generate_m3u8_file directly, without get_m3u8_file
+	m3u8 = transcode.generate_m3u8_file(os.path.join(f"media/index/video_{video.id}/", 'index.m3u8'), video.id)
+	assert m3u8.startswith("#EXTM3U") and "stale" not in m3u8
+	assert cache.get(f"m3u8_{video.id}") == m3u8
+	assert invalidated == [(video.id,)]
+
+
+@pytest.mark.django_db
+def test_new_segment_plan_waits_until_no_encoder_writes_the_old_cuts(tmp_path, monkeypatch):
+	from video_app.models import Video
+	from video_app.api.segment_plan import load_plan
+	monkeypatch.chdir(tmp_path)
+	video = Video.objects.create(title='t', video_file='videos/t.mp4', duration=timedelta(seconds=20))
+	killed, invalidated = [], []
+	monkeypatch.setattr(transcode, 'get_keyframes', lambda path: [0.0, 6.0, 12.0, 18.0])
+	monkeypatch.setattr(transcode, 'invalidate_playlists', lambda *ids: invalidated.append(ids))
+	monkeypatch.setattr(workers, 'kill_continuous_worker', lambda video_id, resolution: killed.append(resolution))
+	write_plan(video.id, [(0.0, 20.0)], 20)
+	for resolution, name in (('480p', 'rendition.json'), ('720p', 'segment_001.mp4lockfile.lock')):
+		os.makedirs(transcode.generate_transcode_path(video.id, resolution))
+		open(os.path.join(transcode.generate_transcode_path(video.id, resolution), name), 'w').close()
+	m3u8_path = os.path.join(f"media/index/video_{video.id}/", 'index.m3u8')
+
+	assert transcode.generate_m3u8_file(m3u8_path, video.id).startswith("Failed")
+	assert sorted(killed) == ['480p', '720p']
+	assert load_plan(video.id) == [(0.0, 20.0)]
+	assert os.listdir(f"media/transcode/video_{video.id}") == ['720p']
+	assert invalidated == [(video.id,)]
+
+	os.remove(os.path.join(transcode.generate_transcode_path(video.id, '720p'), 'segment_001.mp4lockfile.lock'))
+	assert transcode.generate_m3u8_file(m3u8_path, video.id).startswith("#EXTM3U")
+	assert load_plan(video.id) != [(0.0, 20.0)]
+
+
+def test_segment_wait_follows_compaction_and_gives_up_at_the_deadline(tmp_path, monkeypatch):
+	import threading
+	from video_app.api import views
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setattr(views, 'record_view', lambda *args: None)
+	monkeypatch.setattr(compact, 'invalidate_playlists', lambda *ids: None)
+	write_plan(7, [(0.0, 1.0), (1.0, 5.5)], 6)
+	output_dir = transcode.generate_transcode_path(7, '720p')
+	os.makedirs(output_dir)
+	for name in ('init.mp4', 'segment_000.mp4'):
+		with open(os.path.join(output_dir, name), 'wb') as f:
+			f.write(b'A' * 10)
+	request = SimpleNamespace(headers={}, user=SimpleNamespace(username='viewer'))
+	view = views.VideoSegmentView()
+
+	response = view._await_file(request, 7, '720p', output_dir, 'segment_001.mp4', time.monotonic())
+	assert response.status_code == 503
+
+	def finish_and_compact():
+		with open(os.path.join(output_dir, 'segment_001.mp4'), 'wb') as f:
+			f.write(b'B' * 20)
+		assert compact.compact_rendition(7, '720p') == "Success"
+	threading.Timer(0.2, finish_and_compact).start()
+	# Waits end once the output is compacted: from rendition.mp4, or 404 past its last segment
+	response = view._await_file(request, 7, '720p', output_dir, 'segment_003.mp4', time.monotonic() + 5)
+	assert response.status_code == 404
+	response = view._await_file(request, 7, '720p', output_dir, 'segment_001.mp4', time.monotonic() + 5)
+	assert response.status_code == 200 and response.content == b'B' * 20
+
+
+def test_init_request_shares_one_deadline_and_answers_503(tmp_path, monkeypatch, settings):
+	from video_app.api import views
+	monkeypatch.chdir(tmp_path)
+	settings.LL_HLS_ENABLED = False
+	settings.SEGMENT_WAIT_TIMEOUT_SECONDS = 1
+	encodes = []
+	monkeypatch.setattr(views, 'continuous_encode_pending', lambda *args: True)
+	monkeypatch.setattr(views, 'wait_for_segment_completion', lambda *args, **kwargs: time.sleep(0.5) or False)
+	monkeypatch.setattr(views, 'start_transcode_worker', lambda *args, **kwargs: encodes.append(kwargs['timeout']))
+	request = SimpleNamespace(headers={}, user=SimpleNamespace(username='viewer'))
+
+	started = time.monotonic()
+	response = views.VideoSegmentView().get(request, 7, '720p', 'init.mp4')
+	assert response.status_code == 503 and response['Retry-After']
+	# The fallback encode only gets what is left after waiting for the continuous encoder
+	assert len(encodes) == 1 and 0 < encodes[0] < 1
+	assert time.monotonic() - started < 1.5
+
+
+@pytest.mark.django_db
+def test_video_admin_form_attaches_only_the_admins_own_uploads():
+	from django.contrib.admin.sites import site
+	from django.test import RequestFactory
+	from video_app.models import ChunkedUpload, Video
+	owner = User.objects.create_superuser(username='owner', email='owner@example.com', password='pw')
+	other = User.objects.create_superuser(username='other', email='other@example.com', password='pw')
+	upload = ChunkedUpload.objects.create(user=owner, filename='movie.mp4', total_size=1, offset=1, status=ChunkedUpload.UploadStatus.COMPLETE)
+
+	def form_for(user):
+		request = RequestFactory().get('/admin/video_app/video/add/')
+		request.user = user
+		form_class = site._registry[Video].get_form(request)
+		return form_class(data={'upload_id': str(upload.id), 'title': 't'})
+
+	form = form_for(other)
+	form.is_valid()
+	assert 'upload_id' in form.errors
+	form = form_for(owner)
+	form.is_valid()
+	assert 'upload_id' not in form.errors and form.upload == upload
+
+
+def test_progress_records_of_jobs_on_the_same_output_are_kept_apart(monkeypatch):
+	redis = _HashRedis()
+	monkeypatch.setattr(progress, 'get_redis_connection', lambda alias: redis)
+	progress.publish_progress(1, '720p', {'job_id': 'continuous', 'position_seconds': 30.0, 'ts': 100.0})
+	progress.publish_progress(1, '720p', {'segment': 'segment_040.mp4', 'position_seconds': 245.0, 'ts': 101.0})
+
+	assert progress.get_progress(1, '720p', job='continuous')['position_seconds'] == 30.0
+	assert progress.get_progress(1, '720p')['position_seconds'] == 245.0
+	assert set(progress.get_video_progress(1)['720p']) == {'continuous', 'segment_040.mp4'}
+	progress.clear_progress(1, '720p', job='segment_040.mp4')
+	assert list(progress.get_video_progress(1)['720p']) == ['continuous']
+	assert progress.get_progress(1, '1080p') is None and progress.get_progress(1, '720p', job='gone') is None
+
+
+def _write_av_source(av, path, seconds, fps=24):
+	"""Tiny H.264/AAC source with a keyframe every second, written with PyAV."""
+	from fractions import Fraction
+	output = av.open(path, 'w')
+	vout = output.add_stream('libx264', rate=fps)
+	vout.width, vout.height, vout.pix_fmt = 64, 48, 'yuv420p'
+	vout.options = {'g': str(fps)}
+	aout = output.add_stream('aac', rate=48000)
+	for i in range(seconds * fps):
+		frame = av.VideoFrame(64, 48, 'yuv420p')
+		for plane in frame.planes:
+			plane.update(bytes([i % 256]) * plane.buffer_size)
+		frame.pts, frame.time_base = i, Fraction(1, fps)
+		for packet in vout.encode(frame):
+			output.mux(packet)
+	for n in range(0, seconds * 48000, 1024):
+		frame = av.AudioFrame(format='s16', layout='stereo', samples=1024)
+		frame.planes[0].update(b'\0' * frame.planes[0].buffer_size)
+		frame.sample_rate, frame.pts, frame.time_base = 48000, n, Fraction(1, 48000)
+		for packet in aout.encode(frame):
+			output.mux(packet)
+	for stream in (vout, aout):
+		for packet in stream.encode(None):
+			output.mux(packet)
+	output.close()
+
+
+def test_pyav_segment_keeps_audio_and_video_on_the_source_timeline(tmp_path):
+	av = pytest.importorskip('av')
+	source_path, segment_path = str(tmp_path / 'source.mp4'), str(tmp_path / 'segment_004.mp4')
+	_write_av_source(av, source_path, 8)
+	params = {'scale': 'scale=-2:48', 'codec': 'libx264', 'bitrate': '200k', 'audio': 'aac'}
+	backends.PyAVBackend().encode_segment(source_path, segment_path, params, 4, 7, 3)
+
+	container = av.open(segment_path)
+	first = {}
+	for packet in container.demux():
+		if packet.pts is not None and packet.stream.type not in first:
+			first[packet.stream.type] = float(packet.pts * packet.time_base)
+	container.close()
+	assert first['video'] == pytest.approx(4.0)
+	# AAC works in frames of 1024 samples
+	assert abs(first['audio'] - first['video']) <= 1024 / 48000
+
+
+@pytest.mark.django_db
+def test_failed_playlist_regeneration_is_not_served_from_cache(tmp_path, monkeypatch):
+	from video_app.models import Video
+	from video_app.api import scripts
+	monkeypatch.chdir(tmp_path)
+	video = Video.objects.create(title='t', video_file='videos/t.mp4', duration=timedelta(seconds=20))
+	monkeypatch.setattr(transcode, 'get_keyframes', lambda path: [0.0, 6.0, 12.0, 18.0])
+	monkeypatch.setattr(transcode, 'invalidate_playlists', lambda *ids: None)
+	monkeypatch.setattr(workers, 'kill_continuous_worker', lambda video_id, resolution: None)
+	write_plan(video.id, [(0.0, 20.0)], 20)
+	lock = os.path.join(transcode.generate_transcode_path(video.id, '720p'), 'segment_000.mp4lockfile.lock')
+	os.makedirs(os.path.dirname(lock))
+	open(lock, 'w').close()
+	m3u8_path = os.path.join(f"media/index/video_{video.id}/", 'index.m3u8')
+
+	# ?recreate=true right after the encoders were told to stop: they still hold the output
+	assert scripts.get_m3u8_file(m3u8_path, video.id, recreate_file=True).startswith("Failed")
+	assert cache.get(f"m3u8_{video.id}") is None
+
+	os.remove(lock)
+	assert scripts.get_m3u8_file(m3u8_path, video.id).startswith("#EXTM3U")
+
+
+def test_finished_progress_jobs_are_no_longer_listed(monkeypatch):
+	redis = _HashRedis()
+	monkeypatch.setattr(progress, 'get_redis_connection', lambda alias: redis)
+	progress.publish_progress(1, '720p', {'job_id': 'continuous', 'state': 'continue', 'ts': 100.0})
+	for state in ('continue', 'end'):
+		progress.publish_progress(1, '720p', {'segment': 'segment_040.mp4', 'state': state, 'ts': 101.0})
+	assert list(progress.get_video_progress(1)['720p']) == ['continuous']
+
+	# A run that ends without an 'end' record (crash, timeout) is removed too
+	monkeypatch.setattr(progress, 'popen_ffmpeg', lambda *args, **kwargs: SimpleNamespace(
+		args=args[0], returncode=1, wait=lambda timeout=None: progress.publish_progress(1, '720p', {'segment': 'segment_041.mp4', 'state': 'continue'}),
+	))
+	assert progress.run_ffmpeg(['ffmpeg'], 1, '720p', segment='segment_041.mp4').returncode == 1
+	assert list(progress.get_video_progress(1)['720p']) == ['continuous']